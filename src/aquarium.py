@@ -27,8 +27,20 @@ from fastapi import FastAPI
 from fastapi.logger import logger as fastapi_logger
 from fastapi.staticfiles import StaticFiles
 
-from gravel.api import auth, deploy, devices, local, nodes, orch, status, users
+from gravel.api import (
+    auth,
+    debug,
+    deploy,
+    devices,
+    events,
+    local,
+    nodes,
+    orch,
+    status,
+    users,
+)
 from gravel.cephadm.cephadm import Cephadm
+from gravel.controllers.auth import AuthContext
 from gravel.controllers.ceph.ceph import Ceph, Mgr, Mon
 from gravel.controllers.config import Config
 from gravel.controllers.deployment.mgr import (
@@ -36,10 +48,13 @@ from gravel.controllers.deployment.mgr import (
     DeploymentMgr,
     InitError,
 )
+from gravel.controllers.diagnostics.loopmon import LoopMonitor
+from gravel.controllers.diagnostics.profiler import Profiler
 from gravel.controllers.gstate import GlobalState, setup_logging
 from gravel.controllers.inventory.inventory import Inventory
 from gravel.controllers.kv import KV
 from gravel.controllers.nodes.mgr import NodeMgr
+from gravel.controllers.registry import RegistryClient
 from gravel.controllers.resources.devices import Devices
 from gravel.controllers.resources.network import Network
 from gravel.controllers.resources.status import Status
@@ -64,6 +79,8 @@ def gstate_init(gstate: GlobalState, nodemgr: NodeMgr) -> None:
 
     gstate.cephadm.set_config(gstate.config.options.containers)
 
+    gstate.add_auth(AuthContext(gstate.store, gstate.config.options.auth))
+
     # Set up Ceph connections
     ceph: Ceph = Ceph()
     ceph_mgr: Mgr = Mgr(ceph)
@@ -95,7 +112,10 @@ def gstate_init(gstate: GlobalState, nodemgr: NodeMgr) -> None:
     )
     gstate.add_storage(storage)
 
-    network: Network = Network(gstate.config.options.network.probe_interval)
+    network: Network = Network(
+        gstate.config.options.network.probe_interval,
+        gstate.config.options.network.watch_probe_interval,
+    )
     gstate.add_network(network)
 
     gstate.init()
@@ -167,6 +187,12 @@ async def aquarium_startup(_: FastAPI, aquarium_api: FastAPI):
     gstate: GlobalState = GlobalState(config, kvstore)
     nodemgr: NodeMgr = NodeMgr(gstate)
 
+    # Watch the event loop for stalls for as long as we're running.
+    loopmon: LoopMonitor = LoopMonitor()
+    loopmon.start()
+    gstate.add_loop_monitor(loopmon)
+    gstate.add_profiler(Profiler())
+
     gstate_preinit(gstate)
 
     global _main_task
@@ -187,10 +213,12 @@ async def aquarium_shutdown(_: FastAPI, aquarium_api: FastAPI):
         await _main_task
 
     await aquarium_api.state.gstate.shutdown()
+    await aquarium_api.state.gstate.loopmon.stop()
     logger.info("shutting down node manager")
     await aquarium_api.state.nodemgr.shutdown()
     logger.info("Stopping deployment task.")
     await aquarium_api.state.deployment.shutdown()
+    await RegistryClient.close_all()
 
 
 def aquarium_factory(
@@ -232,6 +260,14 @@ def aquarium_factory(
             "name": "deploy",
             "description": "Operations related to the current deployment.",
         },
+        {
+            "name": "events",
+            "description": "Streaming of state updates.",
+        },
+        {
+            "name": "debug",
+            "description": "Profiling and debugging of the running backend.",
+        },
     ]
 
     aquarium_app = FastAPI(docs_url=None)
@@ -260,6 +296,8 @@ def aquarium_factory(
     aquarium_api.include_router(auth.router)
     aquarium_api.include_router(users.router)
     aquarium_api.include_router(deploy.router)
+    aquarium_api.include_router(events.router)
+    aquarium_api.include_router(debug.router)
 
     #
     # mounts
@@ -17,7 +17,7 @@ from fastapi import HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from starlette import status as status_codes
 
-from gravel.controllers.auth import JWT, JWTDenyList, JWTMgr, UserMgr, UserModel
+from gravel.controllers.auth import JWT, AuthContext, AuthError, JWTMgr
 from gravel.controllers.deployment.mgr import DeploymentMgr
 
 
@@ -55,27 +55,13 @@ class JWTAuthSchema(OAuth2PasswordBearer):
             raise HTTPException(
                 status_code=400, detail="Token missing from request"
             )
-        # Decode token and do the following checks:
+        # Decode the token, and check whether it has been revoked, and
+        # whether its user exists and is enabled.
+        auth: AuthContext = state.gstate.auth
         try:
-            jwt_mgr = JWTMgr(state.gstate.config.options.auth)
-            raw_token: JWT = jwt_mgr.get_raw_access_token(token)
-        except Exception as e:
-            raise HTTPException(status_code=401, detail=str(e))
-        # - Is the token revoked?
-        deny_list = JWTDenyList(state.gstate.store)
-        await deny_list.load()
-        if deny_list.includes(raw_token):
-            raise HTTPException(
-                status_code=401, detail="Token has been revoked"
-            )
-        # - Does the user exist?
-        user_mgr = UserMgr(state.gstate.store)
-        user: Optional[UserModel] = await user_mgr.get(str(raw_token.sub))
-        if user is None:
-            raise HTTPException(status_code=401, detail="User does not exist")
-        # - Is user disabled?
-        if user.disabled:
-            raise HTTPException(status_code=401, detail="User is disabled")
+            raw_token: JWT = await auth.authenticate(token)
+        except AuthError as e:
+            raise HTTPException(status_code=401, detail=e.message)
         return raw_token
 
 
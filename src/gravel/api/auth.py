@@ -21,7 +21,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
 
 from gravel.api import install_gate, jwt_auth_scheme
-from gravel.controllers.auth import JWT, JWTDenyList, JWTMgr, UserMgr
+from gravel.controllers.auth import JWT, AuthContext, BusyError, JWTMgr
 
 logger: Logger = fastapi_logger
 
@@ -40,10 +40,15 @@ async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     gate: Any = Depends(install_gate),
 ) -> LoginReplyModel:
-    user_mgr = UserMgr(request.app.state.gstate.store)
-    authenticated = await user_mgr.authenticate(
-        form_data.username, form_data.password
-    )
+    auth: AuthContext = request.app.state.gstate.auth
+    try:
+        authenticated = await auth.login(form_data.username, form_data.password)
+    except BusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.message,
+            headers={"Retry-After": "1"},
+        )
     if not authenticated:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -61,7 +66,5 @@ async def logout(
     token: JWT = Depends(jwt_auth_scheme),
     gate: Any = Depends(install_gate),
 ) -> None:
-    deny_list = JWTDenyList(request.app.state.gstate.store)
-    await deny_list.load()
-    deny_list.add(token)
-    await deny_list.save()
+    auth: AuthContext = request.app.state.gstate.auth
+    await auth.revoke(token)
@@ -0,0 +1,182 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from logging import Logger
+from typing import Any, List
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.logger import logger as fastapi_logger
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRouter
+
+from gravel.api import install_gate, jwt_auth_scheme
+from gravel.controllers.diagnostics.profiler import (
+    AlreadyProfilingError,
+    CPUProfileStatusModel,
+    MemoryStatModel,
+    MemoryStatusModel,
+    NotProfilingError,
+    Profiler,
+)
+from gravel.controllers.inventory.subscriber import SubscriberStatsModel
+
+logger: Logger = fastapi_logger
+
+router: APIRouter = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def _get_profiler(request: Request) -> Profiler:
+    return request.app.state.gstate.profiler
+
+
+@router.get("/profile/cpu/status", response_model=CPUProfileStatusModel)
+async def cpu_profile_status(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> CPUProfileStatusModel:
+    """Obtain the status of the current, or last, CPU profile."""
+    return _get_profiler(request).cpu.status
+
+
+@router.post("/profile/cpu/start", response_model=CPUProfileStatusModel)
+async def cpu_profile_start(
+    request: Request,
+    duration: float = 30.0,
+    interval: float = 0.01,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> CPUProfileStatusModel:
+    """
+    Start sampling the stacks of all of the backend's threads, every
+    `interval` seconds, for at most `duration` seconds (up to 5 minutes).
+    """
+    profiler = _get_profiler(request)
+    try:
+        profiler.cpu.start(duration, interval)
+    except AlreadyProfilingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=e.message
+        )
+    return profiler.cpu.status
+
+
+@router.post("/profile/cpu/stop", response_model=CPUProfileStatusModel)
+async def cpu_profile_stop(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> CPUProfileStatusModel:
+    """Stop sampling before the profile's duration has passed."""
+    try:
+        return _get_profiler(request).cpu.stop()
+    except NotProfilingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=e.message
+        )
+
+
+@router.get("/profile/cpu", response_class=PlainTextResponse)
+async def cpu_profile_collapsed(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> str:
+    """
+    Obtain the sampled stacks, in collapsed format, ready to be consumed by
+    `flamegraph.pl` and compatible tools.
+    """
+    return _get_profiler(request).cpu.collapsed()
+
+
+@router.get("/profile/memory/status", response_model=MemoryStatusModel)
+async def memory_profile_status(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> MemoryStatusModel:
+    """Obtain current memory tracing state."""
+    return _get_profiler(request).memory.status
+
+
+@router.post("/profile/memory/snapshot", response_model=MemoryStatusModel)
+async def memory_profile_snapshot(
+    request: Request,
+    nframes: int = 25,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> MemoryStatusModel:
+    """
+    Take a reference snapshot of allocated memory, starting to trace memory
+    allocations with `nframes` frames per allocation if not yet tracing.
+    """
+    return _get_profiler(request).memory.snapshot(nframes)
+
+
+@router.get("/profile/memory/diff", response_model=List[MemoryStatModel])
+async def memory_profile_diff(
+    request: Request,
+    top: int = 25,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> List[MemoryStatModel]:
+    """Obtain the top allocations since the reference snapshot, per line."""
+    try:
+        return _get_profiler(request).memory.diff(top)
+    except NotProfilingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=e.message
+        )
+
+
+@router.get("/profile/memory", response_class=PlainTextResponse)
+async def memory_profile_collapsed(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> str:
+    """
+    Obtain bytes allocated since the reference snapshot, as collapsed
+    stacks, ready to be consumed by `flamegraph.pl` and compatible tools.
+    """
+    try:
+        return _get_profiler(request).memory.collapsed()
+    except NotProfilingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=e.message
+        )
+
+
+@router.post("/profile/memory/stop")
+async def memory_profile_stop(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> None:
+    """Stop tracing memory allocations, and drop the reference snapshot."""
+    try:
+        _get_profiler(request).memory.stop()
+    except NotProfilingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=e.message
+        )
+
+
+@router.get("/inventory/subscribers", response_model=List[SubscriberStatsModel])
+async def inventory_subscribers(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> List[SubscriberStatsModel]:
+    """Obtain delivery statistics for each inventory subscriber."""
+    return request.app.state.gstate.inventory.subscriber_stats()
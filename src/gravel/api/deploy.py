@@ -14,18 +14,23 @@
 from logging import Logger
 from typing import Any, List, Optional
 
-from fastapi import Depends, HTTPException, Request, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.logger import logger as fastapi_logger
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from gravel.api import install_gate, jwt_auth_scheme
+from gravel.api.events import event_stream
+from gravel.controllers.deployment.client import DIGEST_HEADER
 from gravel.controllers.deployment.create import ContainerConfig
 from gravel.controllers.deployment.join import (
+    IMAGE_ID_HEADER,
     AlreadyJoinedError,
     BadTokenError,
     HostnameExistsError,
     JoinError,
+    JoinNodeStatusModel,
     JoinReadyParamsModel,
     JoinReadyReplyModel,
     JoinRequestParamsModel,
@@ -136,6 +141,17 @@ async def deploy_status(request: Request) -> DeployStatusReplyModel:
     return _get_status(request.app.state.deployment)
 
 
+@router.get("/status/stream")
+async def deploy_status_stream(request: Request) -> StreamingResponse:
+    """
+    Stream this node's deployment status, as server-sent `deploy-status`
+    events, instead of polling `/deploy/status`. An event is sent upon
+    subscribing, and then whenever the status changes.
+    """
+    dep: DeploymentMgr = request.app.state.deployment
+    return event_stream(dep.events.subscribe(["deploy-status"]))
+
+
 @router.post("/install", response_model=DeployInstallReplyModel)
 async def deploy_install(
     request: Request,
@@ -350,3 +366,61 @@ async def deploy_join_ready(
         )
 
     return JoinReadyReplyModel(success=True, msg="")
+
+
+@router.get("/join/nodes", response_model=List[JoinNodeStatusModel])
+async def deploy_join_nodes(
+    request: Request,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> List[JoinNodeStatusModel]:
+    """
+    Obtain the state of each node joining the cluster through this node,
+    from requesting to join to being added to the cluster.
+    """
+    dep: DeploymentMgr = request.app.state.deployment
+    try:
+        return dep.get_join_status()
+    except NotReadyYetError as e:
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED, detail=e.message
+        )
+
+
+@router.get("/image")
+async def deploy_image(
+    request: Request,
+    gate: Any = Depends(install_gate),
+    x_cluster_token: str = Header(...),
+) -> FileResponse:
+    """
+    Obtain the cluster's container image, as an archive.
+
+    This endpoint should be called by a node joining the cluster through us,
+    so it doesn't have to pull the image from the registry. The archive's
+    digest and image ID are provided in the response headers, and must be
+    checked.
+    """
+    dep: DeploymentMgr = request.app.state.deployment
+    try:
+        archive = await dep.get_join_image(x_cluster_token.strip())
+    except NotReadyYetError as e:
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED, detail=e.message
+        )
+    except BadTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Bad token."
+        )
+    except JoinError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=e.message
+        )
+    return FileResponse(
+        archive.path,
+        media_type="application/x-tar",
+        headers={
+            DIGEST_HEADER: archive.digest,
+            IMAGE_ID_HEADER: archive.image_id,
+        },
+    )
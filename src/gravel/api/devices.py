@@ -12,14 +12,15 @@
 # GNU General Public License for more details.
 
 from logging import Logger
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from fastapi import Depends, Request
 from fastapi.logger import logger as fastapi_logger
 from fastapi.routing import APIRouter
 
 from gravel.api import install_gate, jwt_auth_scheme
-from gravel.controllers.resources.devices import DeviceHostModel
+from gravel.controllers.resources.devices import DeviceHostModel, Devices
+from gravel.controllers.snapshots import SnapshotModel
 
 logger: Logger = fastapi_logger
 
@@ -37,3 +38,24 @@ def get_per_host_devices(
     gate: Any = Depends(install_gate),
 ) -> Dict[str, DeviceHostModel]:
     return request.app.state.gstate.devices.devices_per_host
+
+
+@router.get(
+    "/snapshot",
+    name="Obtain changes to devices being used for storage since a version",
+    response_model=SnapshotModel,
+)
+def get_per_host_devices_snapshot(
+    request: Request,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> SnapshotModel:
+    """
+    Obtain devices per host as a versioned snapshot. If `since` and `epoch`
+    are the version the client holds, only a JSON-patch of what changed since
+    is returned; otherwise, or if `since` is too old, all devices are.
+    """
+    devices: Devices = request.app.state.gstate.devices
+    return devices.snapshot("devices", since, epoch)
@@ -0,0 +1,90 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from logging import Logger
+from typing import Any, AsyncGenerator, List, Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.logger import logger as fastapi_logger
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRouter
+
+from gravel.api import install_gate, jwt_auth_scheme
+from gravel.controllers.events import EventBus, Subscription
+
+logger: Logger = fastapi_logger
+
+router: APIRouter = APIRouter(prefix="/events", tags=["events"])
+
+
+TOPICS = ["status", "client-io-rates", "devices", "storage"]
+KEEPALIVE_INTERVAL = 15.0
+
+
+async def _stream(sub: Subscription) -> AsyncGenerator[str, None]:
+    # the response stops iterating once the client disconnects.
+    try:
+        while True:
+            updates = await sub.get(timeout=KEEPALIVE_INTERVAL)
+            if not updates:
+                # keep proxies from closing an idle connection.
+                yield ": keepalive\n\n"
+                continue
+            for topic, payload in updates:
+                yield f"event: {topic}\ndata: {payload}\n\n"
+    finally:
+        sub.close()
+
+
+def event_stream(sub: Subscription) -> StreamingResponse:
+    """Stream a subscription's updates to the client as server-sent events."""
+    return StreamingResponse(
+        _stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    topics: Optional[str] = None,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> StreamingResponse:
+    """
+    Subscribe to state updates, as server-sent events. `topics` is a comma
+    separated list of topics, defaulting to all of them:
+
+    * `status`: the cluster's status, as in `/status/`.
+    * `client-io-rates`: as in `/status/client-io-rates`.
+    * `devices`: as in `/devices/`.
+    * `storage`: the cluster's storage usage.
+
+    Each event is named after its topic, and carries a versioned snapshot of
+    the topic's latest state as JSON, as in `/status/snapshot`. The full state
+    is sent upon subscribing, and then only what changed, as a patch to the
+    previous version, when it changes. Should updates be missed, because the
+    client was too slow to receive them, the full state is sent again.
+    """
+    wanted: List[str] = TOPICS
+    if topics is not None:
+        wanted = [t.strip() for t in topics.split(",") if t.strip()]
+        unknown = [t for t in wanted if t not in TOPICS]
+        if unknown or not wanted:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown topics: {', '.join(unknown)}",
+            )
+    events: EventBus = request.app.state.gstate.events
+    return event_stream(events.subscribe(wanted))
@@ -21,12 +21,10 @@ from pydantic import BaseModel, Field
 
 from gravel.api import install_gate, jwt_auth_scheme
 from gravel.cephadm.models import VolumeDeviceModel
+from gravel.controllers.deployment.mgr import DeploymentMgr
 from gravel.controllers.inventory.nodeinfo import NodeInfoModel
 from gravel.controllers.nodes.mgr import NodeMgr
-from gravel.controllers.nodes.requirements import (
-    RequirementsModel,
-    localhost_qualified,
-)
+from gravel.controllers.nodes.requirements import RequirementsModel
 from gravel.controllers.resources.network import NetworkConfigModel
 from gravel.controllers.utils import aqr_run_cmd
 
@@ -149,9 +147,10 @@ async def get_status(
     """
 
     nodemgr: NodeMgr = request.app.state.nodemgr
+    deployment: DeploymentMgr = request.app.state.deployment
 
     return NodeStatusReplyModel(
-        localhost_qualified=await localhost_qualified(),
+        localhost_qualified=await deployment.get_requirements(),
         inited=nodemgr.available,
     )
 
@@ -237,11 +236,14 @@ async def apply_network_config(
     req_params: NetworkConfigModel,
     _=Depends(jwt_auth_scheme),
 ) -> bool:
+    """
+    Apply network configuration, reloading only the interfaces whose
+    configuration changed. Returns whether those interfaces ended up with
+    their configured addresses.
+    """
 
     network = request.app.state.gstate.network
-    await network.apply_config(
+    result = await network.apply_config(
         req_params.interfaces, req_params.nameservers, req_params.routes
     )
-
-    # TODO: Make this return something sensible on failure
-    return True
+    return result.verified
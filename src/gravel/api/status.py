@@ -22,12 +22,14 @@ from pydantic import BaseModel, Field
 
 from gravel.api import install_gate, jwt_auth_scheme
 from gravel.controllers.ceph.models import CephStatusModel
+from gravel.controllers.diagnostics.loopmon import LoopMonitor, LoopStatsModel
 from gravel.controllers.resources.status import (
     CephStatusNotAvailableError,
     ClientIORateNotAvailableError,
     OverallClientIORateModel,
     Status,
 )
+from gravel.controllers.snapshots import SnapshotModel
 
 logger: Logger = fastapi_logger
 
@@ -58,6 +60,28 @@ async def get_status(
     return status
 
 
+@router.get(
+    "/snapshot",
+    name="Obtain changes to the cluster status since a given version",
+    response_model=SnapshotModel,
+)
+async def get_status_snapshot(
+    request: Request,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> SnapshotModel:
+    """
+    Obtain the cluster status as a versioned snapshot. If `since` and
+    `epoch` are the version the client holds, only a JSON-patch of what
+    changed since is returned; otherwise, or if `since` is too old, the full
+    status is.
+    """
+    status_ctrl: Status = request.app.state.gstate.status
+    return status_ctrl.snapshot("status", since, epoch)
+
+
 @router.get("/logs")
 async def get_logs(
     jwt: Any = Depends(jwt_auth_scheme),
@@ -99,3 +123,45 @@ async def get_client_io_rates(
             status_code=status.HTTP_412_PRECONDITION_FAILED,
             detail="Client IO rates not available at the moment.",
         )
+
+
+@router.get(
+    "/client-io-rates/snapshot",
+    name="Obtain changes to Client I/O rates since a given version",
+    response_model=SnapshotModel,
+)
+async def get_client_io_rates_snapshot(
+    request: Request,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> SnapshotModel:
+    """
+    Obtain the cluster's IO rates as a versioned snapshot, as a JSON-patch
+    since version `since` of epoch `epoch`, or in full.
+    """
+    status_ctrl: Status = request.app.state.gstate.status
+    return status_ctrl.snapshot("client-io-rates", since, epoch)
+
+
+@router.get(
+    "/loop",
+    name="Obtain event loop lag statistics and stall sources",
+    response_model=LoopStatsModel,
+)
+async def get_loop_stats(
+    request: Request,
+    top: int = 10,
+    jwt: Any = Depends(jwt_auth_scheme),
+    gate: Any = Depends(install_gate),
+) -> LoopStatsModel:
+    """
+    Obtain statistics on how late the backend's event loop has been in
+    running its tasks, and the most sampled stacks while it was stalled.
+
+    A stall means something blocked the event loop, and every other request
+    was waiting on it.
+    """
+    loopmon: LoopMonitor = request.app.state.gstate.loopmon
+    return loopmon.stats(top)
@@ -12,28 +12,69 @@
 # GNU General Public License for more details.
 
 from logging import Logger
-from typing import Any, List
+from typing import Any, List, Optional
 
-from fastapi import Depends, HTTPException, Request, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.logger import logger as fastapi_logger
 from fastapi.routing import APIRouter
 
 from gravel.api import install_gate, jwt_auth_scheme
-from gravel.controllers.auth import JWT, UserMgr, UserModel
+from gravel.controllers.auth import (
+    JWT,
+    AuthContext,
+    BusyError,
+    UserDirectory,
+    UserModel,
+)
 
 logger: Logger = fastapi_logger
 
 router: APIRouter = APIRouter(prefix="/users", tags=["users"])
 
 
+async def _get_users(request: Request) -> UserDirectory:
+    auth: AuthContext = request.app.state.gstate.auth
+    return await auth.get_users()
+
+
+async def _hash_password(request: Request, password: str) -> str:
+    auth: AuthContext = request.app.state.gstate.auth
+    try:
+        return await auth.hasher.hash(password)
+    except BusyError as e:
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.message,
+            headers={"Retry-After": "1"},
+        )
+
+
 @router.get("/", name="Get list of users", response_model=List[UserModel])
 async def enumerate_users(
     request: Request,
+    response: Response,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    disabled: Optional[bool] = None,
+    q: Optional[str] = None,
     jwt: Any = Depends(jwt_auth_scheme),
     gate: Any = Depends(install_gate),
 ) -> List[UserModel]:
-    user_mgr = UserMgr(request.app.state.gstate.store)
-    return await user_mgr.enumerate()
+    """
+    Obtain users, ordered by name. Users may be filtered on whether they are
+    `disabled`, and on whether their name or full name contains `q`. Up to
+    `limit` users are returned, starting at `offset`; the total number of
+    matching users is returned in the `X-Total-Count` header.
+    """
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail="Offset and limit must not be negative.",
+        )
+    users = await _get_users(request)
+    total, page = users.list(offset, limit, disabled, q)
+    response.headers["X-Total-Count"] = str(total)
+    return page
 
 
 @router.post("/create", name="Create a new user")
@@ -43,13 +84,13 @@ async def create_user(
     jwt: Any = Depends(jwt_auth_scheme),
     gate: Any = Depends(install_gate),
 ) -> None:
-    user_mgr = UserMgr(request.app.state.gstate.store)
-    if await user_mgr.exists(user.username):
+    users = await _get_users(request)
+    if users.exists(user.username):
         raise HTTPException(
             status.HTTP_500_INTERNAL_SERVER_ERROR, detail="User already exists."
         )
-    user.hash_password()
-    await user_mgr.put(user)
+    user.password = await _hash_password(request, user.password)
+    await users.put(user)
 
 
 @router.get("/{username}", name="Get a user by name", response_model=UserModel)
@@ -59,12 +100,13 @@ async def get_user(
     jwt: Any = Depends(jwt_auth_scheme),
     gate: Any = Depends(install_gate),
 ) -> UserModel:
-    user_mgr = UserMgr(request.app.state.gstate.store)
-    if not await user_mgr.exists(username):
+    users = await _get_users(request)
+    user = users.get(username)
+    if user is None:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND, detail="User does not exist."
         )
-    return await user_mgr.get(username)  # type: ignore[return-value]
+    return user
 
 
 @router.delete("/{username}", name="Delete a user by name")
@@ -74,8 +116,8 @@ async def delete_user(
     token: JWT = Depends(jwt_auth_scheme),
     gate: Any = Depends(install_gate),
 ) -> None:
-    user_mgr = UserMgr(request.app.state.gstate.store)
-    if not await user_mgr.exists(username):
+    users = await _get_users(request)
+    if not users.exists(username):
         raise HTTPException(
             status.HTTP_404_NOT_FOUND, detail="User does not exist."
         )
@@ -83,7 +125,7 @@ async def delete_user(
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST, detail="Cannot delete current user."
         )
-    await user_mgr.remove(username)
+    await users.remove(username)
 
 
 @router.patch(
@@ -96,8 +138,8 @@ async def patch_user(
     token: JWT = Depends(jwt_auth_scheme),
     gate: Any = Depends(install_gate),
 ) -> UserModel:
-    user_mgr = UserMgr(request.app.state.gstate.store)
-    user = await user_mgr.get(username)
+    users = await _get_users(request)
+    user = users.get(username)
     if user is None:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND, detail="User does not exist."
@@ -107,10 +149,12 @@ async def patch_user(
             status.HTTP_400_BAD_REQUEST, detail="Cannot disable current user."
         )
     if update_user.password:
-        update_user.hash_password()
+        update_user.password = await _hash_password(
+            request, update_user.password
+        )
     update_data = update_user.dict(exclude_unset=True, exclude_none=True)
     if not update_data["password"]:
         update_data.pop("password")
     user = user.copy(update=update_data)
-    await user_mgr.put(user)
+    await users.put(user)
     return user
@@ -14,30 +14,230 @@
 import asyncio
 import json
 import os
+import shutil
+import struct
+import sys
 import tempfile
 import time
 from io import StringIO
 from logging import Logger
-from typing import IO, Callable, List, Optional, Tuple
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple
 
 import pydantic
 from fastapi.logger import logger as fastapi_logger
 from pydantic.tools import parse_obj_as
 
 from gravel.controllers.config import ContainersOptionsModel
+from gravel.controllers.containers import image_is_current
 
 from .models import HostFactsModel, VolumeDeviceModel
 
 logger: Logger = fastapi_logger
 
 
+WORKER_PATH = os.path.join(os.path.dirname(__file__), "worker.py")
+# how many calls the worker runs at once.
+WORKER_MAX_CONCURRENT = 4
+# give up on the worker if it dies this often within the window.
+WORKER_MAX_RESTARTS = 3
+WORKER_RESTART_WINDOW = 300.0
+
+_HEADER = struct.Struct(">I")
+
+
 class CephadmError(Exception):
     pass
 
 
+class CephadmWorkerError(CephadmError):
+    pass
+
+
+class CephadmWorkerUnavailableError(CephadmWorkerError):
+    pass
+
+
+class _WorkerRequest:
+    """A call in flight, collecting its output."""
+
+    outcb: Optional[Callable[[str], None]]
+    output: Dict[int, StringIO]
+    partial: Dict[int, str]
+    # the worker forked a child for this call.
+    started: bool
+    done: "asyncio.Future[int]"
+
+    def __init__(self, outcb: Optional[Callable[[str], None]]) -> None:
+        self.outcb = outcb
+        self.output = {1: StringIO(), 2: StringIO()}
+        self.partial = {1: "", 2: ""}
+        self.started = False
+        self.done = asyncio.get_event_loop().create_future()
+
+    def feed(self, fd: int, data: str) -> None:
+        self.output[fd].write(data)
+        if self.outcb is None:
+            return
+        # callers expect output one line at a time.
+        lines = (self.partial[fd] + data).split("\n")
+        self.partial[fd] = lines.pop()
+        for line in lines:
+            self.outcb(line + "\n")
+
+    def finish(self) -> Tuple[str, str]:
+        if self.outcb is not None:
+            for fd in (1, 2):
+                if self.partial[fd]:
+                    self.outcb(self.partial[fd])
+        return self.output[1].getvalue(), self.output[2].getvalue()
+
+
+class CephadmWorker:
+    """
+    Runs cephadm commands through a long-lived privileged worker (see
+    `worker.py`), rather than spawning `sudo cephadm` for every call. The
+    worker is started on first use, and restarted should it die, unless it
+    keeps dying.
+    """
+
+    _cmd: List[str]
+    _proc: Optional[asyncio.subprocess.Process]
+    _reader: Optional[asyncio.Task]
+    _requests: Dict[int, _WorkerRequest]
+    _next_id: int
+    _sem: Optional[asyncio.Semaphore]
+    _lock: Optional[asyncio.Lock]
+    _deaths: List[float]
+
+    def __init__(self, cephadm: List[str]) -> None:
+        path = cephadm[-1]
+        path = shutil.which(path) or os.path.abspath(path)
+        self._cmd = cephadm[:-1] + [sys.executable, WORKER_PATH, path]
+        self._proc = None
+        self._reader = None
+        self._requests = {}
+        self._next_id = 0
+        self._sem = None
+        self._lock = None
+        self._deaths = []
+
+    @property
+    def available(self) -> bool:
+        now = time.monotonic()
+        self._deaths = [
+            t for t in self._deaths if now - t < WORKER_RESTART_WINDOW
+        ]
+        return len(self._deaths) < WORKER_MAX_RESTARTS
+
+    async def _ensure_started(self) -> asyncio.subprocess.Process:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._proc is not None and self._proc.returncode is None:
+                return self._proc
+            if not self.available:
+                raise CephadmWorkerUnavailableError("worker keeps dying")
+            logger.debug(f"starting cephadm worker: {self._cmd}")
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *self._cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                )
+            except Exception as e:
+                self._deaths.append(time.monotonic())
+                raise CephadmWorkerUnavailableError(str(e))
+            self._proc = proc
+            self._reader = asyncio.create_task(self._read_main(proc))
+            return proc
+
+    async def _read_main(self, proc: asyncio.subprocess.Process) -> None:
+        assert proc.stdout is not None
+        try:
+            while True:
+                header = await proc.stdout.readexactly(_HEADER.size)
+                (length,) = _HEADER.unpack(header)
+                msg: Dict[str, Any] = json.loads(
+                    await proc.stdout.readexactly(length)
+                )
+                req = self._requests.get(msg["id"])
+                if req is None:
+                    continue
+                if "rc" in msg:
+                    del self._requests[msg["id"]]
+                    req.done.set_result(int(msg["rc"]))
+                elif "pid" in msg:
+                    req.started = True
+                else:
+                    req.feed(int(msg["fd"]), msg["data"])
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            logger.error(f"cephadm worker: protocol error: {str(e)}")
+            proc.kill()
+
+        rc = await proc.wait()
+        if self._requests:
+            logger.error(f"cephadm worker died, rc = {rc}")
+            self._deaths.append(time.monotonic())
+        requests = self._requests
+        self._requests = {}
+        for req in requests.values():
+            if req.done.done():
+                continue
+            # never forked, so it can be run elsewhere; a forked child may
+            # have done part of the work, and is gone with the worker.
+            if not req.started:
+                req.done.set_exception(
+                    CephadmWorkerUnavailableError(
+                        f"cephadm worker died before replying, rc = {rc}"
+                    )
+                )
+            else:
+                req.done.set_exception(
+                    CephadmWorkerError(f"cephadm worker died, rc = {rc}")
+                )
+
+    async def call(
+        self, args: List[str], outcb: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, str, int]:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(WORKER_MAX_CONCURRENT)
+        async with self._sem:
+            proc = await self._ensure_started()
+            assert proc.stdin is not None
+            reqid = self._next_id
+            self._next_id += 1
+            req = _WorkerRequest(outcb)
+            self._requests[reqid] = req
+            data = json.dumps({"id": reqid, "args": args}).encode("utf-8")
+            try:
+                proc.stdin.write(_HEADER.pack(len(data)) + data)
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                # the worker is gone before getting the request; the reader
+                # fails it, unstarted, once the worker has been reaped.
+                logger.debug(f"cephadm worker: write failed: {str(e)}")
+            rc = await req.done
+            stdout, stderr = req.finish()
+            return stdout, stderr, rc
+
+    async def shutdown(self) -> None:
+        """Let the worker finish what it's doing, and exit."""
+        proc = self._proc
+        if proc is None or proc.returncode is not None:
+            return
+        assert proc.stdin is not None
+        proc.stdin.close()
+        if self._reader is not None:
+            await self._reader
+        self._proc = None
+
+
 class Cephadm:
 
     _config: ContainersOptionsModel
+    _worker: Optional[CephadmWorker]
     cephadm: List[str]
 
     def __init__(self) -> None:
@@ -48,10 +248,15 @@ class Cephadm:
         else:
             # deployment environment
             self.cephadm = ["sudo", "cephadm"]
+        self._worker = CephadmWorker(self.cephadm)
 
     def set_config(self, config: ContainersOptionsModel) -> None:
         self._config = config
 
+    async def shutdown(self) -> None:
+        if self._worker is not None:
+            await self._worker.shutdown()
+
     async def call(
         self,
         cmd: List[str],
@@ -60,11 +265,19 @@ class Cephadm:
     ) -> Tuple[str, str, int]:
 
         assert len(cmd) > 0
-        cmdlst: List[str] = list(self.cephadm)
+        args: List[str] = []
         if not noimage:
             image = self._config.get_image()
-            cmdlst.extend(["--image", image])
-        cmdlst.extend(cmd)
+            args.extend(["--image", image])
+        args.extend(cmd)
+
+        if self._worker is not None and self._worker.available:
+            try:
+                return await self._worker.call(args, outcb)
+            except CephadmWorkerUnavailableError as e:
+                logger.info(f"cephadm worker unavailable: {str(e)}")
+
+        cmdlst: List[str] = list(self.cephadm) + args
         logger.debug(f"call with {self.cephadm}")
         logger.debug(f"call: {cmdlst}")
 
@@ -104,7 +317,10 @@ class Cephadm:
     #
 
     async def bootstrap(
-        self, addr: str, percentcb: Optional[Callable[[int], None]] = None
+        self,
+        addr: str,
+        percentcb: Optional[Callable[[int], None]] = None,
+        stepcb: Optional[Callable[[str], None]] = None,
     ) -> Tuple[str, str, int]:
 
         if not addr:
@@ -126,12 +342,13 @@ class Cephadm:
         ]
 
         def outcb_handler(msg: str) -> None:
-            if not percentcb:
-                return
             t = msg.lower()
             for m, p in msg_to_percent:
                 if m in t:
-                    percentcb(p)
+                    if stepcb:
+                        stepcb(m)
+                    if percentcb:
+                        percentcb(p)
 
         def get_default_ceph_conf() -> str:
             s = ("[global]", "osd_pool_default_size = 2", "")
@@ -193,6 +410,10 @@ class Cephadm:
         return inventory
 
     async def pull_images(self) -> None:
+        cfg = self._config
+        if await image_is_current(cfg.registry, cfg.image, cfg.secure):
+            logger.debug("ceph container image already present")
+            return
         logger.debug("fetching ceph container image")
         time_begin: int = int(time.monotonic())
         _, stderr, rc = await self.call(["pull"])
@@ -0,0 +1,231 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Long-lived cephadm worker. Meant to be run privileged, as
+
+    sudo python3 worker.py /path/to/cephadm
+
+It imports cephadm once, then serves requests read from stdin, replying on
+stdout. Each request is run in a child forked from this process, so it gets
+a pristine, already initialized cephadm without paying for a new interpreter,
+nor for sudo, on every call.
+
+Messages are framed as a 4 byte big-endian length followed by a JSON object.
+Requests are `{"id": <int>, "args": [...]}`. For each request we first reply
+with `{"id": <int>, "pid": <int>}` once its child has been forked, then with
+any number of `{"id": <int>, "fd": 1|2, "data": <str>}` as output is
+produced, followed by `{"id": <int>, "rc": <int>}` once done. A child only
+starts running after its request has been acknowledged, and is killed should
+the worker die, so a request either was not run at all, or it was run by a
+child the caller knows about.
+
+This must not depend on anything but the standard library.
+"""
+
+import codecs
+import ctypes
+import importlib.machinery
+import json
+import os
+import selectors
+import signal
+import struct
+import sys
+import traceback
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE = 16 * 1024 * 1024
+READ_SIZE = 64 * 1024
+# from linux/prctl.h
+PR_SET_PDEATHSIG = 1
+
+
+def load_cephadm(path: str) -> types.ModuleType:
+    loader = importlib.machinery.SourceFileLoader("cephadm", path)
+    module = types.ModuleType(loader.name)
+    module.__file__ = path
+    sys.modules[loader.name] = module
+    loader.exec_module(module)
+    return module
+
+
+def set_pdeathsig(sig: int) -> None:
+    """Have the kernel send us `sig` once our parent dies. Linux only."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.prctl(PR_SET_PDEATHSIG, sig, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+
+def run_child(cephadm: types.ModuleType, args: List[str]) -> int:
+    """Run cephadm's main in a forked child; stdio already redirected."""
+    sys.argv = [cephadm.__file__ or "cephadm"] + args
+    rc = 0
+    try:
+        cephadm.main()  # type: ignore
+    except SystemExit as e:
+        if e.code is None:
+            rc = 0
+        elif isinstance(e.code, int):
+            rc = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            rc = 1
+    except BaseException:
+        traceback.print_exc()
+        rc = 1
+    return rc
+
+
+class Worker:
+    _cephadm: types.ModuleType
+    _out: int
+    _sel: selectors.DefaultSelector
+    _inbuf: bytes
+    # child pid -> (request id, open pipes)
+    _children: Dict[int, Tuple[int, List[int]]]
+    # output may split multi-byte characters, decode incrementally.
+    _decoders: Dict[int, codecs.IncrementalDecoder]
+    _done: bool
+
+    def __init__(self, cephadm: types.ModuleType) -> None:
+        self._cephadm = cephadm
+        # keep the protocol channel to ourselves; anything else writing to
+        # stdout would corrupt it.
+        self._out = os.dup(1)
+        os.dup2(2, 1)
+        self._sel = selectors.DefaultSelector()
+        self._inbuf = b""
+        self._children = {}
+        self._decoders = {}
+        self._done = False
+
+    def _send(self, msg: Dict[str, Any]) -> None:
+        data = json.dumps(msg).encode("utf-8")
+        buf = HEADER.pack(len(data)) + data
+        while buf:
+            n = os.write(self._out, buf)
+            buf = buf[n:]
+
+    def _spawn(self, reqid: int, args: List[str]) -> None:
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        # the child waits on this until its request has been acknowledged.
+        go_r, go_w = os.pipe()
+        ppid = os.getpid()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                set_pdeathsig(signal.SIGKILL)
+                os.close(go_w)
+                # the worker may have died before we asked to die with it.
+                if os.read(go_r, 1) == b"" or os.getppid() != ppid:
+                    os._exit(1)
+                devnull = os.open(os.devnull, os.O_RDONLY)
+                os.dup2(devnull, 0)
+                os.dup2(out_w, 1)
+                os.dup2(err_w, 2)
+                fds = (devnull, out_r, out_w, err_r, err_w, go_r, self._out)
+                for fd in fds:
+                    os.close(fd)
+                rc = run_child(self._cephadm, args)
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except BaseException:
+                rc = 1
+            os._exit(rc)
+
+        os.close(out_w)
+        os.close(err_w)
+        os.close(go_r)
+        try:
+            self._send({"id": reqid, "pid": pid})
+            os.write(go_w, b"x")
+        finally:
+            os.close(go_w)
+        self._children[pid] = (reqid, [out_r, err_r])
+        for fd in (out_r, err_r):
+            self._decoders[fd] = codecs.getincrementaldecoder("utf-8")(
+                errors="replace"
+            )
+        self._sel.register(out_r, selectors.EVENT_READ, (pid, 1))
+        self._sel.register(err_r, selectors.EVENT_READ, (pid, 2))
+
+    def _handle_input(self) -> None:
+        data = os.read(0, READ_SIZE)
+        if not data:
+            self._sel.unregister(0)
+            self._done = True
+            return
+        self._inbuf += data
+        while len(self._inbuf) >= HEADER.size:
+            (length,) = HEADER.unpack_from(self._inbuf)
+            if length > MAX_MESSAGE:
+                raise ValueError(f"message too large: {length}")
+            if len(self._inbuf) < HEADER.size + length:
+                break
+            payload = self._inbuf[HEADER.size : HEADER.size + length]
+            self._inbuf = self._inbuf[HEADER.size + length :]
+            req = json.loads(payload)
+            self._spawn(int(req["id"]), [str(a) for a in req["args"]])
+
+    def _handle_output(self, fd: int, pid: int, stream: int) -> None:
+        reqid, pipes = self._children[pid]
+        data = os.read(fd, READ_SIZE)
+        text = self._decoders[fd].decode(data, final=not data)
+        if text:
+            self._send({"id": reqid, "fd": stream, "data": text})
+        if data:
+            return
+
+        self._sel.unregister(fd)
+        os.close(fd)
+        del self._decoders[fd]
+        pipes.remove(fd)
+        if pipes:
+            return
+        # all output collected, reap the child.
+        _, status = os.waitpid(pid, 0)
+        del self._children[pid]
+        if os.WIFEXITED(status):
+            rc = os.WEXITSTATUS(status)
+        else:
+            rc = 128 + os.WTERMSIG(status)
+        self._send({"id": reqid, "rc": rc})
+
+    def run(self) -> None:
+        self._sel.register(0, selectors.EVENT_READ, None)
+        while not self._done or self._children:
+            for key, _ in self._sel.select():
+                if key.data is None:
+                    self._handle_input()
+                else:
+                    pid, stream = key.data
+                    self._handle_output(key.fd, pid, stream)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 1:
+        print("usage: worker.py <path to cephadm>", file=sys.stderr)
+        return 1
+    Worker(load_cephadm(argv[0])).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
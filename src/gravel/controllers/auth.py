@@ -11,10 +11,24 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
+import asyncio
+import bisect
 import json
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, List, NamedTuple, Optional, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import bcrypt
 import jwt
@@ -23,8 +37,62 @@ from fastapi.security.utils import get_authorization_scheme_param
 from pydantic import BaseModel, Field
 
 from gravel.controllers.config import AuthOptionsModel
+from gravel.controllers.errors import GravelError
+from gravel.controllers.gstate import Ticker
 from gravel.controllers.kv import KV
 
+USER_PREFIX = "/auth/user/"
+JWT_DENY_PREFIX = "/auth/jwt_deny/"
+# where all revoked tokens used to be kept, as a single JSON object.
+JWT_DENY_LIST_KEY = "/auth/jwt_deny_list"
+# how often we remove expired tokens from the deny list, in seconds.
+JWT_DENY_EXPIRE_INTERVAL = 60.0
+# the node holding this lease is the one removing expired tokens.
+JWT_DENY_EXPIRE_LEASE_KEY = "/auth/jwt_deny_expire_lease"
+# how long the lease is held for, in seconds, unless renewed.
+JWT_DENY_EXPIRE_LEASE_TTL = 3 * JWT_DENY_EXPIRE_INTERVAL
+# how many decoded tokens we keep around.
+MAX_CACHED_TOKENS = 4096
+
+
+def _in_loop(
+    callback: Callable[[str, Optional[str]], None]
+) -> Callable[[str, Optional[str]], None]:
+    """
+    Wrap a store watch `callback` so it runs in the current event loop, as the
+    store may call it from one of its own threads.
+    """
+    loop = asyncio.get_event_loop()
+
+    def _dispatch(key: str, value: Optional[str]) -> None:
+        loop.call_soon_threadsafe(callback, key, value)
+
+    return _dispatch
+
+
+class AuthError(GravelError):
+    pass
+
+
+class InvalidTokenError(AuthError):
+    pass
+
+
+class RevokedTokenError(AuthError):
+    pass
+
+
+class UnknownUserError(AuthError):
+    pass
+
+
+class DisabledUserError(AuthError):
+    pass
+
+
+class BusyError(AuthError):
+    pass
+
 
 class UserModel(BaseModel):
     username: str = Field("", title="The user name")
@@ -32,8 +100,8 @@ class UserModel(BaseModel):
     full_name: str = Field("", title="The full name of the user")
     disabled: bool = Field(False, title="Is the user disabled?")
 
-    def hash_password(self) -> None:
-        salt = bcrypt.gensalt()
+    def hash_password(self, rounds: int = 12) -> None:
+        salt = bcrypt.gensalt(rounds)
         self.password = bcrypt.hashpw(
             self.password.encode("utf8"), salt
         ).decode("utf8")
@@ -50,7 +118,7 @@ class UserMgr:
         self._store: KV = store
 
     async def enumerate(self) -> List[UserModel]:
-        values = await self._store.get_prefix("/auth/user/")
+        values = await self._store.get_prefix(USER_PREFIX)
         return [UserModel.parse_raw(value) for value in values]
 
     async def exists(self, username: str) -> bool:
@@ -58,17 +126,17 @@ class UserMgr:
         return user is not None
 
     async def get(self, username: str) -> Optional[UserModel]:
-        value: Optional[str] = await self._store.get(f"/auth/user/{username}")
+        value: Optional[str] = await self._store.get(f"{USER_PREFIX}{username}")
         if value is None:
             return None
         user = UserModel.parse_raw(value)
         return user
 
     async def put(self, user: UserModel) -> None:
-        await self._store.put(f"/auth/user/{user.username}", user.json())
+        await self._store.put(f"{USER_PREFIX}{user.username}", user.json())
 
     async def remove(self, username: str) -> None:
-        await self._store.rm(f"/auth/user/{username}")
+        await self._store.rm(f"{USER_PREFIX}{username}")
 
     async def authenticate(self, username: str, password: str) -> bool:
         user: Optional[UserModel] = await self.get(username)
@@ -79,6 +147,104 @@ class UserMgr:
         return user.verify_password(password)
 
 
+class UserDirectory:
+    """
+    All users, kept in memory and up to date by watching the store, so we
+    don't have to scan the store whenever we need a user, or all of them.
+    Users are indexed by name, in order, and by whether they are disabled.
+    """
+
+    _store: KV
+    _users: Dict[str, UserModel]
+    _names: List[str]
+    _disabled: Set[str]
+
+    def __init__(self, store: KV):
+        self._store = store
+        self._users = {}
+        self._names = []
+        self._disabled = set()
+
+    async def load(self) -> None:
+        """Load all users, and watch the store for changes to them."""
+        # watch first, so we don't miss updates while loading.
+        await self._store.watch_prefix(USER_PREFIX, _in_loop(self._on_user))
+        for user in await UserMgr(self._store).enumerate():
+            self._set(user)
+
+    def _set(self, user: UserModel) -> None:
+        if user.username not in self._users:
+            bisect.insort(self._names, user.username)
+        self._users[user.username] = user
+        if user.disabled:
+            self._disabled.add(user.username)
+        else:
+            self._disabled.discard(user.username)
+
+    def _remove(self, username: str) -> None:
+        if self._users.pop(username, None) is None:
+            return
+        idx = bisect.bisect_left(self._names, username)
+        if idx < len(self._names) and self._names[idx] == username:
+            del self._names[idx]
+        self._disabled.discard(username)
+
+    def _on_user(self, key: str, value: Optional[str]) -> None:
+        username = key[len(USER_PREFIX) :]
+        if value is None:
+            self._remove(username)
+        else:
+            self._set(UserModel.parse_raw(value))
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, username: str) -> Optional[UserModel]:
+        return self._users.get(username)
+
+    def exists(self, username: str) -> bool:
+        return username in self._users
+
+    def list(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        disabled: Optional[bool] = None,
+        query: Optional[str] = None,
+    ) -> Tuple[int, List[UserModel]]:
+        """
+        Obtain users ordered by name, optionally only those `disabled` or not,
+        and those whose name or full name contain `query`. Returns the total
+        number of matching users, and those in the requested page.
+        """
+        names: List[str]
+        if disabled is None:
+            names = list(self._names)
+        elif disabled:
+            names = sorted(self._disabled)
+        else:
+            names = [n for n in self._names if n not in self._disabled]
+
+        users = [self._users[n] for n in names if n in self._users]
+        if query:
+            query = query.lower()
+            users = [
+                u
+                for u in users
+                if query in u.username.lower() or query in u.full_name.lower()
+            ]
+        end = None if limit is None else offset + limit
+        return len(users), users[offset:end]
+
+    async def put(self, user: UserModel) -> None:
+        await UserMgr(self._store).put(user)
+        self._set(user)
+
+    async def remove(self, username: str) -> None:
+        await UserMgr(self._store).remove(username)
+        self._remove(username)
+
+
 class JWT(NamedTuple):
     iss: str  # Issuer
     sub: Union[str, int]  # Subject
@@ -143,35 +309,290 @@ class JWTMgr:
         return None
 
 
+class JWTDenyEntryModel(BaseModel):
+    jti: str = Field(title="The revoked token's ID")
+    exp: int = Field(title="When the revoked token expires")
+
+
+class JWTDenyExpireLeaseModel(BaseModel):
+    owner: str = Field(title="Who removes expired tokens")
+    until: float = Field(title="When the lease runs out, unless renewed")
+
+
 class JWTDenyList:
     """
     This list contains JWT tokens that are not allowed to use anymore.
-    E.g. a token is added when a user logs out of the UI. The list will
-    automatically remove expired tokens.
+    E.g. a token is added when a user logs out of the UI. Each token is kept
+    under its own key, so adding a token doesn't require rewriting the whole
+    list, and expired tokens are removed by `expire()`.
     """
 
     def __init__(self, store: KV):
         self._store: KV = store
         self._jti_dict: Dict[str, int] = {}
-
-    def _cleanup(self, now: int) -> None:
-        self._jti_dict = {
-            jti: exp for jti, exp in self._jti_dict.items() if exp > now
-        }
+        self._dirty: Set[str] = set()
+
+    def _cleanup(self, now: int) -> List[str]:
+        """Drop expired tokens, returning their IDs."""
+        jti_dict: Dict[str, int] = {}
+        expired: List[str] = []
+        for jti, exp in list(self._jti_dict.items()):
+            if exp > now:
+                jti_dict[jti] = exp
+            else:
+                expired.append(jti)
+                self._dirty.discard(jti)
+        self._jti_dict = jti_dict
+        return expired
 
     async def load(self) -> None:
-        self._jti_dict = {}
-        value = await self._store.get("/auth/jwt_deny_list")
-        if value is not None:
-            self._jti_dict = json.loads(value)
-            now = int(datetime.now(timezone.utc).timestamp())
-            self._cleanup(now)
+        jti_dict: Dict[str, int] = {}
+        for value in await self._store.get_prefix(JWT_DENY_PREFIX):
+            entry = JWTDenyEntryModel.parse_raw(value)
+            jti_dict[entry.jti] = entry.exp
+        self._jti_dict = jti_dict
+        self._cleanup(int(datetime.now(timezone.utc).timestamp()))
+        await self._migrate()
+
+    async def _migrate(self) -> None:
+        """Move tokens from the single key we used to keep them all in."""
+        value = await self._store.get(JWT_DENY_LIST_KEY)
+        if value is None:
+            return
+        for jti, exp in json.loads(value).items():
+            self._jti_dict[jti] = exp
+            self._dirty.add(jti)
+        self._cleanup(int(datetime.now(timezone.utc).timestamp()))
+        await self.save()
+        await self._store.rm(JWT_DENY_LIST_KEY)
 
     async def save(self) -> None:
-        await self._store.put("/auth/jwt_deny_list", json.dumps(self._jti_dict))
+        """Persist tokens added since the last save."""
+        dirty = self._dirty
+        self._dirty = set()
+        for jti in dirty:
+            exp = self._jti_dict.get(jti)
+            if exp is None:
+                continue
+            entry = JWTDenyEntryModel(jti=jti, exp=exp)
+            await self._store.put(f"{JWT_DENY_PREFIX}{jti}", entry.json())
+
+    async def expire(self) -> None:
+        """Remove expired tokens, from the store as well."""
+        now = int(datetime.now(timezone.utc).timestamp())
+        for jti in self._cleanup(now):
+            await self._store.rm(f"{JWT_DENY_PREFIX}{jti}")
+
+    def _update(self, key: str, value: Optional[str]) -> None:
+        """Apply a change to the store, as obtained by watching it."""
+        jti = key[len(JWT_DENY_PREFIX) :]
+        if value is None:
+            self._jti_dict.pop(jti, None)
+        else:
+            self._jti_dict[jti] = JWTDenyEntryModel.parse_raw(value).exp
 
     def add(self, token: JWT) -> None:
         self._jti_dict[token.jti] = token.exp
+        self._dirty.add(token.jti)
 
     def includes(self, token: JWT) -> bool:
         return token.jti in self._jti_dict
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a pool of worker threads, because bcrypt
+    takes long enough to stall the event loop. bcrypt releases the GIL while
+    it works, so threads are enough. At most `hash_queue_depth` operations may
+    be waiting for a worker; beyond that we refuse more work.
+    """
+
+    _rounds: int
+    _queue_depth: int
+    _pending: int
+    _executor: ThreadPoolExecutor
+
+    def __init__(self, config: AuthOptionsModel):
+        self._rounds = config.bcrypt_rounds
+        self._queue_depth = config.hash_workers + config.hash_queue_depth
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.hash_workers, thread_name_prefix="hasher"
+        )
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self._queue_depth:
+            raise BusyError("Too many password operations pending.")
+        self._pending += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Obtain a salted hash of `password`."""
+        salt = bcrypt.gensalt(self._rounds)
+        hashed: bytes = await self._run(
+            bcrypt.hashpw, password.encode("utf8"), salt
+        )
+        return hashed.decode("utf8")
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Check whether `password` matches the `hashed` password."""
+        return await self._run(
+            bcrypt.checkpw, password.encode("utf8"), hashed.encode("utf8")
+        )
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class AuthContext(Ticker):
+    """
+    Keeps what we need to authenticate a request in memory, instead of going
+    to the store on every request. Revoked tokens and users are loaded once,
+    and kept up to date by watching the store; decoded tokens are kept until
+    they expire. Expired revoked tokens are periodically removed, by whichever
+    node holds the expire lease; other nodes learn of it by watching the store.
+    """
+
+    _store: KV
+    _jwt_mgr: JWTMgr
+    _deny_list: JWTDenyList
+    _users: UserDirectory
+    _tokens: Dict[str, JWT]
+    _loaded: bool
+    _lock: Optional[asyncio.Lock]
+    _login_concurrency: int
+    _logins: int
+    _lease_id: str
+    hasher: PasswordHasher
+
+    def __init__(self, store: KV, config: AuthOptionsModel):
+        super().__init__(JWT_DENY_EXPIRE_INTERVAL)
+        self._store = store
+        self._jwt_mgr = JWTMgr(config)
+        self._deny_list = JWTDenyList(store)
+        self._users = UserDirectory(store)
+        self._tokens = {}
+        self._loaded = False
+        self._lock = None
+        self._login_concurrency = config.login_concurrency
+        self._logins = 0
+        self._lease_id = uuid.uuid4().hex
+        self.hasher = PasswordHasher(config)
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._loaded:
+                return
+            # watch first, so we don't miss updates while loading.
+            await self._store.watch_prefix(
+                JWT_DENY_PREFIX, _in_loop(self._on_deny_list)
+            )
+            await self._deny_list.load()
+            await self._users.load()
+            self._loaded = True
+
+    async def get_users(self) -> UserDirectory:
+        """Obtain the user directory, loading it if needed."""
+        await self._ensure_loaded()
+        return self._users
+
+    async def _should_tick(self) -> bool:
+        return self._loaded
+
+    async def _hold_expire_lease(self) -> bool:
+        """
+        Take or renew the expire lease, if it's free, ours, or has run out.
+        Nodes racing for it may both write; the last write wins, and the
+        loser backs off once it reads the lease back.
+        """
+        now = time.time()
+        value = await self._store.get(JWT_DENY_EXPIRE_LEASE_KEY)
+        if value is not None:
+            lease = JWTDenyExpireLeaseModel.parse_raw(value)
+            if lease.owner != self._lease_id and lease.until > now:
+                return False
+        lease = JWTDenyExpireLeaseModel(
+            owner=self._lease_id, until=now + JWT_DENY_EXPIRE_LEASE_TTL
+        )
+        await self._store.put(JWT_DENY_EXPIRE_LEASE_KEY, lease.json())
+        value = await self._store.get(JWT_DENY_EXPIRE_LEASE_KEY)
+        return (
+            value is not None
+            and JWTDenyExpireLeaseModel.parse_raw(value).owner == self._lease_id
+        )
+
+    async def _do_tick(self) -> None:
+        if await self._hold_expire_lease():
+            await self._deny_list.expire()
+
+    async def shutdown(self) -> None:
+        self.hasher.shutdown()
+
+    def _on_deny_list(self, key: str, value: Optional[str]) -> None:
+        self._deny_list._update(key, value)
+
+    def _decode(self, token: str) -> JWT:
+        raw_token = self._tokens.get(token)
+        if raw_token is not None and raw_token.exp > time.time():
+            return raw_token
+
+        self._tokens.pop(token, None)
+        try:
+            raw_token = self._jwt_mgr.get_raw_access_token(token)
+        except Exception as e:
+            raise InvalidTokenError(str(e))
+
+        if len(self._tokens) >= MAX_CACHED_TOKENS:
+            now = time.time()
+            self._tokens = {
+                tkn: raw for tkn, raw in self._tokens.items() if raw.exp > now
+            }
+            if len(self._tokens) >= MAX_CACHED_TOKENS:
+                self._tokens.clear()
+        self._tokens[token] = raw_token
+        return raw_token
+
+    async def authenticate(self, token: str) -> JWT:
+        """Validate an encoded token, obtaining its decoded form."""
+        await self._ensure_loaded()
+        raw_token = self._decode(token)
+        if self._deny_list.includes(raw_token):
+            raise RevokedTokenError("Token has been revoked")
+        user = self._users.get(str(raw_token.sub))
+        if user is None:
+            raise UnknownUserError("User does not exist")
+        if user.disabled:
+            raise DisabledUserError("User is disabled")
+        return raw_token
+
+    async def login(self, username: str, password: str) -> bool:
+        """
+        Check a user's credentials. Only `login_concurrency` logins are
+        checked at once; beyond that we'd rather tell the client to retry
+        later than have everyone wait on bcrypt.
+        """
+        if self._logins >= self._login_concurrency:
+            raise BusyError("Too many concurrent logins.")
+        self._logins += 1
+        try:
+            await self._ensure_loaded()
+            user = self._users.get(username)
+            if user is None or user.disabled:
+                return False
+            return await self.hasher.verify(password, user.password)
+        finally:
+            self._logins -= 1
+
+    async def revoke(self, token: JWT) -> None:
+        """Revoke a token, e.g. on logout."""
+        await self._ensure_loaded()
+        self._deny_list.add(token)
+        await self._deny_list.save()
@@ -11,9 +11,8 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import asyncio
 from logging import Logger
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
 import yaml
 from fastapi.logger import logger as fastapi_logger
@@ -50,6 +49,12 @@ class Orchestrator:
         res = self.call(cmd)
         return parse_obj_as(List[OrchHostListModel], res)
 
+    def host_names(self) -> Set[str]:
+        """Obtain the cluster's hostnames, without parsing everything else."""
+        cmd = {"prefix": "orch host ls"}
+        res = self.call(cmd)
+        return {h["hostname"] for h in res}
+
     def host_exists(self, hostname: str) -> bool:
         hosts: List[OrchHostListModel] = self.host_ls()
         for h in hosts:
@@ -64,20 +69,40 @@ class Orchestrator:
                 return h.addr
         raise UnknownHostError(f"Host '{hostname}' is not known.")
 
-    async def wait_host_added(self, hostname: str) -> None:
-        while not self.host_exists(hostname):
-            await asyncio.sleep(1.0)
-
-    def devices_ls(
-        self, hostname: Optional[str] = None
-    ) -> List[OrchDevicesPerHostModel]:
+    def _devices_ls_raw(
+        self, hostname: Optional[str] = None, refresh: bool = False
+    ) -> Any:
         cmd: Dict[str, Any] = {"prefix": "orch device ls"}
         if hostname and len(hostname) > 0:
             cmd["hostname"] = [hostname]
+        if refresh:
+            cmd["refresh"] = True
+        return self.call(cmd)
 
-        res = self.call(cmd)
+    def devices_ls(
+        self, hostname: Optional[str] = None, refresh: bool = False
+    ) -> List[OrchDevicesPerHostModel]:
+        res = self._devices_ls_raw(hostname, refresh)
         return parse_obj_as(List[OrchDevicesPerHostModel], res)
 
+    def devices_availability(
+        self, hostname: str, refresh: bool = False
+    ) -> Dict[str, bool]:
+        """
+        Obtain whether each of a host's devices is available, by path,
+        without parsing everything else. Empty if the host's devices have not
+        been probed yet.
+        """
+        res = self._devices_ls_raw(hostname, refresh)
+        for entry in res:
+            if entry.get("name") != hostname:
+                continue
+            return {
+                dev["path"]: bool(dev.get("available", False))
+                for dev in entry.get("devices", [])
+            }
+        return {}
+
     def assimilate_devices(self, host: str, devices: List[str]) -> None:
         spec = {
             "service_type": "osd",
@@ -92,33 +117,6 @@ class Orchestrator:
         res = self.call(cmd, inbuf=specbuf)
         assert "result" in res
 
-    def devices_assimilated(self, hostname: str, devs: List[str]) -> bool:
-        assert len(devs) > 0
-        assert hostname and len(hostname) > 0
-
-        res = self.devices_ls(hostname)
-        logger.debug(f"devices ls: {res}")
-        if len(res) == 0:
-            return False
-
-        assert len(res) == 1
-        entry: OrchDevicesPerHostModel = res[0]
-        assert entry.name == hostname
-
-        if len(entry.devices) == 0:
-            logger.debug("devices not yet probed on host, must wait")
-            return False
-
-        hostdevs: Dict[str, bool] = {}
-        for dev in entry.devices:
-            hostdevs[dev.path] = dev.available
-        for dev in devs:
-            assert dev in hostdevs
-            if hostdevs[dev]:
-                # if available, not yet assimilated
-                return False
-        return True
-
     def apply_mds(self, fsname: str) -> None:
         cmd = {"prefix": "orch apply mds", "fs_name": fsname}
         self.call(cmd)
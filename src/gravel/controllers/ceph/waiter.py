@@ -0,0 +1,226 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Waits on the orchestrator. Onboarding a node means waiting for the
+orchestrator to add the host and then to consume its devices, and several
+deployment flows may be doing that at once. Rather than each of them hammering
+the mgr with full `orch host ls` / `orch device ls` calls every second, all
+waiters share a single poll that only asks for what is being waited on, and
+backs off while nothing changes, or while the orchestrator can't be reached.
+"""
+
+import asyncio
+from logging import Logger
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi.logger import logger as fastapi_logger
+
+from gravel.controllers.ceph.ceph import Mgr
+from gravel.controllers.ceph.orchestrator import Orchestrator
+
+logger: Logger = fastapi_logger
+
+
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+# consecutive failed polls before we give up on those waiting.
+MAX_POLL_FAILURES = 5
+
+
+class OrchWaiter:
+    """
+    Resolves futures once hosts have been added to the orchestrator, or once
+    a host's devices have been assimilated. The poll task only runs while
+    someone is waiting.
+    """
+
+    _orch: Orchestrator
+    _hosts: Dict[str, List[asyncio.Future]]
+    _devices: Dict[str, List[Tuple[Set[str], asyncio.Future]]]
+    _refresh: Set[str]
+    _task: Optional[asyncio.Task]
+    _wakeup: Optional[asyncio.Event]
+    _interval: float
+    _host_failures: int
+    _device_failures: Dict[str, int]
+
+    def __init__(self, mgr: Mgr) -> None:
+        self._orch = Orchestrator(mgr)
+        self._hosts = {}
+        self._devices = {}
+        self._refresh = set()
+        self._task = None
+        self._wakeup = None
+        self._interval = MIN_POLL_INTERVAL
+        self._host_failures = 0
+        self._device_failures = {}
+
+    @property
+    def waiting(self) -> int:
+        """Number of waiters not yet resolved."""
+        futures = [f for w in self._hosts.values() for f in w] + [
+            f for w in self._devices.values() for _, f in w
+        ]
+        return len([f for f in futures if not f.done()])
+
+    async def wait_host_added(
+        self, hostname: str, timeout: Optional[float] = None
+    ) -> None:
+        """
+        Wait until `hostname` is known to the orchestrator. Raises
+        `asyncio.TimeoutError` if that takes longer than `timeout` seconds.
+        """
+        fut = asyncio.get_event_loop().create_future()
+        self._hosts.setdefault(hostname, []).append(fut)
+        self._kick()
+        await asyncio.wait_for(fut, timeout)
+
+    async def wait_devices_assimilated(
+        self,
+        hostname: str,
+        devices: List[str],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Wait until all of `devices` on `hostname` have been consumed by the
+        orchestrator. The first poll for the host forces the orchestrator to
+        refresh its view of the host's devices.
+        """
+        fut = asyncio.get_event_loop().create_future()
+        if len(devices) == 0:
+            fut.set_result(None)
+        self._devices.setdefault(hostname, []).append((set(devices), fut))
+        self._refresh.add(hostname)
+        self._kick()
+        await asyncio.wait_for(fut, timeout)
+
+    def _kick(self) -> None:
+        """New waiter: poll soon, starting the poll task if needed."""
+        self._interval = MIN_POLL_INTERVAL
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._main())
+
+    def _prune(self) -> None:
+        """Forget waiters that have been resolved or given up waiting."""
+        for hostname in list(self._hosts.keys()):
+            pending = [f for f in self._hosts[hostname] if not f.done()]
+            if pending:
+                self._hosts[hostname] = pending
+            else:
+                del self._hosts[hostname]
+        for hostname in list(self._devices.keys()):
+            entries = [e for e in self._devices[hostname] if not e[1].done()]
+            if entries:
+                self._devices[hostname] = entries
+            else:
+                del self._devices[hostname]
+                self._refresh.discard(hostname)
+                self._device_failures.pop(hostname, None)
+
+    async def _main(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            self._prune()
+            if len(self._hosts) == 0 and len(self._devices) == 0:
+                break
+            self._wakeup.clear()
+            progress = await self._poll()
+            if progress:
+                self._interval = MIN_POLL_INTERVAL
+            else:
+                self._interval = min(self._interval * 2, MAX_POLL_INTERVAL)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.debug("orch waiter: no more waiters")
+
+    async def _poll(self) -> bool:
+        """Check every condition being waited on; True if any resolved."""
+        loop = asyncio.get_event_loop()
+        progress = False
+
+        if len(self._hosts) > 0:
+            try:
+                hosts = await loop.run_in_executor(None, self._orch.host_names)
+            except Exception as e:
+                self._host_failures += 1
+                if self._host_failures < MAX_POLL_FAILURES:
+                    logger.warning(
+                        f"orch waiter: unable to list hosts, retrying: {str(e)}"
+                    )
+                else:
+                    logger.error(f"orch waiter: unable to list hosts: {str(e)}")
+                    self._host_failures = 0
+                    waiters = self._hosts
+                    self._hosts = {}
+                    self._fail([fut for w in waiters.values() for fut in w], e)
+            else:
+                self._host_failures = 0
+                for hostname in hosts & self._hosts.keys():
+                    for fut in self._hosts.pop(hostname):
+                        if not fut.done():
+                            fut.set_result(None)
+                    progress = True
+
+        for hostname in list(self._devices.keys()):
+            refresh = hostname in self._refresh
+            self._refresh.discard(hostname)
+            try:
+                avail = await loop.run_in_executor(
+                    None, self._orch.devices_availability, hostname, refresh
+                )
+            except Exception as e:
+                failures = self._device_failures.get(hostname, 0) + 1
+                if failures < MAX_POLL_FAILURES:
+                    logger.warning(
+                        f"orch waiter: unable to list devices on {hostname}, "
+                        f"retrying: {str(e)}"
+                    )
+                    self._device_failures[hostname] = failures
+                    if refresh:
+                        self._refresh.add(hostname)
+                    continue
+                logger.error(
+                    f"orch waiter: unable to list devices on {hostname}: "
+                    f"{str(e)}"
+                )
+                self._device_failures.pop(hostname, None)
+                entries = self._devices.pop(hostname, [])
+                self._fail([fut for _, fut in entries], e)
+                continue
+
+            self._device_failures.pop(hostname, None)
+
+            remaining: List[Tuple[Set[str], asyncio.Future]] = []
+            for devs, fut in self._devices.get(hostname, []):
+                if fut.done():
+                    continue
+                # a device is assimilated once it is no longer available.
+                if all(d in avail and not avail[d] for d in devs):
+                    fut.set_result(None)
+                    progress = True
+                else:
+                    remaining.append((devs, fut))
+            self._devices[hostname] = remaining
+
+        return progress
+
+    def _fail(self, futures: List[asyncio.Future], e: Exception) -> None:
+        for fut in futures:
+            if not fut.done():
+                fut.set_exception(e)
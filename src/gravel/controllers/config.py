@@ -35,6 +35,9 @@ def _get_default_confdir() -> str:
 
 class InventoryOptionsModel(BaseModel):
     probe_interval: int = Field(60, title="Inventory Probe Interval")
+    hotplug_probe_interval: int = Field(
+        600, title="Inventory Probe Interval When Listening for Hotplug Events"
+    )
 
 
 class StorageOptionsModel(BaseModel):
@@ -51,6 +54,15 @@ class StatusOptionsModel(BaseModel):
 
 class NetworkOptionsModel(BaseModel):
     probe_interval: float = Field(5.0, title="Network Probe Interval")
+    watch_probe_interval: float = Field(
+        300.0, title="Network Probe Interval When Watching for Changes"
+    )
+
+
+class LoopMonitorOptionsModel(BaseModel):
+    interval: float = Field(0.5, title="Event Loop Lag Probe Interval")
+    threshold: float = Field(0.1, title="Event Loop Lag Considered a Stall")
+    debug: bool = Field(False, title="Run the Event Loop in Debug Mode")
 
 
 class AuthOptionsModel(BaseModel):
@@ -61,6 +73,14 @@ class AuthOptionsModel(BaseModel):
     jwt_ttl: int = Field(
         36000, title="How long an access token should live before it expires"
     )
+    bcrypt_rounds: int = Field(12, title="Password hashing work factor")
+    hash_workers: int = Field(2, title="Password hashing worker threads")
+    hash_queue_depth: int = Field(
+        16, title="Password hashing operations allowed to wait for a worker"
+    )
+    login_concurrency: int = Field(
+        4, title="Logins allowed at once before refusing new ones"
+    )
 
 
 class ContainersOptionsModel(BaseModel):
@@ -83,6 +103,7 @@ class OptionsModel(BaseModel):
     devices: DevicesOptionsModel = Field(DevicesOptionsModel())
     status: StatusOptionsModel = Field(StatusOptionsModel())
     network: NetworkOptionsModel = Field(NetworkOptionsModel())
+    loopmon: LoopMonitorOptionsModel = Field(LoopMonitorOptionsModel())
     auth: AuthOptionsModel = Field(AuthOptionsModel())
     containers: ContainersOptionsModel = Field(ContainersOptionsModel())
 
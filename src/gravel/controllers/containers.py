@@ -6,18 +6,37 @@
 # the Free Software Foundation, either version 3 of the License, or
 # (at your option) any later version.
 #
-import shlex
+import asyncio
+import hashlib
+import json
+import re
+import shutil
+from logging import Logger
 from pathlib import Path
-from typing import Any, Dict, MutableMapping, Optional
+from typing import Any, Callable, Dict, List, MutableMapping, Optional
 
-import requests
 import toml
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
 
 from gravel.controllers.errors import GravelError
+from gravel.controllers.registry import (
+    RegistryClient,
+    RegistryError,
+    RegistryNotFoundError,
+    RegistrySSLError,
+    resolve_image,
+)
 from gravel.controllers.utils import aqr_run_cmd
 
+logger: Logger = fastapi_logger
+
 REGISTRIES_CONF = "/etc/containers/registries.conf"
 
+# podman reports each blob as it starts copying it, "Copying blob <digest>";
+# only when on a terminal is a status, e.g. "done", reported too.
+_COPY_BLOB_RE = re.compile(r"^Copying blob (?:sha256:)?([0-9a-f]+)(.*)$")
+
 
 class ContainerError(GravelError):
     pass
@@ -64,27 +83,23 @@ class UnknownImageTagError(ContainerImageError):
 
 
 async def registry_check(registry: str, image: str, secure: bool) -> None:
-
-    proto = "https" if secure else "http"
-    # check for an existing registry
-    #
+    """
+    Check whether `image`, with its tag, is available from `registry`. Costs
+    a single small request per uncached lookup.
+    """
+    client = RegistryClient.get(registry, secure)
     try:
-        req = requests.get(f"{proto}://{registry}/v2/", timeout=5)
-        if req.status_code != requests.codes.ok:
-            raise UnknownRegistryError(
-                registry,
-                msg=f"Error connecting to registry at '{registry}: {req.text}",
-            )
-    except requests.exceptions.SSLError:
+        await client.ping()
+    except RegistrySSLError:
         req_proto = "https" if not secure else "http"
         raise RegistrySecurityError(
             registry,
             msg=f"Registry at '{registry}' requires an {req_proto} connection.",
         )
-    except requests.exceptions.ConnectionError as e:
+    except RegistryError as e:
         raise UnknownRegistryError(
             registry,
-            msg=f"Error connecting to registry at '{registry}': {str(e)}",
+            msg=f"Error connecting to registry at '{registry}': {e.message}",
         )
 
     # check for image:tag
@@ -95,31 +110,260 @@ async def registry_check(registry: str, image: str, secure: bool) -> None:
     (imgname, imgtag) = img
 
     try:
-        req = requests.get(f"{proto}://{registry}/v2/{imgname}/tags/list")
-    except Exception as e:
-        raise ContainerError(msg=str(e))
-
-    if req.status_code != requests.codes.ok:
+        digest = await client.digest(imgname, imgtag)
+        if digest is not None:
+            return
+        # no such manifest; tell apart a missing image from a missing tag.
+        await client.tags(imgname)
+    except RegistryNotFoundError:
         raise UnknownImageError(
             imgname, msg=f"Could not find image '{imgname}'."
         )
-    res = req.json()
-    assert res["name"] == imgname
-    if imgtag not in res["tags"]:
-        raise UnknownImageTagError(
-            image, msg=f"Could not find image '{imgname}' with tag '{imgtag}'."
-        )
+    except RegistryError as e:
+        raise ContainerError(msg=e.message)
+    raise UnknownImageTagError(
+        image, msg=f"Could not find image '{imgname}' with tag '{imgtag}'."
+    )
+
+
+class PullProgressModel(BaseModel):
+    """
+    Progress of an image pull. podman doesn't report bytes copied unless on a
+    terminal, so progress is per layer: `bytes_done` only moves once a whole
+    layer has been obtained.
+    """
+
+    image: str = Field(title="Image being pulled.")
+    skipped: bool = Field(False, title="Image was present, pull skipped.")
+    done: bool = Field(False, title="Whether the pull has finished.")
+    layers_total: int = Field(0, title="Number of layers, if known.")
+    layers_started: int = Field(0, title="Number of layers being obtained.")
+    layers_done: int = Field(0, title="Number of layers obtained.")
+    bytes_total: int = Field(0, title="Compressed image size, if known.")
+    bytes_done: int = Field(0, title="Compressed size of layers obtained.")
+
+
+PullProgressCB = Callable[[PullProgressModel], None]
+
+
+async def image_repo_digests(ref: str) -> List[str]:
+    """Digests the local image `ref` is known by, if we have it."""
+    cmd = ["podman", "image", "inspect", "--format", "{{json .RepoDigests}}"]
+    ret, out, _ = await aqr_run_cmd(cmd + [ref])
+    if ret != 0 or out is None or len(out.strip()) == 0:
+        return []
+    try:
+        return [d.split("@")[-1] for d in json.loads(out) or []]
+    except ValueError:
+        return []
 
 
-async def container_pull(registry: str, image: str) -> str:
-    imgstr = f"docker://{registry}/{image}"
-    cmdstr = f"podman pull -q {imgstr}"
-    ret, out, err = await aqr_run_cmd(shlex.split(cmdstr))
+async def image_is_current(registry: str, image: str, secure: bool) -> bool:
+    """Whether we have `image` locally, as it currently is in the registry."""
+    try:
+        digest, _ = await resolve_image(registry, image, secure)
+    except Exception as e:
+        logger.debug(f"Unable to resolve image {image}: {str(e)}")
+        return False
+    return digest in await image_repo_digests(f"{registry}/{image}")
+
+
+async def container_pull(
+    registry: str,
+    image: str,
+    secure: bool = True,
+    progresscb: Optional[PullProgressCB] = None,
+) -> str:
+    """
+    Pull `image` from `registry`, unless we already have it. Returns the
+    image's ID. Progress is reported per layer, see `PullProgressModel`.
+    """
+    ref = f"{registry}/{image}"
+    progress = PullProgressModel(image=ref)
+
+    def report() -> None:
+        if progresscb is not None:
+            progresscb(progress.copy())
+
+    layers: Dict[str, int] = {}
+    try:
+        digest, layers = await resolve_image(registry, image, secure)
+    except Exception as e:
+        # not fatal, the pull itself will tell whether the image exists.
+        logger.debug(f"Unable to resolve image {ref}: {str(e)}")
+    else:
+        if digest in await image_repo_digests(ref):
+            logger.info(f"Image {ref} already present, skip pull.")
+            progress.skipped = True
+            progress.done = True
+            progress.layers_total = len(layers)
+            progress.layers_started = progress.layers_done = len(layers)
+            progress.bytes_done = progress.bytes_total = sum(layers.values())
+            report()
+            return await image_id(ref)
+
+    progress.layers_total = len(layers)
+    progress.bytes_total = sum(layers.values())
+    report()
+    started: Dict[str, bool] = {}
+    done: Dict[str, bool] = {}
+    # the blob podman last started copying.
+    current: List[str] = []
+
+    def mark_started(blob: str) -> None:
+        for layer in layers.keys():
+            if layer.startswith(blob) and layer not in started:
+                started[layer] = True
+                progress.layers_started += 1
+
+    def mark_done(blob: str) -> None:
+        mark_started(blob)
+        for layer, size in layers.items():
+            if layer.startswith(blob) and layer not in done:
+                done[layer] = True
+                progress.layers_done += 1
+                progress.bytes_done += size
+
+    def on_line(line: str) -> None:
+        line = line.strip()
+        m = _COPY_BLOB_RE.match(line)
+        if m is not None:
+            blob, status = m.group(1), m.group(2).strip()
+            # podman moving on means it's done with the previous blob.
+            if current:
+                mark_done(current.pop())
+            if status == "done" or status.startswith("skipped"):
+                mark_done(blob)
+            else:
+                mark_started(blob)
+                current.append(blob)
+            report()
+        elif line.startswith("Copying config") or line.startswith("Writing"):
+            # every layer has been copied by now.
+            current.clear()
+            for layer in layers.keys():
+                mark_done(layer)
+            report()
+
+    cmd = ["podman", "pull", f"docker://{ref}"]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    assert proc.stdout is not None and proc.stderr is not None
+
+    errors: List[str] = []
+    async for raw in proc.stderr:
+        line = raw.decode("utf-8")
+        errors.append(line)
+        on_line(line)
+    out = (await proc.stdout.read()).decode("utf-8").strip()
+    ret = await proc.wait()
+    logger.debug(f"run {cmd}: retcode = {ret}")
     if ret != 0:
-        raise ContainerPullError(msg=err)
-    if out is None or len(out) == 0:
+        raise ContainerPullError(msg="".join(errors[-5:]))
+    if len(out) == 0:
         raise ContainerPullError(msg="unable to obtain container hash")
-    return out
+
+    progress.done = True
+    report()
+    return out.splitlines()[-1]
+
+
+async def image_id(ref: str) -> str:
+    """Obtain the ID of the local image `ref`."""
+    cmd = ["podman", "image", "inspect", "--format", "{{.Id}}", ref]
+    ret, out, err = await aqr_run_cmd(cmd)
+    if ret != 0 or out is None or len(out.strip()) == 0:
+        raise UnknownImageError(ref, msg=f"Image '{ref}' not found: {err}")
+    return out.strip()
+
+
+async def image_save(ref: str, path: Path) -> None:
+    """Save the local image `ref` as an archive at `path`."""
+    cmd = ["podman", "save", "-q", "-o", str(path), ref]
+    ret, _, err = await aqr_run_cmd(cmd)
+    if ret != 0:
+        raise ContainerError(msg=f"Unable to save image '{ref}': {err}")
+
+
+async def image_load(path: Path) -> None:
+    """Load an image archive from `path` into local storage."""
+    cmd = ["podman", "load", "-q", "-i", str(path)]
+    ret, _, err = await aqr_run_cmd(cmd)
+    if ret != 0:
+        raise ContainerError(msg=f"Unable to load image: {err}")
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+            h.update(chunk)
+    return f"sha256:{h.hexdigest()}"
+
+
+class ImageArchiveModel(BaseModel):
+    image: str = Field(title="Image reference.")
+    image_id: str = Field(title="Image ID.")
+    digest: str = Field(title="Archive's SHA-256 digest.")
+    path: str = Field(title="Path to the archive.")
+
+
+class ImageExporter:
+    """
+    Keeps an archive of a local image, so other nodes can obtain it from us
+    rather than from the registry. The archive is created on first request,
+    and created anew should the local image change, until cleared.
+    """
+
+    _dir: Path
+    _lock: asyncio.Lock
+    _archive: Optional[ImageArchiveModel]
+
+    def __init__(self, path: Path) -> None:
+        self._dir = path
+        self._lock = asyncio.Lock()
+        self._archive = None
+
+    async def get(self, ref: str) -> ImageArchiveModel:
+        """Obtain an archive of image `ref`, exporting it if needed."""
+        # only one export at a time; concurrent callers share its result.
+        async with self._lock:
+            imgid = await image_id(ref)
+            archive = self._archive
+            if (
+                archive is not None
+                and archive.image == ref
+                and archive.image_id == imgid
+                and Path(archive.path).exists()
+            ):
+                return archive
+
+            logger.info(f"Exporting image {ref} ({imgid})")
+            self._dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            path = self._dir.joinpath(f"{imgid}.tar")
+            tmp = path.with_suffix(".tmp")
+            tmp.unlink(missing_ok=True)
+            await image_save(ref, tmp)
+            digest = await asyncio.get_event_loop().run_in_executor(
+                None, file_digest, tmp
+            )
+            tmp.rename(path)
+            if archive is not None and archive.path != str(path):
+                Path(archive.path).unlink(missing_ok=True)
+
+            self._archive = ImageArchiveModel(
+                image=ref, image_id=imgid, digest=digest, path=str(path)
+            )
+            return self._archive
+
+    async def clear(self) -> None:
+        """Remove the archive, along with anything left behind by a crash."""
+        async with self._lock:
+            self._archive = None
+            if self._dir.exists():
+                logger.info(f"Removing image archives from {self._dir}")
+                shutil.rmtree(self._dir, ignore_errors=True)
 
 
 async def get_registries_conf() -> MutableMapping[str, Any]:
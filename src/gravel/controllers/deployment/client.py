@@ -0,0 +1,206 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Asynchronous client for the join protocol, used by the node joining the
+cluster to talk to the node handling its join request. Connections are kept
+alive between requests, requests time out unless they can't be retried, and
+requests failing for transient reasons are retried with exponential backoff.
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import ssl
+from logging import Logger
+from pathlib import Path
+from typing import Any, Dict, Optional, Type, TypeVar
+
+import httpx
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel
+from pydantic.error_wrappers import ValidationError
+
+from gravel.controllers.errors import GravelError
+
+logger: Logger = fastapi_logger
+
+
+# HTTP/2 requires the 'h2' package, which is optional.
+_has_http2 = importlib.util.find_spec("h2") is not None
+
+
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 30.0
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+# responses worth retrying, because the remote may be briefly unavailable.
+RETRY_STATUS = (502, 503, 504)
+# header carrying the SHA-256 digest of a downloaded file.
+DIGEST_HEADER = "X-Content-Digest"
+
+
+class JoinClientError(GravelError):
+    pass
+
+
+T = TypeVar("T", bound=BaseModel)
+
+
+def _is_ssl_error(e: BaseException) -> bool:
+    cause: Optional[BaseException] = e
+    while cause is not None:
+        if isinstance(cause, ssl.SSLError):
+            return True
+        cause = cause.__cause__ or cause.__context__
+    return False
+
+
+class JoinClient:
+    """Talks to the node at `remote`, on behalf of the node joining."""
+
+    _client: httpx.AsyncClient
+    _retries: int
+    _backoff: float
+
+    def __init__(
+        self,
+        remote: str,
+        timeout: float = REQUEST_TIMEOUT,
+        retries: int = MAX_RETRIES,
+        backoff: float = RETRY_BACKOFF,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        if not remote.startswith("https://") and not remote.startswith(
+            "http://"
+        ):
+            remote = f"https://{remote}"
+        self._retries = retries
+        self._backoff = backoff
+        # only override httpx's own transport when given one.
+        extra: Dict[str, Any] = {}
+        if transport is not None:
+            extra["transport"] = transport
+        self._client = httpx.AsyncClient(
+            base_url=remote,
+            timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+            http2=_has_http2,
+            **extra,
+        )
+
+    async def __aenter__(self) -> "JoinClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def post(
+        self,
+        path: str,
+        params: BaseModel,
+        reply: Type[T],
+        idempotent: bool = True,
+    ) -> T:
+        """
+        POST `params` to `path`, obtaining a `reply`. Unless the request is
+        `idempotent`, we wait for as long as the remote takes to reply, and
+        only retry if the request can't have reached it, as a retry would do
+        the work a second time.
+        """
+        timeout: Optional[httpx.Timeout] = None
+        if not idempotent:
+            timeout = httpx.Timeout(None, connect=CONNECT_TIMEOUT)
+        attempt = 0
+        while True:
+            try:
+                res = await self._client.post(
+                    path,
+                    content=params.json(),
+                    headers={"Content-Type": "application/json"},
+                    timeout=timeout or self._client.timeout,
+                )
+                if res.status_code not in RETRY_STATUS or not idempotent:
+                    break
+                msg = res.reason_phrase
+            except httpx.TransportError as e:
+                if _is_ssl_error(e):
+                    raise JoinClientError("SSL Error.")
+                if isinstance(e, httpx.TimeoutException):
+                    msg = "Timed out."
+                else:
+                    msg = "Unable to connect."
+                if not idempotent and not isinstance(
+                    e, (httpx.ConnectError, httpx.ConnectTimeout)
+                ):
+                    raise JoinClientError(msg)
+
+            if attempt >= self._retries:
+                raise JoinClientError(msg)
+            delay = self._backoff * (2**attempt)
+            attempt += 1
+            logger.info(
+                f"Request to {path} failed ({msg}), retry {attempt} "
+                f"in {delay} seconds."
+            )
+            await asyncio.sleep(delay)
+
+        if res.is_error:
+            raise JoinClientError(res.reason_phrase)
+        try:
+            return reply.parse_raw(res.text)
+        except ValidationError:
+            logger.error(f"Unable to parse response from {path}.")
+            raise JoinClientError("Unable to parse response.")
+
+    async def download(
+        self, path: str, dest: Path, headers: Optional[Dict[str, str]] = None
+    ) -> httpx.Headers:
+        """
+        Download `path` into `dest`, returning the response's headers. The
+        remote must provide the content's digest, matching what we got. We
+        wait for as long as the remote takes, as it may have to prepare the
+        content before replying.
+        """
+        h = hashlib.sha256()
+        timeout = httpx.Timeout(None, connect=CONNECT_TIMEOUT)
+        try:
+            async with self._client.stream(
+                "GET", path, headers=headers or {}, timeout=timeout
+            ) as res:
+                if res.is_error:
+                    raise JoinClientError(res.reason_phrase)
+                with dest.open("wb") as fd:
+                    async for chunk in res.aiter_bytes():
+                        h.update(chunk)
+                        fd.write(chunk)
+        except httpx.TransportError as e:
+            if _is_ssl_error(e):
+                raise JoinClientError("SSL Error.")
+            if isinstance(e, httpx.TimeoutException):
+                raise JoinClientError("Timed out.")
+            raise JoinClientError("Unable to connect.")
+
+        expected = res.headers.get(DIGEST_HEADER)
+        if expected is None:
+            logger.error(f"No digest downloading {path}.")
+            dest.unlink(missing_ok=True)
+            raise JoinClientError("Missing digest.")
+        if expected != f"sha256:{h.hexdigest()}":
+            logger.error(f"Digest mismatch downloading {path}.")
+            dest.unlink(missing_ok=True)
+            raise JoinClientError("Digest mismatch.")
+        return res.headers
@@ -22,7 +22,7 @@ import asyncio
 import random
 from enum import Enum
 from logging import Logger
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from fastapi.logger import logger as fastapi_logger
 from pydantic import BaseModel, Field
@@ -31,11 +31,19 @@ from gravel.controllers.auth import UserMgr, UserModel
 from gravel.controllers.ceph.ceph import CephCommandError, Mon
 from gravel.controllers.ceph.orchestrator import Orchestrator
 from gravel.controllers.containers import (
+    ContainerError,
     ContainerPullError,
+    PullProgressModel,
     container_pull,
     registry_check,
     set_registry,
 )
+from gravel.controllers.deployment.pipeline import (
+    Pipeline,
+    StageStateEnum,
+    StageStatusModel,
+)
+from gravel.controllers.deployment.trace import DurationHistory, Tracer
 from gravel.controllers.errors import GravelError
 from gravel.controllers.gstate import GlobalState
 from gravel.controllers.kv import KV
@@ -84,6 +92,14 @@ class CreateProgress(BaseModel):
     progress: int = Field(0, title="Creation progress percent.")
     msg: str = Field("", title="Create progress message. May be an error.")
     error: bool = Field(False, title="Progress is in an error state.")
+    stages: List[StageStatusModel] = Field(
+        [], title="Node preparation stages, and how long they took."
+    )
+    eta: Optional[float] = Field(None, title="Estimated seconds remaining.")
+    pull: Optional[PullProgressModel] = Field(
+        None, title="Container image pull progress."
+    )
+    trace: Dict[str, Any] = Field({}, title="Trace, in OTLP/JSON format.")
 
 
 class ProgressEnum(int, Enum):
@@ -101,6 +117,9 @@ class DeploymentCreator:
     _gstate: GlobalState
     _task_create: Optional[asyncio.Task]
     _progress: Optional[CreateProgress]
+    _pipeline: Optional[Pipeline]
+    _tracer: Optional[Tracer]
+    _history: DurationHistory
     _bootstrapper: Optional[Bootstrap]
     _done: bool
     _hostname: Optional[str]
@@ -120,6 +139,9 @@ class DeploymentCreator:
         self._gstate = gstate
         self._task_create = None
         self._progress = None
+        self._pipeline = None
+        self._tracer = None
+        self._history = DurationHistory(gstate.config)
         self._bootstrapper = None
         self._done = False
         self._hostname = None
@@ -133,6 +155,13 @@ class DeploymentCreator:
             return CreateProgress()
         p = self._progress.copy()
         p.progress = self._prog(self._progress.progress)
+        if self._pipeline is not None:
+            p.stages = self._pipeline.stages
+        if self._tracer is not None:
+            p.trace = self._tracer.to_otlp()
+            p.eta = self._history.eta(
+                self._tracer, [e.name.lower() for e in ProgressEnum]
+            )
         return p
 
     @property
@@ -187,13 +216,16 @@ class DeploymentCreator:
             raise CreationError("Pre-checks failed, unable to create.")
 
         self._progress = CreateProgress()
+        self._tracer = Tracer("create")
         self._task_create = asyncio.create_task(self._create_task_func(config))
 
     async def _prechecks(self, containers: Optional[ContainerConfig]) -> None:
         """
         Checks requirements for creation. Should be trivial, we can't block too
         long, otherwise the caller will be waiting. Longer checks should be
-        performed within the creation task.
+        performed within the creation task. Checking the registry is a single
+        request, cached by the registry client, and reports a bad registry or
+        image right away rather than leaving the node in error.
         """
 
         ctrcfg = self._gstate.config.options.containers
@@ -230,7 +262,7 @@ class DeploymentCreator:
         self._bootstrapper = Bootstrap(self._gstate)
         try:
             await self._bootstrapper.bootstrap(
-                config.address, self._finish_bootstrap_cb
+                config.address, self._finish_bootstrap_cb, self._mark_step
             )
         except BootstrapError as e:
             logger.error(f"Bootstrap error: {e.message}")
@@ -243,43 +275,95 @@ class DeploymentCreator:
     ) -> None:
         """
         Prepare the node. This must happen before bootstrapping the cluster.
+        Steps not depending on each other run concurrently; in particular, the
+        image is pulled while the rest of the node is being configured.
         """
         assert hostname is not None and len(hostname) > 0
         assert ntpaddr is not None and len(ntpaddr) > 0
 
-        if network:
-            logger.debug("Applying network configuration.")
-            await self._gstate.network.apply_config(
-                network.interfaces, network.nameservers, network.routes
-            )
-
-        try:
-            await set_hostname(hostname)
-        except HostnameCtlError as e:
-            msg = f"Error setting hostname during create: {e.message}"
-            logger.error(msg)
-            raise CreationError(msg)
-        except Exception as e:
-            msg = f"Unknown error setting hostname during create: {str(e)}"
-            logger.error(msg)
-            raise CreationError(msg)
-
-        try:
-            await set_ntp_addr(ntpaddr)
-        except NodeChronyRestartError as e:
-            msg = f"Error setting NTP address: {e.message}"
-            logger.error(msg)
-            raise CreationError(msg)
-
-        self._mark_progress(ProgressEnum.CONTAINERS, "Obtaining containers")
         ctrcfg = self._gstate.config.options.containers
+
+        async def _network() -> None:
+            if network:
+                logger.debug("Applying network configuration.")
+                await self._gstate.network.apply_config(
+                    network.interfaces, network.nameservers, network.routes
+                )
+
+        async def _hostname() -> None:
+            try:
+                await set_hostname(hostname)
+            except HostnameCtlError as e:
+                msg = f"Error setting hostname during create: {e.message}"
+                logger.error(msg)
+                raise CreationError(msg)
+            except Exception as e:
+                msg = f"Unknown error setting hostname during create: {str(e)}"
+                logger.error(msg)
+                raise CreationError(msg)
+
+        async def _ntp() -> None:
+            try:
+                await set_ntp_addr(ntpaddr)
+            except NodeChronyRestartError as e:
+                msg = f"Error setting NTP address: {e.message}"
+                logger.error(msg)
+                raise CreationError(msg)
+
+        async def _registry_check() -> None:
+            try:
+                await registry_check(
+                    ctrcfg.registry, ctrcfg.image, ctrcfg.secure
+                )
+            except ContainerError as e:
+                msg = f"Error checking container registry: {e.message}"
+                logger.error(msg)
+                raise CreationError(msg)
+
+        async def _registry() -> None:
+            try:
+                await set_registry(ctrcfg.registry, ctrcfg.secure)
+            except ContainerError as e:
+                msg = f"Error configuring container registry: {e.message}"
+                logger.error(msg)
+                raise CreationError(msg)
+
+        async def _pull() -> None:
+            self._mark_progress(ProgressEnum.CONTAINERS, "Obtaining containers")
+            try:
+                await container_pull(
+                    ctrcfg.registry,
+                    ctrcfg.image,
+                    ctrcfg.secure,
+                    self._mark_pull_progress,
+                )
+            except ContainerPullError as e:
+                msg = f"Error obtaining containers: {e.message}"
+                logger.error(msg)
+                raise CreationError(msg)
+
+        # anything reaching out to the network waits for it to be configured.
+        pipeline = Pipeline()
+        pipeline.add("network", _network)
+        pipeline.add("hostname", _hostname)
+        pipeline.add("ntp", _ntp, ["network"])
+        # checked before creating too; this one is answered from the cache.
+        pipeline.add("registry-check", _registry_check, ["network"])
+        pipeline.add("registry", _registry)
+        pipeline.add("pull", _pull, ["registry-check", "registry"])
+        self._pipeline = pipeline
         try:
-            await set_registry(ctrcfg.registry, ctrcfg.secure)
-            await container_pull(ctrcfg.registry, ctrcfg.image)
-        except ContainerPullError as e:
-            msg = f"Error obtaining containers: {e.message}"
-            logger.error(msg)
-            raise CreationError(msg)
+            await pipeline.run()
+        finally:
+            assert self._tracer is not None
+            for stage in pipeline.stages:
+                if stage.started > 0.0:
+                    self._tracer.add(
+                        stage.name,
+                        stage.started,
+                        stage.duration,
+                        error=stage.state == StageStateEnum.ERROR,
+                    )
 
     def _generate_token(self) -> str:
         def gen() -> str:
@@ -327,8 +411,10 @@ class DeploymentCreator:
         await kv.put("/nodes/token", self._generate_token())
         await kv.put("/nodes/containers", ctrcfg.json())
 
-        admin_user = UserModel(username="admin", password="aquarium")
-        admin_user.hash_password()
+        admin_user = UserModel(
+            username="admin",
+            password=await self._gstate.auth.hasher.hash("aquarium"),
+        )
         user_mgr = UserMgr(self._gstate.store)
         await user_mgr.put(admin_user)
 
@@ -389,10 +475,11 @@ class DeploymentCreator:
         """Add current host to the cluster."""
         assert self._hostname is not None
         try:
-            orch = Orchestrator(self._gstate.ceph_mgr)
             logger.debug("Wait for host to be added.")
-            await asyncio.wait_for(orch.wait_host_added(self._hostname), 30.0)
-        except TimeoutError:
+            await self._gstate.orch_waiter.wait_host_added(
+                self._hostname, timeout=30.0
+            )
+        except asyncio.TimeoutError:
             logger.error("Timed out waiting for host to be added.")
             return False
         return True
@@ -410,10 +497,9 @@ class DeploymentCreator:
                 logger.error("Host is not part of the cluster.")
                 return False
             orch.assimilate_devices(self._hostname, self._storage_devices)
-            while not orch.devices_assimilated(
+            await self._gstate.orch_waiter.wait_devices_assimilated(
                 self._hostname, self._storage_devices
-            ):
-                await asyncio.sleep(1.0)
+            )
         except CephCommandError as e:
             logger.error(
                 f"Command error while assimilating devices: {e.message}"
@@ -428,6 +514,22 @@ class DeploymentCreator:
         assert self._progress is not None
         self._progress.msg = msg
         self._progress.progress = value
+        assert self._tracer is not None
+        if prog == ProgressEnum.DONE:
+            self._tracer.finish()
+            self._history.record(self._tracer)
+        else:
+            self._tracer.stage(prog.name.lower())
+
+    def _mark_pull_progress(self, pull: PullProgressModel) -> None:
+        """Mark progress pulling the container image."""
+        assert self._progress is not None
+        self._progress.pull = pull
+
+    def _mark_step(self, step: str) -> None:
+        """Mark a step within the current progress stage."""
+        if self._tracer is not None:
+            self._tracer.step(step)
 
     def _mark_state(self, state: CreateStateEnum) -> None:
         """Mark current progress state."""
@@ -445,6 +547,8 @@ class DeploymentCreator:
         self._progress.progress = 0
         self._progress.error = True
         self._progress.msg = msg
+        if self._tracer is not None:
+            self._tracer.finish(error=True)
 
     def _prog(self, value: int) -> int:
 
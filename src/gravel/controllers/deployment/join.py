@@ -21,17 +21,16 @@ This happens only after a node has been installed.
 """
 
 import asyncio
+import tempfile
 from datetime import datetime as dt
 from enum import Enum
 from logging import Logger
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
-import requests
 from fastapi.logger import logger as fastapi_logger
 from pydantic import BaseModel, Field
-from pydantic.error_wrappers import ValidationError
 
 from gravel.controllers.ceph.ceph import CephCommandError
 from gravel.controllers.ceph.models import OrchHostListModel
@@ -40,9 +39,16 @@ from gravel.controllers.config import ContainersOptionsModel
 from gravel.controllers.containers import (
     ContainerError,
     ContainerPullError,
+    ImageArchiveModel,
+    ImageExporter,
+    PullProgressModel,
     container_pull,
+    image_id,
+    image_load,
     set_registry,
 )
+from gravel.controllers.deployment.client import JoinClient, JoinClientError
+from gravel.controllers.deployment.trace import DurationHistory, Tracer
 from gravel.controllers.errors import GravelError
 from gravel.controllers.gstate import GlobalState
 from gravel.controllers.kv import KV
@@ -84,6 +90,11 @@ class JoinProgress(BaseModel):
     progress: int = Field(0, title="Join progress percent.")
     msg: str = Field("", title="Join progress message. May be error.")
     error: bool = Field(False, title="Progress is in error state.")
+    pull: Optional[PullProgressModel] = Field(
+        None, title="Container image pull progress."
+    )
+    eta: Optional[float] = Field(None, title="Estimated seconds remaining.")
+    trace: Dict[str, Any] = Field({}, title="Trace, in OTLP/JSON format.")
 
 
 class JoinRequestParamsModel(BaseModel):
@@ -119,9 +130,12 @@ class ProgressEnum(int, Enum):
 
 
 class JoinRequestState(int, Enum):
+    ERROR = -1
     NONE = 0
     STARTED = 1
-    ADDED = 2
+    READY = 2  # waiting to be added with the next batch
+    ADDING = 3
+    ADDED = 4
 
 
 class JoinRequestEntry(BaseModel):
@@ -130,6 +144,27 @@ class JoinRequestEntry(BaseModel):
     network: Optional[NetworkConfigModel]
     state: JoinRequestState
     last_seen: dt
+    msg: str = ""
+
+
+class JoinNodeStatusModel(BaseModel):
+    uuid: UUID = Field(title="Joining node's UUID.")
+    hostname: str = Field(title="Joining node's hostname.")
+    address: str = Field(title="Joining node's IP address.")
+    state: JoinRequestState = Field(title="Joining node's state.")
+    msg: str = Field("", title="Error message, if any.")
+    last_seen: dt = Field(title="When we last heard from the node.")
+
+
+# how long we wait for more nodes to be ready before adding them as a batch.
+JOIN_BATCH_WINDOW = 1.0
+# where joining nodes keep the image archive obtained from their peer.
+IMAGE_TMPDIR = "/var/tmp"
+# where we keep the image archive served to joining nodes, while any are.
+IMAGE_CACHE_DIR = "/var/cache/aquarium/images"
+# headers used when serving the container image to joining nodes.
+TOKEN_HEADER = "X-Cluster-Token"
+IMAGE_ID_HEADER = "X-Image-Id"
 
 
 class JoinRequestMgr:
@@ -142,9 +177,10 @@ class JoinRequestMgr:
     _gstate: GlobalState
     _nodemgr: NodeMgr
     _done: bool
-    _session: requests.Session
     _task: Optional[asyncio.Task]
     _progress: Optional[JoinProgress]
+    _tracer: Optional[Tracer]
+    _history: DurationHistory
 
     _progress_bounds: Dict[ProgressEnum, int] = {
         ProgressEnum.START: 0,
@@ -160,9 +196,10 @@ class JoinRequestMgr:
         self._gstate = gstate
         self._nodemgr = nodemgr
         self._done = False
-        self._session = requests.Session()
         self._task = None
         self._progress = None
+        self._tracer = None
+        self._history = DurationHistory(gstate.config)
 
     @property
     def done(self) -> bool:
@@ -179,7 +216,13 @@ class JoinRequestMgr:
     def progress(self) -> JoinProgress:
         if not self._progress:
             return JoinProgress()
-        return self._progress
+        p = self._progress.copy()
+        if self._tracer is not None:
+            p.trace = self._tracer.to_otlp()
+            p.eta = self._history.eta(
+                self._tracer, [e.name.lower() for e in ProgressEnum]
+            )
+        return p
 
     async def wait(self) -> JoinProgress:
         if self._task is not None:
@@ -245,11 +288,22 @@ class JoinRequestMgr:
         self._progress = JoinProgress(
             joined=False, progress=0, error=False, msg=""
         )
+        self._tracer = Tracer("join")
         self._mark_progress(ProgressEnum.START, "Start joining.")
 
-        proto = "https://"
-        if remote.startswith("https://") or remote.startswith("http://"):
-            proto = ""
+        async with JoinClient(remote) as client:
+            await self._join(client, token, addr, hostname, network, storage)
+
+    async def _join(
+        self,
+        client: JoinClient,
+        token: str,
+        addr: str,
+        hostname: str,
+        network: Optional[NetworkConfigModel],
+        storage: List[str],
+    ) -> None:
+        """Join the cluster through the node `client` talks to."""
         params = JoinRequestParamsModel(
             uuid=self._nodemgr.uuid,
             hostname=hostname,
@@ -257,24 +311,11 @@ class JoinRequestMgr:
             token=token,
         )
         try:
-            ep = f"{proto}{remote}/api/deploy/join/request"
-            req = self._session.post(ep, data=params.json())
-        except requests.exceptions.SSLError:
-            self._mark_error("SSL Error.")
-            return
-        except requests.exceptions.ConnectionError:
-            self._mark_error("Unable to connect.")
-            return
-
-        if not req.ok:
-            self._mark_error(req.reason)
-            return
-
-        try:
-            details = JoinRequestReplyModel.parse_raw(req.text)
-        except ValidationError:
-            logger.error(f"Unable to parse response from {remote}.")
-            self._mark_error("Unable to parse response.")
+            details = await client.post(
+                "/api/deploy/join/request", params, JoinRequestReplyModel
+            )
+        except JoinClientError as e:
+            self._mark_error(e.message)
             return
 
         assert details.pubkey
@@ -293,34 +334,30 @@ class JoinRequestMgr:
 
         self._mark_progress(ProgressEnum.CONTAINERS, "Obtaining containers.")
         ctrcfg = self._gstate.config.options.containers
-        try:
-            await container_pull(ctrcfg.registry, ctrcfg.image)
-        except ContainerPullError as e:
-            logger.error(f"Error pulling containers: {e.message}")
-            self._mark_error(e.message)
-            return
+        if not await self._fetch_image(client, token):
+            try:
+                await container_pull(
+                    ctrcfg.registry,
+                    ctrcfg.image,
+                    ctrcfg.secure,
+                    self._mark_pull_progress,
+                )
+            except ContainerPullError as e:
+                logger.error(f"Error pulling containers: {e.message}")
+                self._mark_error(e.message)
+                return
 
         self._mark_progress(ProgressEnum.ADDING, "Ready to join the cluster.")
-        params = JoinReadyParamsModel(uuid=self._nodemgr.uuid)
         try:
-            ep = f"{proto}{remote}/api/deploy/join/ready"
-            req = self._session.post(ep, data=params.json())
-        except requests.exceptions.SSLError:
-            self._mark_error("SSL Error.")
-            return
-        except requests.exceptions.ConnectionError:
-            self._mark_error("Unable to connect.")
-            return
-
-        if not req.ok:
-            self._mark_error(req.reason)
-            return
-
-        try:
-            ack = JoinReadyReplyModel.parse_raw(req.text)
-        except ValidationError:
-            logger.error(f"Unable to parse ready response from {remote}.")
-            self._mark_error("Unable to parse response.")
+            ack = await client.post(
+                "/api/deploy/join/ready",
+                JoinReadyParamsModel(uuid=self._nodemgr.uuid),
+                JoinReadyReplyModel,
+                # adding the host may take a while, and must not be repeated.
+                idempotent=False,
+            )
+        except JoinClientError as e:
+            self._mark_error(e.message)
             return
 
         if not ack.success:
@@ -329,10 +366,10 @@ class JoinRequestMgr:
             return
 
         self._mark_progress(ProgressEnum.JOINING, "Joining the system.")
-        orch = Orchestrator(self._gstate.ceph_mgr)
+        waiter = self._gstate.orch_waiter
         try:
-            await asyncio.wait_for(orch.wait_host_added(hostname), 30.0)
-        except TimeoutError:
+            await waiter.wait_host_added(hostname, timeout=30.0)
+        except asyncio.TimeoutError:
             logger.error("Timeout waiting for host added to cluster.")
             self._mark_error("Unable to join: timed out.")
             return
@@ -342,9 +379,9 @@ class JoinRequestMgr:
         )
         logger.debug(f"Assimilating storage devices: {storage}")
         try:
+            orch = Orchestrator(self._gstate.ceph_mgr)
             orch.assimilate_devices(hostname, storage)
-            while not orch.devices_assimilated(hostname, storage):
-                await asyncio.sleep(1.0)
+            await waiter.wait_devices_assimilated(hostname, storage)
         except CephCommandError as e:
             logger.error(f"Failed assimilating devices: {e.message}")
             self._mark_error("Failed assimilating storage devices.")
@@ -352,6 +389,7 @@ class JoinRequestMgr:
 
         self._mark_progress(ProgressEnum.DONE, "Joined.")
         self._done = True
+        assert self._progress is not None
         self._progress.joined = True
 
     async def _prepare_node(
@@ -403,6 +441,39 @@ class JoinRequestMgr:
             logger.error(msg)
             raise JoinError(msg)
 
+    async def _fetch_image(self, client: JoinClient, token: str) -> bool:
+        """
+        Obtain the container image from the node we are joining through, over
+        the local network, rather than pulling it from the registry. Returns
+        False if that's not possible, in which case we should pull instead.
+        """
+        ctrcfg = self._gstate.config.options.containers
+        ref = f"{ctrcfg.registry}/{ctrcfg.image}"
+        try:
+            with tempfile.TemporaryDirectory(
+                prefix="aquarium-", dir=IMAGE_TMPDIR
+            ) as tmpdir:
+                path = Path(tmpdir).joinpath("image.tar")
+                headers = await client.download(
+                    "/api/deploy/image", path, {TOKEN_HEADER: token}
+                )
+                expected = headers.get(IMAGE_ID_HEADER)
+                if expected is None:
+                    logger.error(f"Image {ref} from peer has no ID.")
+                    return False
+                await image_load(path)
+            if await image_id(ref) != expected:
+                logger.error(f"Image {ref} from peer has an unexpected ID.")
+                return False
+        except (JoinClientError, ContainerError) as e:
+            logger.info(f"Unable to obtain image from peer: {e.message}")
+            return False
+        except OSError as e:
+            logger.info(f"Unable to obtain image from peer: {str(e)}")
+            return False
+        logger.info(f"Obtained image {ref} from peer.")
+        return True
+
     def _write_keys(self, pubkey: str, keyring: str, cephconf: str) -> None:
         authorized_keys = Path("/root/.ssh/authorized_keys")
         authorized_keys.parent.mkdir(exist_ok=True, parents=True, mode=0o700)
@@ -425,6 +496,17 @@ class JoinRequestMgr:
         value: int = self._progress_bounds[stage]
         self._progress.progress = value
         self._progress.msg = msg
+        assert self._tracer is not None
+        if stage == ProgressEnum.DONE:
+            self._tracer.finish()
+            self._history.record(self._tracer)
+        else:
+            self._tracer.stage(stage.name.lower())
+
+    def _mark_pull_progress(self, pull: PullProgressModel) -> None:
+        """Mark progress pulling the container image."""
+        assert self._progress is not None
+        self._progress.pull = pull
 
     def _mark_error(self, msg: str) -> None:
         """Mark progress error."""
@@ -434,6 +516,8 @@ class JoinRequestMgr:
         self._progress.msg = msg
         self._progress.joined = False
         self._progress.progress = 0
+        if self._tracer is not None:
+            self._tracer.finish(error=True)
 
 
 class JoinHandlerMgr:
@@ -441,23 +525,94 @@ class JoinHandlerMgr:
     Controls the join procedure from the node handling a join request. Can only
     happen if the node handling the join has been installed and is
     participating in the cluster.
+
+    Nodes becoming ready within a short window of each other are added to the
+    cluster as a batch: hosts are added concurrently, and the cluster's crush
+    ruleset and pool sizes are reconciled once per batch.
     """
 
     _requests: Dict[UUID, JoinRequestEntry]
     _gstate: GlobalState
+    _pending: Dict[UUID, "asyncio.Future[None]"]
+    _batch_task: Optional[asyncio.Task]
+    _images: ImageExporter
+    _export_task: Optional[asyncio.Task]
 
     def __init__(self, gstate: GlobalState) -> None:
         self._requests = {}
         self._gstate = gstate
+        self._pending = {}
+        self._batch_task = None
+        self._images = ImageExporter(Path(IMAGE_CACHE_DIR))
+        self._export_task = None
 
-    def prune(self) -> None:
+    async def prune(self) -> None:
         now = dt.utcnow()
-        for uuid, entry in self._requests.items():
+        for uuid, entry in list(self._requests.items()):
+            if uuid in self._pending:
+                continue
             delta = now - entry.last_seen
-            if delta.seconds > 300:  # 5 minutes
+            if delta.total_seconds() > 300:  # 5 minutes
                 logger.info(f"Pruning join request for node '{uuid}'")
                 del self._requests[uuid]
 
+        # the image archive is only needed while nodes are joining.
+        if not any(
+            JoinRequestState.NONE < entry.state < JoinRequestState.ADDED
+            for entry in self._requests.values()
+        ):
+            await self._images.clear()
+
+    async def shutdown(self) -> None:
+        if self._export_task is not None:
+            self._export_task.cancel()
+        await self._images.clear()
+
+    def get_status(self) -> List[JoinNodeStatusModel]:
+        """Obtain the state of each node we know to be joining."""
+        return [
+            JoinNodeStatusModel(
+                uuid=uuid,
+                hostname=entry.hostname,
+                address=entry.address,
+                state=entry.state,
+                msg=entry.msg,
+                last_seen=entry.last_seen,
+            )
+            for uuid, entry in self._requests.items()
+        ]
+
+    async def _check_token(self, token: str) -> None:
+        store: KV = self._gstate.store
+        cluster_token = await store.get("/nodes/token")
+        assert cluster_token is not None and len(cluster_token) > 0
+
+        if token != cluster_token:
+            raise BadTokenError()
+
+    async def get_image(self, token: str) -> ImageArchiveModel:
+        """
+        Obtain an archive of the cluster's container image, to be served to a
+        joining node.
+        """
+        await self._check_token(token)
+        ctrcfg = self._gstate.config.options.containers
+        ref = f"{ctrcfg.registry}/{ctrcfg.image}"
+        try:
+            return await self._images.get(ref)
+        except ContainerError as e:
+            logger.error(f"Unable to export image {ref}: {e.message}")
+            raise JoinError("Unable to export container image.")
+
+    async def _export_image(self) -> None:
+        """Export the image ahead of the joining node asking for it."""
+        ctrcfg = self._gstate.config.options.containers
+        ref = f"{ctrcfg.registry}/{ctrcfg.image}"
+        try:
+            await self._images.get(ref)
+        except ContainerError as e:
+            logger.error(f"Unable to export image {ref}: {e.message}")
+
     async def handle_request(
         self, uuid: UUID, hostname: str, addr: str, token: str
     ) -> JoinRequestReplyModel:
@@ -467,12 +622,7 @@ class JoinHandlerMgr:
         assert addr
         assert token
 
-        store: KV = self._gstate.store
-        cluster_token = await store.get("/nodes/token")
-        assert cluster_token is not None and len(cluster_token) > 0
-
-        if token != cluster_token:
-            raise BadTokenError()
+        await self._check_token(token)
 
         # Node might have died before finishing joining the cluster.
         # Check whether we finished the join, and refuse if so.
@@ -513,6 +663,10 @@ class JoinHandlerMgr:
             state=JoinRequestState.STARTED,
             last_seen=dt.utcnow(),
         )
+        # exporting takes a while, so have the image ready by the time the
+        # node asks for it.
+        if self._export_task is None or self._export_task.done():
+            self._export_task = asyncio.create_task(self._export_image())
 
         return JoinRequestReplyModel(
             pubkey=pubkey, cephconf=cephconf, keyring=keyring
@@ -521,7 +675,8 @@ class JoinHandlerMgr:
     async def handle_ready(self, uuid: UUID) -> None:
         """
         Handle Ready Request from a node with given UUID. If we know about
-        the node, we will finish their join process.
+        the node, we will finish their join process, returning once the node
+        has been added to the cluster.
         """
         if uuid not in self._requests:
             raise NotJoiningError(
@@ -529,43 +684,106 @@ class JoinHandlerMgr:
             )
 
         req = self._requests[uuid]
+        req.last_seen = dt.utcnow()
+        if req.state == JoinRequestState.ADDED:
+            return
+
+        fut = self._pending.get(uuid)
+        if fut is None:
+            if self._host_added(req):
+                # Host has already been added, this is a no-op.
+                req.state = JoinRequestState.ADDED
+                return
+            fut = asyncio.get_event_loop().create_future()
+            self._pending[uuid] = fut
+            req.state = JoinRequestState.READY
+            req.msg = ""
+            if self._batch_task is None or self._batch_task.done():
+                self._batch_task = asyncio.create_task(self._batch_main())
+
+        # a node retrying shouldn't cancel the batch for everyone else.
+        await asyncio.shield(fut)
+
+    def _host_added(self, req: JoinRequestEntry) -> bool:
         orch = Orchestrator(self._gstate.ceph_mgr)
-        exists = True
-        addr = None
         try:
             addr = orch.get_host_addr(req.hostname)
-        except UnknownHostError as e:
-            exists = False
+        except UnknownHostError:
+            return False
         except Exception as e:
             logger.error(f"Error checking whether host exists: {str(e)}")
             raise JoinError("Unable to check whether host exists.")
 
-        if exists:
-            assert addr is not None
-            if addr == req.address:
-                # Host has already been added, this is a no-op.
-                return
-            else:
-                raise HostnameExistsError(
-                    "Host exists with a different address."
+        if addr != req.address:
+            raise HostnameExistsError("Host exists with a different address.")
+        return True
+
+    async def _batch_main(self) -> None:
+        while self._pending:
+            await asyncio.sleep(JOIN_BATCH_WINDOW)
+            batch = self._pending
+            self._pending = {}
+            try:
+                await self._add_batch(batch)
+            except Exception as e:
+                logger.exception(f"Error adding batch of hosts: {str(e)}")
+                for fut in batch.values():
+                    if not fut.done():
+                        fut.set_exception(
+                            JoinError("Unable to add host to cluster.")
+                        )
+
+    async def _add_batch(
+        self, batch: Dict[UUID, "asyncio.Future[None]"]
+    ) -> None:
+        """Add a batch of hosts concurrently, then reconcile the cluster."""
+        loop = asyncio.get_event_loop()
+        orch = Orchestrator(self._gstate.ceph_mgr)
+        entries = [(self._requests[uuid], fut) for uuid, fut in batch.items()]
+        logger.info(f"Adding {len(entries)} hosts to cluster.")
+
+        for req, _ in entries:
+            req.state = JoinRequestState.ADDING
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    None, orch.host_add, req.hostname, req.address
                 )
+                for req, _ in entries
+            ],
+            return_exceptions=True,
+        )
 
-        if not orch.host_add(req.hostname, req.address):
+        added: List["asyncio.Future[None]"] = []
+        for (req, fut), res in zip(entries, results):
+            if res is True:
+                req.state = JoinRequestState.ADDED
+                added.append(fut)
+                continue
             logger.error(
                 f"Error adding host '{req.hostname}' with address "
-                "'{req.address} to cluster."
+                f"'{req.address}' to cluster: {res}"
             )
-            raise JoinError("Unable to add host to cluster.")
+            req.state = JoinRequestState.ERROR
+            req.msg = "Unable to add host to cluster."
+            fut.set_exception(JoinError(req.msg))
+
+        if len(added) > 0:
+            await loop.run_in_executor(None, self._reconcile)
+        for fut in added:
+            fut.set_result(None)
 
+    def _reconcile(self) -> None:
+        """Adjust the cluster to its new number of hosts."""
         mon = self._gstate.ceph_mon
         if not mon.set_replicated_ruleset():
             logger.error(
                 "Unable to set replicated ruleset for multi-node cluster."
             )
             return
-        await self._set_pool_default_size()
+        self._set_pool_default_size()
 
-    async def _set_pool_default_size(self) -> None:
+    def _set_pool_default_size(self) -> None:
         """reset the osd pool default size"""
 
         def get_target_size():
@@ -588,8 +806,9 @@ class JoinHandlerMgr:
             logger.error(f"unable to {msg}")
             return
 
-        logger.info(msg)
-        mon.set_pool_default_size(target_size)
+        if current_size != target_size:
+            logger.info(msg)
+            mon.set_pool_default_size(target_size)
 
         for pool in mon.get_pools():  # all pools
             msg = (
@@ -603,6 +822,8 @@ class JoinHandlerMgr:
                 reason = "reason: pool is user defined"
                 logger.debug(f"skipping {msg} {reason}")
                 continue
+            elif pool.size == target_size:
+                continue
 
             logger.info(msg)
             mon.set_pool_size(pool.pool_name, target_size)
@@ -18,13 +18,14 @@ from enum import Enum
 from json import JSONDecodeError
 from logging import Logger
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from fastapi.logger import logger as fastapi_logger
 from pydantic import BaseModel, Field
 from pydantic.error_wrappers import ValidationError
 
+from gravel.controllers.containers import ImageArchiveModel, PullProgressModel
 from gravel.controllers.deployment.create import (
     AlreadyCreatingError,
     ContainerConfig,
@@ -37,17 +38,19 @@ from gravel.controllers.deployment.join import (
     AlreadyJoinedError,
     AlreadyJoiningError,
     JoinHandlerMgr,
+    JoinNodeStatusModel,
     JoinRequestMgr,
     JoinRequestReplyModel,
 )
 from gravel.controllers.errors import GravelError
+from gravel.controllers.events import EventBus
 from gravel.controllers.gstate import GlobalState
 from gravel.controllers.inventory.disks import DiskDevice, get_storage_devices
 from gravel.controllers.kv import KV
 from gravel.controllers.nodes.mgr import NodeMgr
 from gravel.controllers.nodes.requirements import (
+    RequirementsCache,
     RequirementsModel,
-    localhost_qualified,
 )
 from gravel.controllers.nodes.systemdisk import (
     MountError,
@@ -122,6 +125,13 @@ class DeploymentProgressModel(BaseModel):
     )
     value: int = Field(0, title="Current progress percentage.")
     msg: str = Field("", title="Current progress message.")
+    pull: Optional[PullProgressModel] = Field(
+        None, title="Container image pull progress."
+    )
+    eta: Optional[float] = Field(None, title="Estimated seconds remaining.")
+    trace: Dict[str, Any] = Field(
+        {}, title="Per-stage trace, in OTLP/JSON format."
+    )
 
 
 class DeploymentStatusModel(BaseModel):
@@ -198,6 +208,8 @@ class DeploymentMgr:
     _creator: Optional[DeploymentCreator]
     _join_handler: Optional[JoinHandlerMgr]
     _join_requester: Optional[JoinRequestMgr]
+    _requirements: RequirementsCache
+    events: EventBus
 
     def __init__(self) -> None:
         self._init_state = InitStateEnum.NONE
@@ -215,6 +227,10 @@ class DeploymentMgr:
         self._creator = None
         self._join_handler = None
         self._join_requester = None
+        self._requirements = RequirementsCache()
+        # Deployment happens before we have a global state, and its status is
+        # available without authentication, so it has its own bus.
+        self.events = EventBus()
 
     @property
     def installed(self) -> bool:
@@ -296,10 +312,11 @@ class DeploymentMgr:
                     self._deployment_state = DeploymentStateEnum.ERROR
 
             if self._join_handler is not None:
-                self._join_handler.prune()
+                await self._join_handler.prune()
             elif self.deployed:
                 await self._start_join_handler()
 
+            self.events.publish("deploy-status", self.get_status())
             await asyncio.sleep(1.0)
         logger.debug("Main task done.")
 
@@ -338,7 +355,8 @@ class DeploymentMgr:
     async def _stop_join_handler(self) -> None:
         if self._join_handler is None:
             return
-        pass
+        await self._join_handler.shutdown()
+        self._join_handler = None
 
     async def shutdown(self) -> None:
         await self.stop_main_task()
@@ -438,6 +456,7 @@ class DeploymentMgr:
         self._gstate = gstate
         self._nodemgr = nodemgr
         self._postinited = True
+        asyncio.create_task(self._requirements.watch(gstate.inventory))
 
         if self._deployment_state == DeploymentStateEnum.DEPLOYED:
             self._mark_deployed()
@@ -457,6 +476,9 @@ class DeploymentMgr:
                 type=DeploymentTypeEnum.CREATE,
                 value=create.progress,
                 msg=create.msg,
+                pull=create.pull,
+                eta=create.eta,
+                trace=create.trace,
             )
         elif self._join_requester is not None:
             joiner = self._join_requester.progress
@@ -464,6 +486,9 @@ class DeploymentMgr:
                 type=DeploymentTypeEnum.JOIN,
                 value=joiner.progress,
                 msg=joiner.msg,
+                pull=joiner.pull,
+                eta=joiner.eta,
+                trace=joiner.trace,
             )
 
     def get_status(self) -> DeploymentStatusModel:
@@ -479,7 +504,7 @@ class DeploymentMgr:
 
     async def get_requirements(self) -> RequirementsModel:
         """Obtain node requirements."""
-        return await localhost_qualified()
+        return await self._requirements.get()
 
     async def get_devices(self) -> List[DiskDevice]:
         """Obtain storage devices."""
@@ -524,6 +549,8 @@ class DeploymentMgr:
         except Exception as e:
             error.code = DeploymentErrorEnum.UNKNOWN_ERROR
             error.msg = f"Unknown error: {str(e)}"
+        # the device may be in use now, whether or not we succeeded.
+        self._requirements.invalidate()
         if error.code > DeploymentErrorEnum.NONE:
             self._deployment_state = DeploymentStateEnum.NONE
             return error
@@ -651,6 +678,12 @@ class DeploymentMgr:
             uuid, hostname, addr, token
         )
 
+    async def get_join_image(self, token: str) -> ImageArchiveModel:
+        """Obtain the container image archive, for a joining node."""
+        if self._join_handler is None:
+            raise NotReadyYetError("Node has not been deployed.")
+        return await self._join_handler.get_image(token)
+
     async def handle_join_ready(self, uuid: UUID) -> None:
         """
         Handle a request stating a joining node is ready to be added to
@@ -661,3 +694,9 @@ class DeploymentMgr:
 
         # let the caller handle raised exceptions
         return await self._join_handler.handle_ready(uuid)
+
+    def get_join_status(self) -> List[JoinNodeStatusModel]:
+        """Obtain the state of nodes joining the cluster through us."""
+        if self._join_handler is None:
+            raise NotReadyYetError("Node has not been deployed.")
+        return self._join_handler.get_status()
@@ -0,0 +1,180 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Runs deployment steps as a dependency graph. Each stage starts as soon as the
+stages it depends on have finished, so independent steps (e.g., pulling the
+container image and configuring NTP) run concurrently. The first failing stage
+aborts the pipeline.
+"""
+
+import asyncio
+import time
+from enum import Enum
+from logging import Logger
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
+
+from gravel.controllers.errors import GravelError
+
+logger: Logger = fastapi_logger
+
+
+StageFunc = Callable[[], Awaitable[None]]
+
+
+class PipelineError(GravelError):
+    pass
+
+
+class StageStateEnum(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    ERROR = "error"
+    SKIPPED = "skipped"
+
+
+class StageStatusModel(BaseModel):
+    name: str = Field(title="Stage name.")
+    state: StageStateEnum = Field(StageStateEnum.PENDING, title="Stage state.")
+    deps: List[str] = Field([], title="Stages this stage depends on.")
+    started: float = Field(0.0, title="Unix time stamp of stage start.")
+    duration: float = Field(0.0, title="Seconds taken by the stage.")
+
+
+class _Stage:
+    status: StageStatusModel
+
+    def __init__(self, name: str, func: StageFunc, deps: List[str]) -> None:
+        self.func: StageFunc = func
+        self.status = StageStatusModel(name=name, deps=deps)
+
+
+class Pipeline:
+    """A set of stages, each run once all its dependencies are done."""
+
+    _stages: Dict[str, _Stage]
+
+    def __init__(self) -> None:
+        self._stages = {}
+
+    def add(
+        self, name: str, func: StageFunc, deps: Optional[List[str]] = None
+    ) -> None:
+        if name in self._stages:
+            raise PipelineError(f"Stage '{name}' already exists.")
+        self._stages[name] = _Stage(name, func, deps if deps else [])
+
+    @property
+    def stages(self) -> List[StageStatusModel]:
+        return [s.status.copy() for s in self._stages.values()]
+
+    def _validate(self) -> None:
+        """Ensure dependencies exist and do not form a cycle."""
+        for stage in self._stages.values():
+            for dep in stage.status.deps:
+                if dep not in self._stages:
+                    raise PipelineError(
+                        f"Stage '{stage.status.name}' depends on unknown "
+                        f"stage '{dep}'."
+                    )
+        done: Set[str] = set()
+        remaining = set(self._stages.keys())
+        while remaining:
+            ready = {
+                name
+                for name in remaining
+                if all(d in done for d in self._stages[name].status.deps)
+            }
+            if not ready:
+                raise PipelineError(
+                    f"Dependency cycle between stages: {sorted(remaining)}"
+                )
+            done |= ready
+            remaining -= ready
+
+    async def _run_stage(self, stage: _Stage) -> None:
+        status = stage.status
+        logger.debug(f"pipeline: start stage '{status.name}'")
+        status.state = StageStateEnum.RUNNING
+        status.started = time.time()
+        begin = time.monotonic()
+        try:
+            await stage.func()
+        except asyncio.CancelledError:
+            status.state = StageStateEnum.SKIPPED
+            raise
+        except Exception:
+            status.state = StageStateEnum.ERROR
+            raise
+        finally:
+            status.duration = time.monotonic() - begin
+        status.state = StageStateEnum.DONE
+        logger.debug(
+            f"pipeline: stage '{status.name}' done in {status.duration:.3f}s"
+        )
+
+    async def run(self) -> None:
+        """
+        Run all stages. Should a stage fail, running stages are cancelled,
+        those not yet started are skipped, and the error is raised.
+        """
+        self._validate()
+        done: Set[str] = set()
+        running: Dict[asyncio.Task, str] = {}
+
+        def start_ready() -> None:
+            for name, stage in self._stages.items():
+                if stage.status.state != StageStateEnum.PENDING:
+                    continue
+                if all(d in done for d in stage.status.deps):
+                    task = asyncio.create_task(self._run_stage(stage))
+                    running[task] = name
+                    # mark it now, so we don't start it twice.
+                    stage.status.state = StageStateEnum.RUNNING
+
+        error: Optional[BaseException] = None
+        try:
+            start_ready()
+            while running:
+                finished, _ = await asyncio.wait(
+                    running.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    name = running.pop(task)
+                    exc = task.exception()
+                    if exc is not None:
+                        logger.error(
+                            f"pipeline: stage '{name}' failed: "
+                            f"{type(exc).__name__}"
+                        )
+                        error = error if error is not None else exc
+                    else:
+                        done.add(name)
+                if error is not None:
+                    break
+                start_ready()
+        finally:
+            for task in running.keys():
+                task.cancel()
+            if running:
+                await asyncio.wait(running.keys())
+            for stage in self._stages.values():
+                if stage.status.state == StageStateEnum.PENDING:
+                    stage.status.state = StageStateEnum.SKIPPED
+
+        if error is not None:
+            raise error
@@ -0,0 +1,255 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Traces deployments. Every progress stage of a create or join, and any
+sub-step within, is recorded as a span, so we can tell where a deployment
+spends its time. Traces are exported in OpenTelemetry's OTLP/JSON format,
+ready to be loaded by any compatible tool. Stage durations of successful
+deployments are kept on disk, and used to estimate how long the next one will
+take.
+"""
+
+import secrets
+import time
+from logging import Logger
+from typing import Any, Dict, List, Optional
+
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
+
+from gravel.controllers.config import Config
+
+logger: Logger = fastapi_logger
+
+
+DURATIONS_FILE = "deploy-durations"
+# weight of the latest deployment in a stage's estimated duration.
+DURATIONS_WEIGHT = 0.5
+
+
+class SpanModel(BaseModel):
+    span_id: str = Field(title="Span identifier.")
+    parent_id: Optional[str] = Field(None, title="Parent span identifier.")
+    name: str = Field(title="Span name.")
+    start: float = Field(title="Unix time stamp of span start.")
+    end: Optional[float] = Field(None, title="Unix time stamp of span end.")
+    error: bool = Field(False, title="Whether the span ended in error.")
+    attributes: Dict[str, str] = Field({}, title="Span attributes.")
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.time()
+        return max(0.0, end - self.start)
+
+
+class DurationsModel(BaseModel):
+    flows: Dict[str, Dict[str, float]] = Field(
+        {}, title="Estimated stage durations, in seconds, by flow."
+    )
+
+
+def _ns(ts: float) -> str:
+    # OTLP/JSON encodes 64 bit integers as strings.
+    return str(int(ts * 1e9))
+
+
+class Tracer:
+    """
+    Traces a deployment flow. The flow is the root span; stages are
+    sequential children of the root, and steps are sequential children of the
+    current stage. Spans not fitting that shape can be added with `add()`.
+    """
+
+    _flow: str
+    _trace_id: str
+    _spans: List[SpanModel]
+    _root: SpanModel
+    _stage: Optional[SpanModel]
+    _step: Optional[SpanModel]
+
+    def __init__(self, flow: str) -> None:
+        self._flow = flow
+        self._trace_id = secrets.token_hex(16)
+        self._spans = []
+        self._root = self._start(flow, None)
+        self._stage = None
+        self._step = None
+
+    @property
+    def flow(self) -> str:
+        return self._flow
+
+    @property
+    def finished(self) -> bool:
+        return self._root.end is not None
+
+    @property
+    def current_stage(self) -> Optional[SpanModel]:
+        return self._stage
+
+    def _start(
+        self, name: str, parent: Optional[SpanModel], start: float = 0.0
+    ) -> SpanModel:
+        span = SpanModel(
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent is not None else None,
+            name=name,
+            start=start if start > 0.0 else time.time(),
+        )
+        self._spans.append(span)
+        return span
+
+    def _end(self, span: Optional[SpanModel], error: bool = False) -> None:
+        if span is None or span.end is not None:
+            return
+        span.end = time.time()
+        span.error = error
+
+    def stage(self, name: str) -> None:
+        """End the current stage, if any, and start a new one."""
+        if self.finished:
+            return
+        self._end(self._step)
+        self._end(self._stage)
+        self._step = None
+        self._stage = self._start(name, self._root)
+
+    def step(self, name: str) -> None:
+        """End the current stage's step, if any, and start a new one."""
+        if self.finished or self._stage is None:
+            return
+        self._end(self._step)
+        self._step = self._start(name, self._stage)
+
+    def add(
+        self, name: str, start: float, duration: float, error: bool = False
+    ) -> None:
+        """Add an already finished span to the current stage."""
+        parent = self._stage if self._stage is not None else self._root
+        span = self._start(name, parent, start)
+        span.end = start + duration
+        span.error = error
+
+    def finish(self, error: bool = False) -> None:
+        """End all open spans."""
+        self._end(self._step, error)
+        self._end(self._stage, error)
+        self._end(self._root, error)
+
+    def stages(self) -> List[SpanModel]:
+        return [
+            s.copy() for s in self._spans if s.parent_id == self._root.span_id
+        ]
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Export as an OTLP/JSON `TracesData` message."""
+
+        def attr(key: str, value: str) -> Dict[str, Any]:
+            return {"key": key, "value": {"stringValue": value}}
+
+        spans: List[Dict[str, Any]] = []
+        for s in self._spans:
+            span: Dict[str, Any] = {
+                "traceId": self._trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": _ns(s.start),
+                "endTimeUnixNano": _ns(s.end) if s.end is not None else "0",
+                "attributes": [attr(k, v) for k, v in s.attributes.items()],
+                # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+                "status": {"code": 2 if s.error else 0},
+            }
+            if s.parent_id is not None:
+                span["parentSpanId"] = s.parent_id
+            spans.append(span)
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [attr("service.name", "aquarium")]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "gravel.deployment"},
+                            "spans": spans,
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+class DurationHistory:
+    """
+    Estimated stage durations for each deployment flow, learnt from
+    successful deployments and persisted in the config directory.
+    """
+
+    _config: Config
+    _durations: DurationsModel
+
+    def __init__(self, config: Config) -> None:
+        self._config = config
+        try:
+            self._durations = config.read_model(DURATIONS_FILE, DurationsModel)
+        except FileNotFoundError:
+            self._durations = DurationsModel()
+        except Exception as e:
+            logger.error(f"Unable to read deployment durations: {str(e)}")
+            self._durations = DurationsModel()
+
+    def get(self, flow: str) -> Dict[str, float]:
+        return dict(self._durations.flows.get(flow, {}))
+
+    def record(self, tracer: Tracer) -> None:
+        """Learn from a successfully finished deployment."""
+        assert tracer.finished
+        known = self._durations.flows.setdefault(tracer.flow, {})
+        for stage in tracer.stages():
+            prev = known.get(stage.name)
+            if prev is None:
+                known[stage.name] = stage.duration
+            else:
+                known[stage.name] = (
+                    DURATIONS_WEIGHT * stage.duration
+                    + (1 - DURATIONS_WEIGHT) * prev
+                )
+        try:
+            self._config.write_model(DURATIONS_FILE, self._durations)
+        except Exception as e:
+            logger.error(f"Unable to write deployment durations: {str(e)}")
+
+    def eta(self, tracer: Tracer, stages: List[str]) -> Optional[float]:
+        """
+        Estimated seconds left for a flow going through `stages`, in order.
+        None if we have never seen a successful deployment of this flow.
+        """
+        known = self._durations.flows.get(tracer.flow)
+        if not known:
+            return None
+        if tracer.finished:
+            return 0.0
+
+        current = tracer.current_stage
+        remaining = stages
+        eta = 0.0
+        if current is not None and current.name in stages:
+            idx = stages.index(current.name)
+            remaining = stages[idx + 1 :]
+            eta += max(0.0, known.get(current.name, 0.0) - current.duration)
+        for name in remaining:
+            eta += known.get(name, 0.0)
+        return eta
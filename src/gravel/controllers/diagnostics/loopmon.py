@@ -0,0 +1,268 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Keeps an eye on the event loop. A lot of what we do still blocks the loop
+(rados calls, bcrypt, file parsing, etc.), and when that happens every other
+request is stalled with it. The monitor measures how late the loop is in
+waking up a sleeping task, and a watchdog thread samples the loop thread's
+stack while it is stuck, so we know *what* is blocking it.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from logging import Logger
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
+
+from gravel.controllers.config import LoopMonitorOptionsModel
+
+logger: Logger = fastapi_logger
+
+
+# how many frames we keep from a sampled stack, innermost last.
+MAX_STACK_DEPTH = 16
+# how many distinct stacks we keep track of.
+MAX_STALL_SOURCES = 256
+
+
+def get_stack(
+    frame: Optional[FrameType], depth: int = MAX_STACK_DEPTH
+) -> List[str]:
+    """Obtain a printable stack, outermost frame first."""
+    if frame is None:
+        return []
+    stack = traceback.extract_stack(frame)[-depth:]
+    return [f"{fs.name} ({fs.filename}:{fs.lineno})" for fs in stack]
+
+
+def get_thread_stack(thread_id: int, depth: int = MAX_STACK_DEPTH) -> List[str]:
+    """Obtain the current stack of the thread with the given id."""
+    # pyright: reportPrivateUsage=false
+    return get_stack(sys._current_frames().get(thread_id), depth)
+
+
+class StallSourceModel(BaseModel):
+    stack: List[str] = Field([], title="Sampled stack, outermost first.")
+    samples: int = Field(0, title="Number of times the stack was sampled.")
+
+
+class SlowCallbackModel(BaseModel):
+    callback: str = Field(title="Description of the slow callback.")
+    count: int = Field(0, title="Number of times it was found to be slow.")
+    max_duration: float = Field(0.0, title="Longest run, in seconds.")
+
+
+class LoopStatsModel(BaseModel):
+    interval: float = Field(title="Measuring interval, in seconds.")
+    threshold: float = Field(title="Lag considered a stall, in seconds.")
+    lag: float = Field(0.0, title="Last measured lag, in seconds.")
+    max_lag: float = Field(0.0, title="Maximum measured lag, in seconds.")
+    avg_lag: float = Field(0.0, title="Average measured lag, in seconds.")
+    stalls: int = Field(0, title="Number of stalls observed.")
+    top_stalls: List[StallSourceModel] = Field(
+        [], title="Most sampled stacks while the loop was stalled."
+    )
+    slow_callbacks: List[SlowCallbackModel] = Field(
+        [], title="Slowest callbacks, as reported by asyncio in debug mode."
+    )
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """
+    asyncio reports callbacks taking longer than `slow_callback_duration`
+    through its logger, when running in debug mode. Collect those.
+    """
+
+    def __init__(self, monitor: "LoopMonitor") -> None:
+        super().__init__(logging.WARNING)
+        self._monitor = monitor
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # asyncio's message is "Executing %s took %.3f seconds"
+        if (
+            not isinstance(record.msg, str)
+            or not record.msg.startswith("Executing")
+            or not isinstance(record.args, tuple)
+            or len(record.args) != 2
+        ):
+            return
+        what, duration = record.args
+        if not isinstance(duration, (int, float)):
+            return
+        self._monitor._record_slow_callback(str(what), float(duration))
+
+
+class LoopMonitor:
+    """Measures event loop lag and records what is stalling it."""
+
+    _config: LoopMonitorOptionsModel
+    _task: Optional[asyncio.Task]
+    _watchdog: Optional[threading.Thread]
+    _stopping: threading.Event
+    _loop_thread_id: int
+    _heartbeat: float
+    _stall_where: Optional[str]
+    _samples: int
+    _total_lag: float
+    _stats: LoopStatsModel
+    _stall_sources: Dict[Tuple[str, ...], int]
+    _slow_callbacks: Dict[str, SlowCallbackModel]
+    _handler: _SlowCallbackHandler
+
+    def __init__(self) -> None:
+        self._config = LoopMonitorOptionsModel()
+        self._task = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stall_where = None
+        self._samples = 0
+        self._total_lag = 0.0
+        self._stats = LoopStatsModel(
+            interval=self._config.interval, threshold=self._config.threshold
+        )
+        self._stall_sources = {}
+        self._slow_callbacks = {}
+        self._handler = _SlowCallbackHandler(self)
+
+    def set_config(self, config: LoopMonitorOptionsModel) -> None:
+        self._config = config
+        self._stats.interval = config.interval
+        self._stats.threshold = config.threshold
+        if self._task is not None:
+            self._setup_loop(asyncio.get_event_loop())
+
+    def _setup_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        loop.slow_callback_duration = self._config.threshold
+        loop.set_debug(self._config.debug)
+
+    def start(self) -> None:
+        """Start monitoring the running event loop."""
+        if self._task is not None:
+            return
+        loop = asyncio.get_event_loop()
+        self._setup_loop(loop)
+        logging.getLogger("asyncio").addHandler(self._handler)
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._monitor())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loopmon", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logging.getLogger("asyncio").removeHandler(self._handler)
+        assert self._watchdog is not None
+        self._watchdog.join()
+        self._watchdog = None
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            interval = self._config.interval
+            self._heartbeat = time.monotonic()
+            before = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - before - interval)
+            self._record_lag(lag)
+
+    def _record_lag(self, lag: float) -> None:
+        self._samples += 1
+        self._total_lag += lag
+        self._stats.lag = lag
+        self._stats.max_lag = max(self._stats.max_lag, lag)
+        self._stats.avg_lag = self._total_lag / self._samples
+        where = self._stall_where
+        self._stall_where = None
+        if lag < self._config.threshold:
+            return
+
+        self._stats.stalls += 1
+        msg = f"event loop stalled for {lag:.3f} seconds"
+        if where is not None:
+            msg += f" at {where}"
+        logger.warning(msg)
+
+    def _watch(self) -> None:
+        """Watchdog thread, samples the loop thread's stack while stalled."""
+        while not self._stopping.wait(self._config.threshold / 2):
+            late = time.monotonic() - self._heartbeat - self._config.interval
+            if late < self._config.threshold:
+                continue
+            stack = get_thread_stack(self._loop_thread_id)
+            if not stack:
+                continue
+            self._record_stall_source(stack)
+            if self._stall_where is None:
+                # keep where we first caught it, for the log.
+                self._stall_where = stack[-1]
+
+    def _record_stall_source(self, stack: List[str]) -> None:
+        key = tuple(stack)
+        if (
+            key not in self._stall_sources
+            and len(self._stall_sources) >= MAX_STALL_SOURCES
+        ):
+            # forget the least sampled stack to make room.
+            least = min(
+                self._stall_sources, key=lambda k: self._stall_sources[k]
+            )
+            del self._stall_sources[least]
+        self._stall_sources[key] = self._stall_sources.get(key, 0) + 1
+
+    def _record_slow_callback(self, what: str, duration: float) -> None:
+        entry = self._slow_callbacks.get(what)
+        if entry is None:
+            if len(self._slow_callbacks) >= MAX_STALL_SOURCES:
+                return
+            entry = SlowCallbackModel(callback=what)
+            self._slow_callbacks[what] = entry
+        entry.count += 1
+        entry.max_duration = max(entry.max_duration, duration)
+
+    def stats(self, top: int = 10) -> LoopStatsModel:
+        """Obtain current loop statistics, with the `top` stall sources."""
+        stats = self._stats.copy()
+        sources = sorted(
+            self._stall_sources.items(), key=lambda e: e[1], reverse=True
+        )
+        stats.top_stalls = [
+            StallSourceModel(stack=list(stack), samples=samples)
+            for stack, samples in sources[:top]
+        ]
+        stats.slow_callbacks = sorted(
+            self._slow_callbacks.values(),
+            key=lambda e: e.max_duration,
+            reverse=True,
+        )[:top]
+        return stats
@@ -0,0 +1,258 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+On-demand profiling of the running backend. We can't attach a debugger in
+production, so this gives us a statistical CPU sampler and tracemalloc
+snapshots that can be started and inspected through the API. Results are
+provided as collapsed stacks, ready to be fed to `flamegraph.pl` or any
+compatible tool.
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+from logging import Logger
+from typing import Dict, List, Optional
+
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
+
+from gravel.controllers.diagnostics.loopmon import get_stack
+from gravel.controllers.errors import GravelError
+
+logger: Logger = fastapi_logger
+
+
+MAX_PROFILE_DURATION = 300.0  # 5 minutes
+MIN_PROFILE_INTERVAL = 0.001
+MAX_PROFILE_DEPTH = 64
+
+
+class ProfilerError(GravelError):
+    pass
+
+
+class AlreadyProfilingError(ProfilerError):
+    pass
+
+
+class NotProfilingError(ProfilerError):
+    pass
+
+
+class CPUProfileStatusModel(BaseModel):
+    running: bool = Field(False, title="Whether we are currently sampling.")
+    started: float = Field(0.0, title="Unix time stamp of profile start.")
+    elapsed: float = Field(0.0, title="Seconds spent sampling.")
+    duration: float = Field(0.0, title="Maximum duration, in seconds.")
+    interval: float = Field(0.0, title="Sampling interval, in seconds.")
+    samples: int = Field(0, title="Number of samples taken.")
+    stacks: int = Field(0, title="Number of distinct stacks sampled.")
+
+
+class MemoryStatModel(BaseModel):
+    location: str = Field(title="Where memory was allocated.")
+    size: int = Field(title="Currently allocated bytes.")
+    size_diff: int = Field(title="Allocated bytes since the snapshot.")
+    count: int = Field(title="Currently allocated blocks.")
+    count_diff: int = Field(title="Allocated blocks since the snapshot.")
+
+
+class MemoryStatusModel(BaseModel):
+    tracing: bool = Field(False, title="Whether tracemalloc is tracing.")
+    current: int = Field(0, title="Traced memory, in bytes.")
+    peak: int = Field(0, title="Peak traced memory, in bytes.")
+    has_snapshot: bool = Field(False, title="Whether we have a snapshot.")
+
+
+def _collapse(stack: List[str]) -> str:
+    # ';' separates frames in the collapsed format.
+    return ";".join(frame.replace(";", ":") for frame in stack)
+
+
+class CPUProfiler:
+    """
+    Statistical sampler. A thread wakes up every `interval` seconds and
+    records the stacks of every other thread, until stopped or `duration`
+    seconds have passed.
+    """
+
+    _thread: Optional[threading.Thread]
+    _stopping: threading.Event
+    # guards the stacks and status, updated by the sampling thread.
+    _lock: threading.Lock
+    _stacks: Dict[str, int]
+    _status: CPUProfileStatusModel
+
+    def __init__(self) -> None:
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stacks = {}
+        self._status = CPUProfileStatusModel()
+
+    @property
+    def status(self) -> CPUProfileStatusModel:
+        with self._lock:
+            return self._status.copy()
+
+    def start(self, duration: float, interval: float) -> None:
+        if self._status.running:
+            raise AlreadyProfilingError("CPU profile already running.")
+        self._stopping.clear()
+        with self._lock:
+            self._stacks = {}
+            self._status = CPUProfileStatusModel(
+                running=True,
+                started=time.time(),
+                duration=min(max(duration, 0.0), MAX_PROFILE_DURATION),
+                interval=max(interval, MIN_PROFILE_INTERVAL),
+            )
+        logger.info(
+            f"start cpu profile: duration {self._status.duration}s, "
+            f"interval {self._status.interval}s"
+        )
+        self._thread = threading.Thread(
+            target=self._sample, name="cpuprofiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> CPUProfileStatusModel:
+        if self._thread is None:
+            raise NotProfilingError("CPU profile not running.")
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        return self.status
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        names: Dict[int, str] = {}
+        begin = time.monotonic()
+        deadline = begin + self._status.duration
+        while not self._stopping.wait(self._status.interval):
+            now = time.monotonic()
+            if now > deadline:
+                break
+            keys: List[str] = []
+            # pyright: reportPrivateUsage=false
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if tid not in names:
+                    names = {
+                        t.ident: t.name
+                        for t in threading.enumerate()
+                        if t.ident is not None
+                    }
+                thread = f"thread {names.get(tid, tid)}"
+                stack = [thread] + get_stack(frame, MAX_PROFILE_DEPTH)
+                keys.append(_collapse(stack))
+            with self._lock:
+                for key in keys:
+                    self._stacks[key] = self._stacks.get(key, 0) + 1
+                self._status.samples += 1
+                self._status.elapsed = now - begin
+
+        with self._lock:
+            self._status.running = False
+            self._status.stacks = len(self._stacks)
+        logger.info(f"cpu profile done: {self._status.samples} samples")
+
+    def collapsed(self) -> str:
+        """Sampled stacks, in collapsed format."""
+        with self._lock:
+            stacks = list(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+class MemoryProfiler:
+    """
+    Wraps tracemalloc. Taking a snapshot starts tracing, if needed, and
+    later allocations can then be compared against that snapshot.
+    """
+
+    _snapshot: Optional[tracemalloc.Snapshot]
+
+    def __init__(self) -> None:
+        self._snapshot = None
+
+    @property
+    def status(self) -> MemoryStatusModel:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return MemoryStatusModel(
+            tracing=tracing,
+            current=current,
+            peak=peak,
+            has_snapshot=self._snapshot is not None,
+        )
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+
+    def snapshot(self, nframes: int = 25) -> MemoryStatusModel:
+        """Start tracing if needed, and take a new reference snapshot."""
+        if not tracemalloc.is_tracing():
+            logger.info(f"start tracing memory allocations, {nframes} frames")
+            tracemalloc.start(nframes)
+        self._snapshot = self._take_snapshot()
+        return self.status
+
+    def stop(self) -> None:
+        if not tracemalloc.is_tracing():
+            raise NotProfilingError("Not tracing memory allocations.")
+        tracemalloc.stop()
+        self._snapshot = None
+
+    def _diff(self, key_type: str) -> List[tracemalloc.StatisticDiff]:
+        if self._snapshot is None or not tracemalloc.is_tracing():
+            raise NotProfilingError("No memory snapshot available.")
+        return self._take_snapshot().compare_to(self._snapshot, key_type)
+
+    def diff(self, top: int = 25) -> List[MemoryStatModel]:
+        """Allocations since the reference snapshot, by source line."""
+        return [
+            MemoryStatModel(
+                location=f"{stat.traceback[-1].filename}:"
+                f"{stat.traceback[-1].lineno}",
+                size=stat.size,
+                size_diff=stat.size_diff,
+                count=stat.count,
+                count_diff=stat.count_diff,
+            )
+            for stat in self._diff("lineno")[:top]
+        ]
+
+    def collapsed(self) -> str:
+        """Bytes allocated since the snapshot, as collapsed stacks."""
+        lines: List[str] = []
+        for stat in self._diff("traceback"):
+            if stat.size_diff <= 0:
+                continue
+            stack = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+            lines.append(f"{_collapse(stack)} {stat.size_diff}\n")
+        return "".join(lines)
+
+
+class Profiler:
+    cpu: CPUProfiler
+    memory: MemoryProfiler
+
+    def __init__(self) -> None:
+        self.cpu = CPUProfiler()
+        self.memory = MemoryProfiler()
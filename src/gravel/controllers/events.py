@@ -0,0 +1,156 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+In-process publish/subscribe of state updates. Tickers publish their latest
+state on a topic, and streaming clients subscribe to the topics they care
+about, instead of polling the REST API every second. Each update is
+serialised once, regardless of how many subscribers there are, and updates
+that don't change a topic's state are dropped.
+
+An update may come with a delta from the topic's previous state. Subscribers
+are sent the delta whenever they got everything before it, and the full
+state otherwise: upon subscribing, or when they fell behind and the updates
+they missed were coalesced.
+"""
+
+import asyncio
+import json
+from logging import Logger
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.logger import logger as fastapi_logger
+
+logger: Logger = fastapi_logger
+
+
+class Subscription:
+    """
+    A subscriber's view of the bus. Only the latest update per topic is kept
+    until the subscriber gets to it, so a slow subscriber never piles up
+    stale updates.
+    """
+
+    _bus: "EventBus"
+    _topics: Set[str]
+    _pending: Dict[str, str]
+    # topics the subscriber has been sent a state for.
+    _seen: Set[str]
+    _ready: asyncio.Event
+    _closed: bool
+
+    def __init__(self, bus: "EventBus", topics: Iterable[str]) -> None:
+        self._bus = bus
+        self._topics = set(topics)
+        self._pending = {}
+        self._seen = set()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    @property
+    def topics(self) -> Set[str]:
+        return self._topics
+
+    def _push(
+        self, topic: str, payload: str, delta: Optional[str] = None
+    ) -> None:
+        # a delta only applies on top of what the subscriber was last sent.
+        if (
+            delta is not None
+            and topic in self._seen
+            and topic not in self._pending
+        ):
+            payload = delta
+        self._seen.add(topic)
+        self._pending[topic] = payload
+        self._ready.set()
+
+    async def get(
+        self, timeout: Optional[float] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Wait for updates, returning `(topic, payload)` pairs. Returns an empty
+        list if `timeout` seconds pass without updates.
+        """
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        updates = list(self._pending.items())
+        self._pending.clear()
+        self._ready.clear()
+        return updates
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._bus._unsubscribe(self)
+
+
+class EventBus:
+
+    _latest: Dict[str, str]
+    _subscribers: Dict[str, Set[Subscription]]
+
+    def __init__(self) -> None:
+        self._latest = {}
+        self._subscribers = {}
+
+    @property
+    def topics(self) -> List[str]:
+        return list(self._latest.keys())
+
+    def publish(self, topic: str, data: Any, delta: Any = None) -> None:
+        """
+        Publish `data`, anything FastAPI can encode, on `topic`. Should
+        `delta` be provided, it is sent instead to subscribers already holding
+        the previously published state.
+        """
+        payload = json.dumps(jsonable_encoder(data))
+        if self._latest.get(topic) == payload:
+            return
+        self._latest[topic] = payload
+        delta_payload: Optional[str] = None
+        if delta is not None:
+            delta_payload = json.dumps(jsonable_encoder(delta))
+        for sub in self._subscribers.get(topic, set()):
+            sub._push(topic, payload, delta_payload)
+
+    def latest(self, topic: str) -> Optional[str]:
+        return self._latest.get(topic)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        """
+        Subscribe to `topics`. The current state of each topic, if any, is
+        immediately available to the subscriber.
+        """
+        sub = Subscription(self, topics)
+        for topic in sub.topics:
+            self._subscribers.setdefault(topic, set()).add(sub)
+            payload = self._latest.get(topic)
+            if payload is not None:
+                sub._push(topic, payload)
+        logger.debug(f"subscribed to {sub.topics}")
+        return sub
+
+    def _unsubscribe(self, sub: Subscription) -> None:
+        for topic in sub.topics:
+            subs = self._subscribers.get(topic)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[topic]
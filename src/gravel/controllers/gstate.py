@@ -19,16 +19,22 @@ import time
 import typing
 from abc import ABC, abstractmethod
 from logging import Logger
-from typing import Dict
+from typing import Any, Dict, Optional
 
 from fastapi.logger import logger as fastapi_logger
 
 from gravel.cephadm.cephadm import Cephadm
 from gravel.controllers.ceph.ceph import Mgr, Mon
+from gravel.controllers.ceph.waiter import OrchWaiter
 from gravel.controllers.config import Config
+from gravel.controllers.events import EventBus
 from gravel.controllers.kv import KV
+from gravel.controllers.snapshots import SnapshotModel, Snapshots
 
 if typing.TYPE_CHECKING:
+    from gravel.controllers.auth import AuthContext
+    from gravel.controllers.diagnostics.loopmon import LoopMonitor
+    from gravel.controllers.diagnostics.profiler import Profiler
     from gravel.controllers.inventory.inventory import Inventory
     from gravel.controllers.resources.devices import Devices
     from gravel.controllers.resources.network import Network
@@ -92,6 +98,8 @@ class Ticker(ABC):
         self._last_tick: float = 0
         self._tick_interval: float = probe_interval
         self._is_ticking: bool = False
+        self._events: Optional[EventBus] = None
+        self._snapshots: Dict[str, Snapshots] = {}
 
     @abstractmethod
     async def _do_tick(self) -> None:
@@ -121,6 +129,38 @@ class Ticker(ABC):
     def set_tick_interval(self, new_interval: float) -> None:
         self._tick_interval = new_interval
 
+    def set_event_bus(self, events: EventBus) -> None:
+        self._events = events
+
+    def _notify(self, topic: str, data: Any) -> None:
+        """
+        Record our latest state on `topic`, and publish it to subscribers if
+        it changed, as a delta from the previous version to those holding it.
+        """
+        snapshots = self._snapshots.setdefault(topic, Snapshots())
+        if not snapshots.update(data):
+            return
+        if self._events is None:
+            return
+        delta: Optional[SnapshotModel] = None
+        if snapshots.version > 1:
+            delta = snapshots.get(snapshots.version - 1, snapshots.epoch)
+        self._events.publish(topic, snapshots.get(), delta)
+
+    def snapshot(
+        self,
+        topic: str,
+        since: Optional[int] = None,
+        epoch: Optional[str] = None,
+    ) -> SnapshotModel:
+        """
+        Obtain our state on `topic`, as a delta from version `since` of
+        epoch `epoch`.
+        """
+        if topic not in self._snapshots:
+            return SnapshotModel()
+        return self._snapshots[topic].get(since, epoch)
+
 
 class GlobalState:
 
@@ -130,6 +170,8 @@ class GlobalState:
     _kvstore: KV
     _preinited: bool
     _inited: bool
+    events: EventBus
+    auth: AuthContext
     devices: Devices
     status: Status
     inventory: Inventory
@@ -138,6 +180,9 @@ class GlobalState:
     cephadm: Cephadm
     ceph_mgr: Mgr
     ceph_mon: Mon
+    orch_waiter: OrchWaiter
+    loopmon: LoopMonitor
+    profiler: Profiler
 
     def __init__(self, config: Config, kvstore: KV):
         self._config = config
@@ -146,23 +191,36 @@ class GlobalState:
         self._kvstore = kvstore
         self._preinited = False
         self._inited = False
+        self.events = EventBus()
 
     def preinit(self) -> None:
         self._preinited = True
 
     def init(self) -> None:
         self.cephadm.set_config(self._config.options.containers)
+        self.loopmon.set_config(self._config.options.loopmon)
         self._inited = True
 
     @property
     def ready(self) -> bool:
         return self._preinited and self._inited
 
+    def add_auth(self, auth: AuthContext):
+        self.auth = auth
+        self.add_ticker("auth", auth)
+
     def add_cephadm(self, cephadm: Cephadm):
         self.cephadm = cephadm
 
+    def add_loop_monitor(self, loopmon: LoopMonitor):
+        self.loopmon = loopmon
+
+    def add_profiler(self, profiler: Profiler):
+        self.profiler = profiler
+
     def add_ceph_mgr(self, mgr: Mgr):
         self.ceph_mgr = mgr
+        self.orch_waiter = OrchWaiter(mgr)
 
     def add_ceph_mon(self, ceph_mon: Mon):
         self.ceph_mon = ceph_mon
@@ -197,6 +255,7 @@ class GlobalState:
         await self._kvstore.close()
         logger.info("shutdown!")
         await self.tick_task
+        await self.cephadm.shutdown()
 
     async def tick(self) -> None:
         while not self._is_shutting_down:
@@ -220,6 +279,7 @@ class GlobalState:
     def add_ticker(self, desc: str, whom: Ticker) -> None:
         if desc not in self._tickers:
             self._tickers[desc] = whom
+            whom.set_event_bus(self.events)
 
     def rm_ticker(self, desc: str) -> None:
         if desc in self._tickers:
@@ -0,0 +1,112 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from enum import Enum
+from typing import Dict, List, Optional, Set, Tuple, TypeVar
+
+from pydantic import BaseModel, Field
+
+from gravel.cephadm.models import NICModel
+from gravel.controllers.inventory.nodeinfo import NodeInfoModel
+
+
+class ChangeEnum(str, Enum):
+    HOST = "host"
+    DISKS = "disks"
+    NICS = "nics"
+    ADDRESSES = "addresses"
+    LOAD = "load"
+
+
+class InventoryDiffModel(BaseModel):
+    changes: Set[ChangeEnum] = Field(set(), title="Classes of changes.")
+    disks_added: List[str] = Field([], title="Names of added disks.")
+    disks_removed: List[str] = Field([], title="Names of removed disks.")
+    disks_changed: List[str] = Field([], title="Names of changed disks.")
+    nics_added: List[str] = Field([], title="Names of added NICs.")
+    nics_removed: List[str] = Field([], title="Names of removed NICs.")
+    nics_changed: List[str] = Field([], title="NICs with changed properties.")
+    addresses_changed: List[str] = Field(
+        [], title="NICs with changed addresses."
+    )
+
+    @property
+    def changed(self) -> bool:
+        return len(self.changes) > 0
+
+
+T = TypeVar("T")
+
+
+def _diff_keys(
+    old: Dict[str, T], new: Dict[str, T]
+) -> Tuple[List[str], List[str], List[str]]:
+    added = sorted(k for k in new if k not in old)
+    removed = sorted(k for k in old if k not in new)
+    common = sorted(k for k in new if k in old and new[k] != old[k])
+    return added, removed, common
+
+
+def _without_addresses(nic: NICModel) -> NICModel:
+    return nic.copy(update={"ipv4_address": "", "ipv6_address": ""})
+
+
+def diff_nodeinfo(
+    old: Optional[NodeInfoModel], new: NodeInfoModel
+) -> InventoryDiffModel:
+    """
+    Structural diff between two inventory snapshots. Everything in `new` is
+    considered added if there's no `old` snapshot.
+    """
+    diff = InventoryDiffModel()
+    if old is None:
+        diff.changes = set(ChangeEnum)
+        diff.disks_added = sorted(d.name for d in new.disks)
+        diff.nics_added = sorted(new.nics)
+        return diff
+
+    host = ["hostname", "model", "vendor", "kernel", "operating_system"]
+    if any(getattr(old, f) != getattr(new, f) for f in host) or (
+        old.cpu.copy(exclude={"load"}) != new.cpu.copy(exclude={"load"})
+    ):
+        diff.changes.add(ChangeEnum.HOST)
+
+    # 'current_time' and 'system_uptime' change on every probe, so they
+    # don't count as changes; otherwise we'd always be publishing.
+    if old.cpu.load != new.cpu.load or old.memory != new.memory:
+        diff.changes.add(ChangeEnum.LOAD)
+
+    added, removed, changed = _diff_keys(
+        {d.name: d for d in old.disks}, {d.name: d for d in new.disks}
+    )
+    diff.disks_added, diff.disks_removed = added, removed
+    diff.disks_changed = changed
+    if diff.disks_added or diff.disks_removed or diff.disks_changed:
+        diff.changes.add(ChangeEnum.DISKS)
+
+    diff.nics_added, diff.nics_removed, changed = _diff_keys(old.nics, new.nics)
+    for name in changed:
+        before, after = old.nics[name], new.nics[name]
+        if _without_addresses(before) != _without_addresses(after):
+            diff.nics_changed.append(name)
+        if (
+            before.ipv4_address != after.ipv4_address
+            or before.ipv6_address != after.ipv6_address
+        ):
+            diff.addresses_changed.append(name)
+    if diff.nics_added or diff.nics_removed or diff.nics_changed:
+        diff.changes.add(ChangeEnum.NICS)
+    if diff.addresses_changed:
+        diff.changes.add(ChangeEnum.ADDRESSES)
+
+    return diff
@@ -11,18 +11,24 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import asyncio
+import os
 from enum import Enum
 from pathlib import Path
-from typing import Any, Coroutine, List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, Field, validator
 
-from gravel.controllers.utils import HWEntryModel, lshw
-
 # hard coded for now, this should be configurable and a saner value.
 MIN_DISK_SIZE = 10 * 1024 * 1024 * 1024  # 10 GB
 
+SYS_BLOCK_PATH = "/sys/block"
+UDEV_DATA_PATH = "/run/udev/data"
+
+# sysfs sizes are always in 512 byte sectors, regardless of the device.
+SECTOR_SIZE = 512
+# as per include/scsi/scsi_proto.h
+SCSI_TYPE_ROM = "5"
+
 
 class RejectionReasonEnum(int, Enum):
     IN_USE = 1
@@ -56,110 +62,102 @@ class DiskDevice(BaseModel):
     )
 
 
-async def get_hw_storage_devices() -> Union[List[HWEntryModel], None]:
-    async def _get_devices(
-        entry: HWEntryModel,
-    ) -> Union[List[HWEntryModel], None]:
-        if not entry.children or len(entry.children) == 0:
-            return None
-
-        if entry.cls == "storage":
-            return [entry]
-
-        coros: List[Coroutine[Any, Any, Union[List[HWEntryModel], None]]] = []
-        for child in entry.children:
-            coros.append(_get_devices(child))
-
-        ret = await asyncio.gather(*coros)
-        storage: List[HWEntryModel] = []
-        if not ret:
-            return None
-
-        for e in ret:
-            if e is None:
-                continue
-            storage.extend(e)
-
-        return storage
-
-    system = await lshw()
-    return await _get_devices(system)
-
-
-async def _get_sys_rotational(blkname: str) -> bool:
-    path = Path(f"/sys/block/{blkname}/queue/rotational")
-    if not path.exists():
-        raise Exception()
-    return bool(int(path.read_text("utf-8")))
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text("utf-8").strip()
+    except OSError:
+        return None
+
+
+def _read_udev(devnum: Optional[str]) -> Dict[str, str]:
+    """Obtain the properties udev keeps for a block device `major:minor`."""
+    props: Dict[str, str] = {}
+    if devnum is None:
+        return props
+    data = _read(Path(UDEV_DATA_PATH).joinpath(f"b{devnum}"))
+    for line in (data or "").splitlines():
+        if not line.startswith("E:"):
+            continue
+        key, sep, value = line[2:].partition("=")
+        if sep:
+            props[key] = value
+    return props
+
+
+def _is_in_use(sysdir: Path, udev: Dict[str, str]) -> bool:
+    # partitioned, held by device mapper or md, or formatted as a whole.
+    partitions = [
+        p for p in sysdir.iterdir() if p.joinpath("partition").exists()
+    ]
+    holders = sysdir.joinpath("holders")
+    return (
+        len(partitions) > 0
+        or (holders.exists() and any(holders.iterdir()))
+        or "ID_FS_TYPE" in udev
+    )
 
 
 def _get_availability(
-    disk: HWEntryModel,
+    size: int, removable: bool, in_use: bool
 ) -> Tuple[bool, List[RejectionReasonEnum]]:
     reasons: List[RejectionReasonEnum] = []
 
-    if (disk.children is not None and len(disk.children) >= 0) or (
-        disk.capabilities is not None
-        and "lvm2" in disk.capabilities
-        and disk.capabilities["lvm2"] is True
-    ):
+    if in_use:
         reasons.append(RejectionReasonEnum.IN_USE)
 
-    assert disk.size is not None
-    if disk.size < MIN_DISK_SIZE:
+    if size < MIN_DISK_SIZE:
         reasons.append(RejectionReasonEnum.TOO_SMALL)
 
-    if disk.capabilities is not None and "removable" in disk.capabilities:
+    if removable:
         reasons.append(RejectionReasonEnum.REMOVABLE_DEVICE)
 
     available = len(reasons) == 0
     return available, reasons
 
 
-async def _get_disk_device(disk: HWEntryModel) -> DiskDevice:
-    assert disk.cls == "disk" or disk.cls == "volume"
-    assert disk.logicalname is not None
-    assert isinstance(disk.logicalname, str)
-    assert disk.logicalname.startswith("/dev/")
-
-    blkname = disk.logicalname.replace("/dev/", "")
-    available, rejection_reasons = _get_availability(disk)
-    rotational = await _get_sys_rotational(blkname)
-
-    assert disk.units is None or disk.units == "bytes"
+def get_block_device(name: str) -> Optional[DiskDevice]:
+    """
+    Obtain a disk from sysfs and the udev database. Virtual block devices
+    (loop, device mapper, md, etc.) and optical drives are not disks, and
+    `None` is returned for those.
+    """
+    sysdir = Path(SYS_BLOCK_PATH).joinpath(name)
+    device = sysdir.joinpath("device")
+    if not device.exists():
+        return None
+    if _read(device.joinpath("type")) == SCSI_TYPE_ROM:
+        return None
+
+    size = int(_read(sysdir.joinpath("size")) or 0) * SECTOR_SIZE
+    rotational = _read(sysdir.joinpath("queue", "rotational")) == "1"
+    removable = _read(sysdir.joinpath("removable")) == "1"
+    udev = _read_udev(_read(sysdir.joinpath("dev")))
+    available, rejection_reasons = _get_availability(
+        size, removable, _is_in_use(sysdir, udev)
+    )
 
     return DiskDevice(
-        id=disk.id,
-        name=blkname,
-        path=disk.logicalname,
-        product=disk.product,
-        vendor=disk.vendor,
-        size=disk.size,
+        # prefer something that survives renames across reboots.
+        id=udev.get("ID_SERIAL", name),
+        name=name,
+        path=udev.get("DEVNAME", f"/dev/{name}"),
+        product=udev.get("ID_MODEL", _read(device.joinpath("model"))),
+        vendor=udev.get("ID_VENDOR", _read(device.joinpath("vendor"))),
+        size=size,
         rotational=rotational,
         available=available,
         rejected_reasons=rejection_reasons,
     )
 
 
-async def _get_storage_devices(hwdev: HWEntryModel) -> List[DiskDevice]:
-    assert hwdev.cls == "storage"
-    assert hwdev.children is not None and len(hwdev.children) > 0
-
-    coros = [
-        _get_disk_device(disk) for disk in hwdev.children if disk.id != "cdrom"
-    ]
-    return list(await asyncio.gather(*coros))
+def get_block_devices() -> List[DiskDevice]:
+    devs: List[DiskDevice] = []
+    for name in sorted(os.listdir(SYS_BLOCK_PATH)):
+        dev = get_block_device(name)
+        if dev is not None:
+            devs.append(dev)
+    return devs
 
 
 async def get_storage_devices() -> List[DiskDevice]:
-    storage: Union[List[HWEntryModel], None] = await get_hw_storage_devices()
-    if not storage:
-        return []
-
-    coros = [_get_storage_devices(entry) for entry in storage]
-    res = await asyncio.gather(*coros)
-
-    devs: List[DiskDevice] = []
-    for dev in res:
-        devs.extend(dev)
-    return devs
+    return get_block_devices()
@@ -0,0 +1,282 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Host facts, read straight from /proc and /sys. This is what `cephadm
+gather-facts` does too, but without spawning a privileged subprocess on every
+inventory probe just to read a handful of files. Facts that never change while
+we are running (CPU model, vendor, kernel, etc.) are read only once.
+"""
+
+import ipaddress
+import os
+import time
+from glob import glob
+from logging import Logger
+from typing import Dict, List, Optional
+
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel
+
+from gravel.cephadm.models import (
+    NICModel,
+    NodeCPUInfoModel,
+    NodeCPULoadModel,
+    NodeMemoryInfoModel,
+)
+from gravel.controllers.errors import GravelError
+from gravel.controllers.utils import get_ipv4_address as _ipv4_address
+
+logger: Logger = fastapi_logger
+
+
+NIC_PATH = "/sys/class/net"
+DMI_PATH = "/sys/class/dmi/id"
+
+# as per include/uapi/linux/if_arp.h
+NIC_HW_TYPES: Dict[str, str] = {
+    "1": "ethernet",
+    "32": "infiniband",
+    "772": "loopback",
+}
+
+
+class FactsError(GravelError):
+    pass
+
+
+class NodeFactsModel(BaseModel):
+    hostname: str
+    model: str
+    vendor: str
+    kernel: str
+    operating_system: str
+    system_uptime: float
+    current_time: int
+    cpu: NodeCPUInfoModel
+    nics: Dict[str, NICModel]
+    memory: NodeMemoryInfoModel
+
+
+class _StaticFactsModel(BaseModel):
+    model: str
+    vendor: str
+    kernel: str
+    arch: str
+    operating_system: str
+    cpu_model: str
+    cpu_cores: int
+    cpu_count: int
+    cpu_threads: int
+
+
+def _read(path: str, default: str = "") -> str:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def _read_int(path: str, default: int = -1) -> int:
+    try:
+        return int(_read(path))
+    except ValueError:
+        return default
+
+
+def _ipv6_addresses() -> Dict[str, str]:
+    """Obtain each interface's first address, as `addr/prefix`."""
+    addrs: Dict[str, str] = {}
+    for line in _read("/proc/net/if_inet6").splitlines():
+        # address, index, prefix length, scope, flags, name
+        fields = line.split()
+        if len(fields) != 6 or fields[5] in addrs:
+            continue
+        addr = ipaddress.IPv6Address(bytes.fromhex(fields[0]))
+        addrs[fields[5]] = f"{addr}/{int(fields[2], 16)}"
+    return addrs
+
+
+def _links(path: str, prefix: str) -> List[str]:
+    return [
+        os.path.basename(p)[len(prefix) :]
+        for p in glob(os.path.join(path, f"{prefix}*"))
+    ]
+
+
+class FactsCollector:
+    """
+    Collects host facts. Static facts are cached on first collection, and
+    only the cheap, changing bits are read on every call.
+    """
+
+    _static: Optional[_StaticFactsModel]
+
+    def __init__(self) -> None:
+        self._static = None
+
+    def _read_os_release(self) -> str:
+        values: Dict[str, str] = {}
+        for line in _read("/etc/os-release").splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                values[key.strip()] = value.strip().strip("\"'")
+        return values.get("PRETTY_NAME", "Unknown")
+
+    def _read_static(self) -> _StaticFactsModel:
+        # "family (product)", as cephadm does, when we have a family.
+        family = _read(os.path.join(DMI_PATH, "product_family"))
+        product = _read(os.path.join(DMI_PATH, "product_name"))
+        model = product if not family and product else f"{family} ({product})"
+
+        cpu_model = "Unknown"
+        cpu_sockets = set()
+        cpu_cores = 0
+        cpu_threads = 0
+        processors = 0
+        for line in _read("/proc/cpuinfo").splitlines():
+            key, sep, value = line.partition(":")
+            if not sep:
+                continue
+            key, value = key.strip(), value.strip()
+            if key == "processor":
+                processors += 1
+            elif key == "model name":
+                cpu_model = value
+            elif key == "physical id":
+                cpu_sockets.add(value)
+            elif key == "cpu cores":
+                cpu_cores = int(value)
+            elif key == "siblings":
+                cpu_threads = int(value)
+        if processors == 0:
+            raise FactsError("Unable to read CPU information.")
+
+        uname = os.uname()
+        return _StaticFactsModel(
+            model=model,
+            vendor=_read(os.path.join(DMI_PATH, "sys_vendor"), "Unknown"),
+            kernel=uname.release,
+            arch=uname.machine,
+            operating_system=self._read_os_release(),
+            cpu_model=cpu_model,
+            # not all architectures tell us about sockets and cores.
+            cpu_cores=cpu_cores or processors,
+            cpu_count=max(len(cpu_sockets), 1),
+            cpu_threads=cpu_threads or processors,
+        )
+
+    def _read_memory(self) -> NodeMemoryInfoModel:
+        values: Dict[str, int] = {}
+        for line in _read("/proc/meminfo").splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                values[fields[0].rstrip(":")] = int(fields[1])
+        try:
+            return NodeMemoryInfoModel(
+                available_kb=values["MemAvailable"],
+                free_kb=values["MemFree"],
+                total_kb=values["MemTotal"],
+            )
+        except KeyError as e:
+            raise FactsError(f"Unable to read memory information: {e}")
+
+    def _read_load(self) -> NodeCPULoadModel:
+        fields = _read("/proc/loadavg").split()
+        if len(fields) < 3:
+            raise FactsError("Unable to read CPU load.")
+        return NodeCPULoadModel(
+            one_min=float(fields[0]),
+            five_min=float(fields[1]),
+            fifteen_min=float(fields[2]),
+        )
+
+    def _read_uptime(self) -> float:
+        fields = _read("/proc/uptime").split()
+        if not fields:
+            raise FactsError("Unable to read system uptime.")
+        return float(fields[0])
+
+    def _read_nic(self, name: str, ipv6: Dict[str, str]) -> NICModel:
+        path = os.path.join(NIC_PATH, name)
+        driver = ""
+        driver_path = os.path.join(path, "device", "driver")
+        if os.path.exists(driver_path):
+            driver = os.path.basename(os.path.realpath(driver_path))
+
+        if os.path.exists(os.path.join(path, "bridge")):
+            nic_type = "bridge"
+        elif os.path.exists(os.path.join(path, "bonding")):
+            nic_type = "bonding"
+        else:
+            hwtype = _read(os.path.join(path, "type"))
+            nic_type = NIC_HW_TYPES.get(hwtype, "Unknown")
+
+        physical = os.path.exists(os.path.join(path, "device"))
+        return NICModel(
+            driver=driver,
+            iftype="physical" if physical else "logical",
+            ipv4_address=_ipv4_address(name),
+            ipv6_address=ipv6.get(name, ""),
+            lower_devs_list=_links(path, "lower_"),
+            mtu=_read_int(os.path.join(path, "mtu")),
+            nic_type=nic_type,
+            operstate=_read(os.path.join(path, "operstate"), "unknown"),
+            speed=_read_int(os.path.join(path, "speed")),
+            upper_devs_list=_links(path, "upper_"),
+        )
+
+    def _read_nics(self) -> Dict[str, NICModel]:
+        ipv6 = _ipv6_addresses()
+        return {
+            name: self._read_nic(name, ipv6)
+            for name in sorted(os.listdir(NIC_PATH))
+        }
+
+    def read_nic(self, name: str) -> Optional[NICModel]:
+        """Read a single NIC, or `None` if it doesn't exist."""
+        if not os.path.exists(os.path.join(NIC_PATH, name)):
+            return None
+        try:
+            return self._read_nic(name, _ipv6_addresses())
+        except (OSError, ValueError) as e:
+            raise FactsError(f"Unable to read NIC {name}: {e}")
+
+    def collect(self) -> NodeFactsModel:
+        """Collect facts, raising `FactsError` if we can't read them."""
+        try:
+            if self._static is None:
+                self._static = self._read_static()
+            static = self._static
+            return NodeFactsModel(
+                hostname=os.uname().nodename,
+                model=static.model,
+                vendor=static.vendor,
+                kernel=static.kernel,
+                operating_system=static.operating_system,
+                system_uptime=self._read_uptime(),
+                current_time=int(time.time()),
+                cpu=NodeCPUInfoModel(
+                    arch=static.arch,
+                    model=static.cpu_model,
+                    cores=static.cpu_cores,
+                    count=static.cpu_count,
+                    threads=static.cpu_threads,
+                    load=self._read_load(),
+                ),
+                nics=self._read_nics(),
+                memory=self._read_memory(),
+            )
+        except (OSError, ValueError) as e:
+            raise FactsError(f"Unable to collect host facts: {e}")
@@ -13,21 +13,40 @@
 
 from __future__ import annotations
 
+import asyncio
+import os
 import time
 from logging import Logger
-from typing import Awaitable, Callable, List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 
 from fastapi.logger import logger as fastapi_logger
 
 from gravel.cephadm.cephadm import Cephadm
+from gravel.cephadm.models import NICModel
 from gravel.controllers.gstate import GlobalState, Ticker
+from gravel.controllers.inventory.diff import (
+    ChangeEnum,
+    InventoryDiffModel,
+    diff_nodeinfo,
+)
+from gravel.controllers.inventory.disks import DiskDevice, get_block_device
+from gravel.controllers.inventory.facts import FactsCollector, FactsError
 from gravel.controllers.inventory.nodeinfo import NodeInfoModel, get_node_info
-from gravel.controllers.inventory.subscriber import Subscriber
+from gravel.controllers.inventory.subscriber import (
+    Subscriber,
+    SubscriberStatsModel,
+)
+from gravel.controllers.inventory.uevents import UEventListener, UEventModel
 from gravel.controllers.nodes.mgr import NodeMgr
 
 logger: Logger = fastapi_logger
 
 
+# events come in bursts (a disk and all its partitions, etc.), wait for them
+# to settle before refreshing.
+HOTPLUG_SETTLE_TIME = 1.0
+
+
 class Inventory(Ticker):
     """
     Obtain host's inventory. Only runs once the node has been inited.
@@ -36,30 +55,61 @@ class Inventory(Ticker):
     attempt to tick every 1.0 second. Once the first probe is finished, will
     reset its tick interval to the interval provided to the ctor (which will
     likely be the one passed through the config values).
+
+    Once probing, we also listen for the kernel's block and net device events,
+    and refresh only the affected disks and NICs as they happen. In that case
+    full probes are only a safety net, and run at the (longer) hotplug probe
+    interval instead.
+
+    Subscribers are only called back when something they care about changed
+    between consecutive snapshots; see `ChangeEnum`.
     """
 
     _latest: Optional[NodeInfoModel]
+    _last_diff: Optional[InventoryDiffModel]
     _subscribers: List[Subscriber]
+    _retired: List[Subscriber]
     _nodemgr: NodeMgr
     _has_probed_once: bool
     _probe_interval: float
     _gstate: GlobalState
+    _facts: FactsCollector
+    _uevents: UEventListener
+    _hotplug_probe_interval: float
+    _pending_disks: Set[str]
+    _pending_nics: Set[str]
+    _refresh_task: Optional[asyncio.Task]
 
     def __init__(
         self, probe_interval: float, nodemgr: NodeMgr, gstate: GlobalState
     ):
         super().__init__(1.0)
         self._latest = None
+        self._last_diff = None
         self._subscribers = []
+        self._retired = []
         self._nodemgr = nodemgr
         self._has_probed_once = False
         self._probe_interval = probe_interval
         self._gstate = gstate
+        self._facts = FactsCollector()
+        self._uevents = UEventListener(
+            ["block", "net"], self._on_uevent, self._on_uevents_lost
+        )
+        self._hotplug_probe_interval = (
+            gstate.config.options.inventory.hotplug_probe_interval
+        )
+        self._pending_disks = set()
+        self._pending_nics = set()
+        self._refresh_task = None
 
     async def _do_tick(self) -> None:
         await self.probe()
         if not self._has_probed_once:
-            super().set_tick_interval(self._probe_interval)
+            interval = self._probe_interval
+            if self._uevents.start():
+                interval = max(interval, self._hotplug_probe_interval)
+            super().set_tick_interval(interval)
             self._has_probed_once = True
 
     async def _should_tick(self) -> bool:
@@ -68,29 +118,117 @@ class Inventory(Ticker):
     async def probe(self) -> None:
         cephadm: Cephadm = self._gstate.cephadm
         start: int = int(time.monotonic())
-        nodeinfo = await get_node_info(cephadm)
+        nodeinfo = await get_node_info(cephadm, self._facts)
         diff: int = int(time.monotonic()) - start
         log_message = f"probing took {diff} seconds"
         if diff > 30:
             logger.info(log_message)
         else:
             logger.debug(log_message)
+        await self._update(nodeinfo)
+
+    async def _update(self, nodeinfo: NodeInfoModel) -> None:
+        diff = diff_nodeinfo(self._latest, nodeinfo)
         self._latest = nodeinfo
-        await self._publish()
+        self._last_diff = diff
+        if diff.changed:
+            await self._publish(diff)
+
+    async def shutdown(self) -> None:
+        self._uevents.stop()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        for subscriber in self._subscribers + self._retired:
+            subscriber.cancel()
+
+    def _on_uevent(self, event: UEventModel) -> None:
+        if event.subsystem == "block":
+            if event.devtype == "partition":
+                # partitions affect whether their disk is in use.
+                name = os.path.basename(os.path.dirname(event.devpath))
+            else:
+                name = event.name
+            self._pending_disks.add(name)
+        elif event.subsystem == "net":
+            self._pending_nics.add(event.name)
+        else:
+            return
+        logger.debug(f"uevent: {event.action} {event.subsystem} {event.name}")
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    def _on_uevents_lost(self) -> None:
+        # no telling what changed, probe everything on the next tick.
+        self._last_tick = 0
+
+    async def _refresh(self) -> None:
+        """Refresh the disks and NICs we got events for."""
+        await asyncio.sleep(HOTPLUG_SETTLE_TIME)
+        self._refresh_task = None
+        disks, self._pending_disks = self._pending_disks, set()
+        nics, self._pending_nics = self._pending_nics, set()
+        if self._latest is None:
+            # we'll get everything on the first probe.
+            return
+
+        devs: Dict[str, DiskDevice] = {d.name: d for d in self._latest.disks}
+        for name in disks:
+            try:
+                dev = get_block_device(name)
+            except OSError as e:
+                logger.error(f"unable to refresh disk {name}: {e}")
+                continue
+            if dev is not None:
+                devs[name] = dev
+            elif name in devs:
+                del devs[name]
+
+        ifaces: Dict[str, NICModel] = dict(self._latest.nics)
+        for name in nics:
+            try:
+                nic = self._facts.read_nic(name)
+            except FactsError as e:
+                logger.error(e.message)
+                continue
+            if nic is not None:
+                ifaces[name] = nic
+            elif name in ifaces:
+                del ifaces[name]
+
+        await self._update(
+            self._latest.copy(
+                update={
+                    "disks": [devs[name] for name in sorted(devs)],
+                    "nics": {name: ifaces[name] for name in sorted(ifaces)},
+                }
+            )
+        )
 
     @property
     def latest(self) -> Optional[NodeInfoModel]:
         return self._latest
 
+    @property
+    def last_diff(self) -> Optional[InventoryDiffModel]:
+        """What changed in the latest snapshot."""
+        return self._last_diff
+
     async def subscribe(
-        self, cb: Callable[[NodeInfoModel], Awaitable[None]], once: bool
+        self,
+        cb: Callable[[NodeInfoModel], Awaitable[None]],
+        once: bool,
+        changes: Optional[Set[ChangeEnum]] = None,
     ) -> Optional[Subscriber]:
+        """
+        Call back with the latest snapshot, once or whenever it changes. If
+        `changes` is provided, only when those classes of changes happen.
+        """
         # if we have available state, call back immediately.
         if self._latest:
             await cb(self._latest)  # type: ignore
             if once:
                 return None
-        sub = Subscriber(cb=cb, once=once)
+        sub = Subscriber(cb=cb, once=once, changes=changes)
         self._subscribers.append(sub)
         return sub
 
@@ -98,11 +236,39 @@ class Inventory(Ticker):
         if sub in self._subscribers:
             self._subscribers.remove(sub)
 
-    async def _publish(self) -> None:
+    async def _publish(self, diff: Optional[InventoryDiffModel] = None) -> None:
+        """
+        Publish to subscribers wanting `diff`, or to everyone if `None`.
+        Callbacks run concurrently, in the background; see `drain()`.
+        """
         assert self._latest
+        remaining: List[Subscriber] = []
         for subscriber in self._subscribers:
-            # ignore type because mypy is somehow broken when doing callbacks
-            # see https://github.com/python/mypy/issues/5485
-            await subscriber.cb(self._latest)  # type: ignore
+            if diff is not None and not subscriber.wants(diff.changes):
+                remaining.append(subscriber)
+                continue
+            subscriber.push(self._latest)
             if subscriber.once:
-                self._subscribers.remove(subscriber)
+                self._retire(subscriber)
+            else:
+                remaining.append(subscriber)
+        self._subscribers = remaining
+
+    def _retire(self, subscriber: Subscriber) -> None:
+        """Keep a once subscriber around only until it's done delivering."""
+
+        def _done() -> None:
+            if subscriber in self._retired:
+                self._retired.remove(subscriber)
+
+        self._retired.append(subscriber)
+        subscriber.add_done_callback(_done)
+
+    async def drain(self) -> None:
+        """Wait for subscribers to handle everything published so far."""
+        subscribers = self._subscribers + self._retired
+        self._retired = []
+        await asyncio.gather(*[s.drain() for s in subscribers])
+
+    def subscriber_stats(self) -> List[SubscriberStatsModel]:
+        return [s.stats for s in self._subscribers]
@@ -12,43 +12,34 @@
 # GNU General Public License for more details.
 
 import asyncio
-from typing import Dict, List
+from logging import Logger
+from typing import List
 
-from pydantic import BaseModel
+from fastapi.logger import logger as fastapi_logger
 
 from gravel.cephadm.cephadm import Cephadm, CephadmError
 from gravel.cephadm.models import (
-    NICModel,
+    HostFactsModel,
     NodeCPUInfoModel,
     NodeCPULoadModel,
     NodeMemoryInfoModel,
 )
 from gravel.controllers.inventory.disks import DiskDevice, get_storage_devices
+from gravel.controllers.inventory.facts import (
+    FactsCollector,
+    FactsError,
+    NodeFactsModel,
+)
 
+logger: Logger = fastapi_logger
 
-class NodeInfoModel(BaseModel):
-    hostname: str
-    model: str
-    vendor: str
-    kernel: str
-    operating_system: str
-    system_uptime: float
-    current_time: int
-    cpu: NodeCPUInfoModel
-    nics: Dict[str, NICModel]
-    memory: NodeMemoryInfoModel
-    disks: List[DiskDevice]
 
+class NodeInfoModel(NodeFactsModel):
+    disks: List[DiskDevice]
 
-async def get_node_info(cephadm: Cephadm) -> NodeInfoModel:
-    try:
-        facts, disks = await asyncio.gather(
-            cephadm.gather_facts(), get_storage_devices()
-        )
-    except CephadmError as e:
-        raise CephadmError("error obtaining node info") from e
 
-    return NodeInfoModel(
+def _from_cephadm(facts: HostFactsModel) -> NodeFactsModel:
+    return NodeFactsModel(
         hostname=facts.hostname,
         model=facts.model,
         vendor=facts.vendor,
@@ -74,5 +65,27 @@ async def get_node_info(cephadm: Cephadm) -> NodeInfoModel:
             free_kb=facts.memory_free_kb,
             total_kb=facts.memory_total_kb,
         ),
-        disks=disks,
     )
+
+
+async def _get_facts(
+    cephadm: Cephadm, collector: FactsCollector
+) -> NodeFactsModel:
+    try:
+        return collector.collect()
+    except FactsError as e:
+        logger.warning(f"{e.message} Falling back to cephadm.")
+    return _from_cephadm(await cephadm.gather_facts())
+
+
+async def get_node_info(
+    cephadm: Cephadm, collector: FactsCollector
+) -> NodeInfoModel:
+    try:
+        facts, disks = await asyncio.gather(
+            _get_facts(cephadm, collector), get_storage_devices()
+        )
+    except CephadmError as e:
+        raise CephadmError("error obtaining node info") from e
+
+    return NodeInfoModel(disks=disks, **facts.dict())
@@ -13,20 +13,136 @@
 
 from __future__ import annotations
 
-from typing import Awaitable, Callable
+import asyncio
+import time
+from logging import Logger
+from typing import Awaitable, Callable, Optional, Set
 
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
+
+from gravel.controllers.inventory.diff import ChangeEnum
 from gravel.controllers.inventory.nodeinfo import NodeInfoModel
 
+logger: Logger = fastapi_logger
+
+
+# how long a callback may take before we give up on it.
+SUBSCRIBER_TIMEOUT = 30.0
+
+
+class SubscriberStatsModel(BaseModel):
+    name: str = Field(title="Subscriber's callback.")
+    delivered: int = Field(0, title="Snapshots handed to the callback.")
+    dropped: int = Field(0, title="Snapshots superseded before delivery.")
+    failed: int = Field(0, title="Callbacks that raised an exception.")
+    timeouts: int = Field(0, title="Callbacks that timed out.")
+    last_latency: float = Field(0.0, title="Last callback run, in seconds.")
+    max_latency: float = Field(0.0, title="Longest callback run, in seconds.")
+    avg_latency: float = Field(0.0, title="Average callback run, in seconds.")
+
 
 class Subscriber:
+    """
+    Delivers snapshots to a callback, in its own task, so a slow or failing
+    callback doesn't hold back anyone else. We only ever hold one pending
+    snapshot: if a new one arrives before the callback is done with the
+    previous one, the pending one is replaced, since only the latest state
+    matters.
+    """
+
     cb: Callable[[NodeInfoModel], Awaitable[None]]
     once: bool
+    changes: Optional[Set[ChangeEnum]]
+    timeout: float
+    _pending: Optional[NodeInfoModel]
+    _task: Optional[asyncio.Task]
+    _stats: SubscriberStatsModel
+    _total_latency: float
 
     def __init__(
-        self, cb: Callable[[NodeInfoModel], Awaitable[None]], once: bool
+        self,
+        cb: Callable[[NodeInfoModel], Awaitable[None]],
+        once: bool,
+        changes: Optional[Set[ChangeEnum]] = None,
+        timeout: float = SUBSCRIBER_TIMEOUT,
     ):
         # mypy is picking on type signature issues with the first argument of
         # the callable, while neither pyright nor visual inspection do. I'm
         # assuming this as one of mypy's quirks with Callables, and ignoring.
         self.cb = cb  # type: ignore
         self.once = once
+        self.changes = changes
+        self.timeout = timeout
+        self._pending = None
+        self._task = None
+        self._stats = SubscriberStatsModel(
+            name=getattr(cb, "__qualname__", repr(cb))
+        )
+        self._total_latency = 0.0
+
+    def wants(self, changes: Set[ChangeEnum]) -> bool:
+        """Whether we care about these classes of changes."""
+        if self.changes is None:
+            return len(changes) > 0
+        return len(self.changes & changes) > 0
+
+    @property
+    def stats(self) -> SubscriberStatsModel:
+        return self._stats.copy()
+
+    def push(self, nodeinfo: NodeInfoModel) -> None:
+        """Queue a snapshot for delivery, replacing any pending one."""
+        if self._pending is not None:
+            self._stats.dropped += 1
+        self._pending = nodeinfo
+        if self._task is None:
+            self._task = asyncio.create_task(self._deliver())
+
+    async def _deliver(self) -> None:
+        while self._pending is not None:
+            nodeinfo, self._pending = self._pending, None
+            start = time.monotonic()
+            try:
+                # ignore type because mypy is somehow broken when doing
+                # callbacks, see https://github.com/python/mypy/issues/5485
+                await asyncio.wait_for(
+                    self.cb(nodeinfo), self.timeout  # type: ignore
+                )
+            except asyncio.TimeoutError:
+                self._stats.timeouts += 1
+                logger.error(
+                    f"inventory subscriber {self._stats.name} timed out"
+                )
+            except Exception as e:
+                self._stats.failed += 1
+                logger.exception(
+                    f"inventory subscriber {self._stats.name} failed: {e}"
+                )
+            self._record_latency(time.monotonic() - start)
+        self._task = None
+
+    def _record_latency(self, latency: float) -> None:
+        self._stats.delivered += 1
+        self._total_latency += latency
+        self._stats.last_latency = latency
+        self._stats.max_latency = max(self._stats.max_latency, latency)
+        self._stats.avg_latency = self._total_latency / self._stats.delivered
+
+    def add_done_callback(self, fn: Callable[[], None]) -> None:
+        """Call `fn` once we're done delivering, right away if we are."""
+        if self._task is None:
+            fn()
+        else:
+            self._task.add_done_callback(lambda _: fn())
+
+    async def drain(self) -> None:
+        """Wait until all pending snapshots have been delivered."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    def cancel(self) -> None:
+        self._pending = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,153 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Listens for the kernel's device events (uevents) on netlink, so we learn
+about disks and NICs coming and going as it happens, instead of waiting for
+the next inventory probe.
+"""
+
+import asyncio
+import errno
+import os
+import socket
+from logging import Logger
+from typing import Callable, Dict, List, Optional
+
+from fastapi.logger import logger as fastapi_logger
+from pydantic import BaseModel, Field
+
+logger: Logger = fastapi_logger
+
+
+# as per include/uapi/linux/netlink.h
+NETLINK_KOBJECT_UEVENT = 15
+# kernel events, as opposed to those re-broadcast by udev.
+UEVENT_GROUP_KERNEL = 1
+UEVENT_RCVBUF = 1024 * 1024
+UEVENT_MAX_SIZE = 8192
+
+
+class UEventModel(BaseModel):
+    action: str = Field(title="What happened to the device.")
+    devpath: str = Field(title="Device's path, relative to /sys.")
+    subsystem: str = Field(title="Device's subsystem.")
+    name: str = Field("", title="Device or interface name.")
+    devtype: str = Field("", title="Device type, within its subsystem.")
+    props: Dict[str, str] = Field({}, title="All event properties.")
+
+
+def parse_uevent(data: bytes) -> Optional[UEventModel]:
+    """
+    Parse a kernel uevent, `action@devpath` followed by `KEY=value` pairs,
+    all nul separated. Returns `None` if this is not a kernel uevent.
+    """
+    fields = data.decode("utf-8", errors="replace").split("\0")
+    if "@" not in fields[0]:
+        # e.g., messages broadcast by udev start with 'libudev'.
+        return None
+    props: Dict[str, str] = {}
+    for field in fields[1:]:
+        key, sep, value = field.partition("=")
+        if sep:
+            props[key] = value
+    if "ACTION" not in props or "DEVPATH" not in props:
+        return None
+    # the device's sysfs directory is named after it, as a last resort.
+    name = props.get("INTERFACE", props.get("DEVNAME", props["DEVPATH"]))
+    return UEventModel(
+        action=props["ACTION"],
+        devpath=props["DEVPATH"],
+        subsystem=props.get("SUBSYSTEM", ""),
+        name=os.path.basename(name),
+        devtype=props.get("DEVTYPE", ""),
+        props=props,
+    )
+
+
+class UEventListener:
+    """
+    Calls back on uevents for the given subsystems. If the kernel had to drop
+    events because we weren't reading fast enough, `lostcb` is called
+    instead, and the caller should assume anything may have changed.
+    """
+
+    _subsystems: List[str]
+    _sock: Optional[socket.socket]
+
+    def __init__(
+        self,
+        subsystems: List[str],
+        cb: Callable[[UEventModel], None],
+        lostcb: Callable[[], None],
+    ) -> None:
+        self._subsystems = subsystems
+        self._cb = cb
+        self._lostcb = lostcb
+        self._sock = None
+
+    @property
+    def listening(self) -> bool:
+        return self._sock is not None
+
+    def start(self) -> bool:
+        """Start listening, returning whether we are able to."""
+        if self._sock is not None:
+            return True
+        try:
+            sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT
+            )
+        except OSError as e:
+            logger.info(f"unable to listen for uevents: {e}")
+            return False
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UEVENT_RCVBUF)
+            sock.bind((0, UEVENT_GROUP_KERNEL))
+            sock.setblocking(False)
+        except OSError as e:
+            logger.info(f"unable to listen for uevents: {e}")
+            sock.close()
+            return False
+
+        asyncio.get_event_loop().add_reader(sock.fileno(), self._on_readable)
+        self._sock = sock
+        logger.debug(f"listening for uevents on {self._subsystems}")
+        return True
+
+    def stop(self) -> None:
+        if self._sock is None:
+            return
+        asyncio.get_event_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+
+    def _on_readable(self) -> None:
+        assert self._sock is not None
+        while True:
+            try:
+                data = self._sock.recv(UEVENT_MAX_SIZE)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    logger.error(f"error reading uevents: {e}")
+                    return
+                logger.info("uevent queue overflowed, events were lost")
+                self._lostcb()
+                continue
+
+            event = parse_uevent(data)
+            if event is None or event.subsystem not in self._subsystems:
+                continue
+            self._cb(event)
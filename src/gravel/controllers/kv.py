@@ -22,12 +22,15 @@ import sys
 import threading
 from logging import Logger
 from pathlib import Path
-from typing import Callable, List, Optional
+from typing import Callable, Dict, List, Optional
 
 from fastapi.logger import logger as fastapi_logger
 
 logger: Logger = fastapi_logger
 
+# Maximum number of omap entries to fetch per read op in get_prefix().
+OMAP_PAGE_SIZE: int = 1000
+
 # Liberated from gravel/controllers/orch/ceph.py
 # TODO: make this common / combine somehow?
 try:
@@ -60,6 +63,7 @@ class KV:
     _run: bool
     _event: threading.Event
     _watches: dict
+    _prefix_watches: dict
     _next_watch_id: int
 
     def __init__(self):
@@ -98,6 +102,8 @@ class KV:
         # - Create an additional map of ID to key
         # - Make the cancel method supply the key being watched
         self._watches = {}
+        # Same as above, but keyed on a key prefix, for watch_prefix().
+        self._prefix_watches = {}
         # Watch IDs increment forever.  This is probably stupid (surely it'll
         # break eventually, given a long enough runtime and enough watches...)
         self._next_watch_id = 1
@@ -253,12 +259,25 @@ class KV:
         logger.debug(
             f"Got notify on config object {notify_id} {notifier_id} {watch_id} {key}"
         )
-        if key not in self._watches:
+        if not self._get_watches(key):
             return
-
-        value = self._get(key)
-        for watch in self._watches[key].values():
-            watch(key, value)
+        self._dispatch_watches(key, self._get(key))
+
+    def _get_watches(
+        self, key: str
+    ) -> List[Callable[[str, Optional[str]], None]]:
+        watches = list(self._watches.get(key, {}).values())
+        for prefix, prefix_watches in list(self._prefix_watches.items()):
+            if key.startswith(prefix):
+                watches.extend(prefix_watches.values())
+        return watches
+
+    def _dispatch_watches(self, key: str, value: Optional[str]) -> None:
+        for watch in self._get_watches(key):
+            try:
+                watch(key, value)
+            except Exception as e:
+                logger.exception(f"Error in watch callback for {key}: {e}")
 
     async def close(self) -> None:
         """Close k/v store connection"""
@@ -274,6 +293,7 @@ class KV:
         # (or gets stuck for too long)?
         logger.debug(f"Put {key}: {value}")
         bvalue = value.encode("utf-8")
+        notified: bool = False
         if self._ioctx:
             try:
                 # Note that current implementation lands in exception handler
@@ -321,12 +341,17 @@ class KV:
                     self._ioctx.operate_write_op(op, "kvstore")
                     # This next notifies all watchers *INCLUDING* me!
                     self._ioctx.notify("kvstore", key)
+                    notified = True
             except Exception as e:
                 # e.g. RADOS state (You cannot perform that operation on a Rados object in state configuring.)
                 logger.exception(str(e))
 
         logger.debug(f"Writing {key}: {value} to local cache")
         self._db[key] = bvalue
+        if not notified:
+            # nobody else will see this until we're connected, but our own
+            # watchers need to know.
+            self._dispatch_watches(key, value)
 
     def _get(self, key: str) -> Optional[str]:
         # Try to get the value from the kvstore in our pool,
@@ -385,18 +410,26 @@ class KV:
 
         if self._ioctx:
             try:
-                with rados.ReadOpCtx() as op:
-                    omap_iter, ret = self._ioctx.get_omap_vals(
-                        op,
-                        start_after="",
-                        filter_prefix=key_prefix,
-                        max_return=1000,
-                    )
-                    assert ret == 0  # ???
-                    # TODO: does this need to be async?
-                    self._ioctx.operate_read_op(op, "kvstore")
-                    for k, v in list(omap_iter):
+                # get_omap_vals() returns at most max_return entries per
+                # call, so page through the omap until we get a short page.
+                start_after: str = ""
+                while True:
+                    with rados.ReadOpCtx() as op:
+                        omap_iter, ret = self._ioctx.get_omap_vals(
+                            op,
+                            start_after=start_after,
+                            filter_prefix=key_prefix,
+                            max_return=OMAP_PAGE_SIZE,
+                        )
+                        assert ret == 0  # ???
+                        # TODO: does this need to be async?
+                        self._ioctx.operate_read_op(op, "kvstore")
+                        page = list(omap_iter)
+                    for k, v in page:
                         self._db[k] = v
+                    if len(page) < OMAP_PAGE_SIZE:
+                        break
+                    start_after = page[-1][0]
 
             except Exception as e:
                 logger.exception(str(e))
@@ -413,26 +446,36 @@ class KV:
     async def rm(self, key: str) -> None:
         """Remove key from store"""
         logger.debug(f"Removing {key}")
+        notified: bool = False
         if self._ioctx:
             try:
                 with rados.WriteOpCtx() as op:
                     self._ioctx.remove_omap_keys(op, (key,))
                     self._ioctx.operate_write_op(op, "kvstore")
                     # seems to succeed just fine even if the key doesn't exist
+                    # watchers will be handed a None value.
+                    self._ioctx.notify("kvstore", key)
+                    notified = True
             except Exception as e:
                 logger.exception(str(e))
 
         if key in self._db:
             del self._db[key]
+        if not notified:
+            self._dispatch_watches(key, None)
 
     async def lock(self, key: str):
         """Lock a given key. Requires compliant consumers."""
         raise NotImplementedError()
 
     async def watch(
-        self, key: str, callback: Callable[[str, str], None]
+        self, key: str, callback: Callable[[str, Optional[str]], None]
     ) -> int:
-        """Watch updates on a given key"""
+        """
+        Watch updates on a given key. The callback is handed a None value if
+        the key has been removed. Note callbacks may be called from a thread
+        other than the event loop's.
+        """
         watch_id = self._next_watch_id
         self._next_watch_id += 1
         if key not in self._watches:
@@ -440,10 +483,23 @@ class KV:
         self._watches[key][watch_id] = callback
         return watch_id
 
+    async def watch_prefix(
+        self, key_prefix: str, callback: Callable[[str, Optional[str]], None]
+    ) -> int:
+        """Watch updates on all keys with a given prefix, as with watch()."""
+        watch_id = self._next_watch_id
+        self._next_watch_id += 1
+        if key_prefix not in self._prefix_watches:
+            self._prefix_watches[key_prefix] = dict()
+        self._prefix_watches[key_prefix][watch_id] = callback
+        return watch_id
+
     async def cancel_watch(self, watch_id: int) -> None:
         """Cancel a watch"""
-        for key in list(self._watches.keys()):
-            if watch_id in self._watches[key]:
-                del self._watches[key][watch_id]
-            if not self._watches[key]:
-                del self._watches[key]
+        watches: Dict[str, dict]
+        for watches in (self._watches, self._prefix_watches):
+            for key in list(watches.keys()):
+                if watch_id in watches[key]:
+                    del watches[key][watch_id]
+                if not watches[key]:
+                    del watches[key]
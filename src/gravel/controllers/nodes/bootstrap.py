@@ -51,7 +51,10 @@ class Bootstrap:
         self._gstate = gstate
 
     async def bootstrap(
-        self, address: str, cb: Callable[[bool, Optional[str]], Awaitable[None]]
+        self,
+        address: str,
+        cb: Callable[[bool, Optional[str]], Awaitable[None]],
+        stepcb: Optional[Callable[[str], None]] = None,
     ) -> None:
         logger.debug(f"start bootstrapping, address: {address}")
 
@@ -60,7 +63,7 @@ class Bootstrap:
         # TODO: check here if a cluster already exists, raise if so.
 
         try:
-            asyncio.create_task(self._do_bootstrap(address, cb))
+            asyncio.create_task(self._do_bootstrap(address, cb, stepcb))
         except Exception as e:
             logger.error(f"error starting bootstrap task: {str(e)}")
             raise BootstrapError("Error starting bootstrap task.")
@@ -81,7 +84,10 @@ class Bootstrap:
         self._error_msg = msg
 
     async def _do_bootstrap(
-        self, address: str, cb: Callable[[bool, Optional[str]], Awaitable[None]]
+        self,
+        address: str,
+        cb: Callable[[bool, Optional[str]], Awaitable[None]],
+        stepcb: Optional[Callable[[str], None]],
     ) -> None:
         logger.info(f"bootstrap address: {address}")
         assert address is not None and len(address) > 0
@@ -95,7 +101,9 @@ class Bootstrap:
         retcode: int = 0
         try:
             cephadm: Cephadm = self._gstate.cephadm
-            _, _, retcode = await cephadm.bootstrap(address, progress_cb)
+            _, _, retcode = await cephadm.bootstrap(
+                address, progress_cb, stepcb
+            )
         except Exception as e:
             await cb(False, f"error bootstrapping: {str(e)}")
             self._stage = BootstrapStage.ERROR
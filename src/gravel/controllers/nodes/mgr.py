@@ -21,6 +21,7 @@ from fastapi.logger import logger as fastapi_logger
 from pydantic import BaseModel
 
 from gravel.controllers.gstate import GlobalState
+from gravel.controllers.inventory.diff import ChangeEnum
 from gravel.controllers.inventory.nodeinfo import NodeInfoModel
 from gravel.controllers.inventory.subscriber import Subscriber
 from gravel.controllers.nodes.errors import (
@@ -102,7 +103,13 @@ class NodeMgr:
         async def _task() -> None:
             logger.debug("subscribe inventory updates")
             self._inventory_sub = await self._gstate.inventory.subscribe(
-                _inventory_subscriber, once=False
+                _inventory_subscriber,
+                once=False,
+                changes={
+                    ChangeEnum.HOST,
+                    ChangeEnum.NICS,
+                    ChangeEnum.ADDRESSES,
+                },
             )
 
         asyncio.create_task(_task())
@@ -116,6 +123,7 @@ class NodeMgr:
     async def _node_update_info(self, nodeinfo: NodeInfoModel) -> None:
 
         assert self._state is not None
+        changed = self._state.hostname != nodeinfo.hostname
         self._state.hostname = nodeinfo.hostname
 
         address: Optional[str] = None
@@ -133,6 +141,10 @@ class NodeMgr:
         if netmask_idx > 0:
             address = address[:netmask_idx]
 
+        if not changed and self._state.address == address:
+            # nothing to write.
+            return
+
         self._state.address = address
         await self._save_state()
 
@@ -12,14 +12,21 @@
 # GNU General Public License for more details.
 
 import asyncio
+import time
+import typing
 from enum import Enum
-from typing import List
+from typing import List, Optional
 
 import psutil
 from pydantic import BaseModel, Field
 
 from gravel.controllers.gstate import GlobalState
+from gravel.controllers.inventory.diff import ChangeEnum
 from gravel.controllers.inventory.disks import DiskDevice, get_storage_devices
+from gravel.controllers.inventory.nodeinfo import NodeInfoModel
+
+if typing.TYPE_CHECKING:
+    from gravel.controllers.inventory.inventory import Inventory
 
 # Minimum requirements for individual host validation:
 # NOTE(jhesketh): These are obviously hardcoded for the moment, but may be
@@ -32,6 +39,10 @@ AQUARIUM_MIN_MEMORY = 2 * 1024 * 1024 * 1024  # 2 * KB * MB * GB
 AQUARIUM_MIN_SYSTEM_DISK = 10 * 1024 * 1024 * 1024  # 2 * KB * MB * GB
 AQUARIUM_MIN_AVAIL_DISKS = 1
 
+# how long we trust cached requirements for, in seconds. Inventory changes
+# invalidate them sooner, once we have an inventory.
+REQUIREMENTS_TTL = 5.0
+
 
 class CPUQualifiedEnum(int, Enum):
     QUALIFIED = 0
@@ -230,3 +241,64 @@ async def localhost_qualified() -> RequirementsModel:
         disks=disks_qualified,
     )
     return result
+
+
+class RequirementsCache:
+    """
+    Caches `localhost_qualified()`, so polling clients don't each probe the
+    host. Concurrent requests for expired requirements share a single probe.
+    """
+
+    _ttl: float
+    _cached: Optional[RequirementsModel]
+    _expires: float
+    _generation: int
+    _task: Optional[asyncio.Task]
+
+    def __init__(self, ttl: float = REQUIREMENTS_TTL) -> None:
+        self._ttl = ttl
+        self._cached = None
+        self._expires = 0.0
+        self._generation = 0
+        self._task = None
+
+    def invalidate(self) -> None:
+        self._cached = None
+        # results from a probe in flight are stale, don't keep them, nor hand
+        # them to anyone asking from now on.
+        self._generation += 1
+        self._task = None
+
+    async def _probe(self, generation: int) -> RequirementsModel:
+        try:
+            result = await localhost_qualified()
+        finally:
+            # unless invalidated, which means a newer probe may have taken
+            # our place, we're still the current task.
+            if generation == self._generation:
+                self._task = None
+        if generation == self._generation:
+            self._cached = result
+            self._expires = time.monotonic() + self._ttl
+        return result
+
+    async def get(self) -> RequirementsModel:
+        if self._cached is not None and time.monotonic() < self._expires:
+            return self._cached.copy(deep=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe(self._generation))
+        # shield, so a cancelled request doesn't cancel everyone else's.
+        result = await asyncio.shield(self._task)
+        return result.copy(deep=True)
+
+    async def watch(self, inventory: "Inventory") -> None:
+        """Invalidate whenever the inventory's disks or host change."""
+
+        async def _invalidate(nodeinfo: NodeInfoModel) -> None:
+            self.invalidate()
+
+        await inventory.subscribe(
+            _invalidate,
+            once=False,
+            changes={ChangeEnum.DISKS, ChangeEnum.HOST},
+        )
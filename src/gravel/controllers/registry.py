@@ -0,0 +1,304 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Asynchronous client for container registries, speaking the registry's v2 API.
+Clients are kept per registry so connections are reused, anonymous bearer
+tokens are obtained when the registry asks for them, and lookups are cached
+for a little while: checking a registry while setting up a deployment should
+not take longer than it has to.
+"""
+
+import hashlib
+import platform
+import re
+import ssl
+import time
+from logging import Logger
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi.logger import logger as fastapi_logger
+
+from gravel.controllers.errors import GravelError
+
+logger: Logger = fastapi_logger
+
+
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 10.0
+# how long we trust what the registry told us.
+CACHE_TTL = 60.0
+
+MANIFEST_V2 = "application/vnd.docker.distribution.manifest.v2+json"
+MANIFEST_LIST_V2 = "application/vnd.docker.distribution.manifest.list.v2+json"
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+MANIFEST_TYPES = [MANIFEST_V2, MANIFEST_LIST_V2, OCI_MANIFEST, OCI_INDEX]
+
+
+class RegistryError(GravelError):
+    pass
+
+
+class RegistrySSLError(RegistryError):
+    pass
+
+
+class RegistryConnectionError(RegistryError):
+    pass
+
+
+class RegistryNotFoundError(RegistryError):
+    pass
+
+
+def _is_ssl_error(e: BaseException) -> bool:
+    cause: Optional[BaseException] = e
+    while cause is not None:
+        if isinstance(cause, ssl.SSLError):
+            return True
+        cause = cause.__cause__ or cause.__context__
+    return False
+
+
+def _go_arch() -> str:
+    machine = platform.machine()
+    return {"x86_64": "amd64", "aarch64": "arm64"}.get(machine, machine)
+
+
+def split_image(image: str) -> Tuple[str, str]:
+    """Split `image` into its name and its tag or digest."""
+    if "@" in image:
+        name, ref = image.split("@", 1)
+        return name, ref
+    if ":" in image.rsplit("/", 1)[-1]:
+        name, ref = image.rsplit(":", 1)
+        return name, ref
+    return image, "latest"
+
+
+class _Cached:
+    value: Any
+    expires: float
+
+    def __init__(self, value: Any, ttl: float) -> None:
+        self.value = value
+        self.expires = time.monotonic() + ttl
+
+    @property
+    def valid(self) -> bool:
+        return time.monotonic() < self.expires
+
+
+class RegistryClient:
+    """Talks to the registry at `registry`. Obtain instances with `get()`."""
+
+    _clients: Dict[str, "RegistryClient"] = {}
+    # for testing purposes.
+    _transport: Optional[httpx.AsyncBaseTransport] = None
+
+    _client: httpx.AsyncClient
+    _tokens: Dict[str, _Cached]
+    _cache: Dict[str, _Cached]
+
+    def __init__(self, registry: str, secure: bool) -> None:
+        proto = "https" if secure else "http"
+        # only override httpx's own transport when testing.
+        extra: Dict[str, Any] = {}
+        if RegistryClient._transport is not None:
+            extra["transport"] = RegistryClient._transport
+        self._client = httpx.AsyncClient(
+            base_url=f"{proto}://{registry}",
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+            **extra,
+        )
+        self._tokens = {}
+        self._cache = {}
+
+    @classmethod
+    def get(cls, registry: str, secure: bool) -> "RegistryClient":
+        key = f"{'https' if secure else 'http'}://{registry}"
+        if key not in cls._clients:
+            cls._clients[key] = RegistryClient(registry, secure)
+        return cls._clients[key]
+
+    @classmethod
+    async def close_all(cls) -> None:
+        clients = list(cls._clients.values())
+        cls._clients = {}
+        for client in clients:
+            await client._client.aclose()
+
+    def _cached(self, key: str) -> Optional[Any]:
+        entry = self._cache.get(key)
+        if entry is None or not entry.valid:
+            return None
+        return entry.value
+
+    async def _token(self, challenge: str, scope: str) -> Optional[str]:
+        """Obtain an anonymous token, as requested by `challenge`."""
+        cached = self._tokens.get(scope)
+        if cached is not None and cached.valid:
+            return cached.value
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop("realm", None)
+        if realm is None:
+            return None
+        params["scope"] = scope
+        res = await self._client.get(realm, params=params)
+        if res.status_code != 200:
+            logger.debug(f"Unable to obtain registry token: {res.status_code}")
+            return None
+        body = res.json()
+        token = body.get("token", body.get("access_token"))
+        if token is None:
+            return None
+        ttl = min(float(body.get("expires_in", CACHE_TTL)), CACHE_TTL)
+        self._tokens[scope] = _Cached(token, ttl)
+        return token
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        scope: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        Send a request, authenticating for `scope` should the registry ask
+        for it. Without a scope, we don't authenticate.
+        """
+        headers = dict(headers) if headers is not None else {}
+        cached = self._tokens.get(scope) if scope is not None else None
+        if cached is not None and cached.valid:
+            headers["Authorization"] = f"Bearer {cached.value}"
+        try:
+            res = await self._client.request(method, path, headers=headers)
+            challenge = res.headers.get("WWW-Authenticate", "")
+            if (
+                scope is not None
+                and res.status_code == 401
+                and challenge.startswith("Bearer ")
+            ):
+                token = await self._token(challenge, scope)
+                if token is not None:
+                    headers["Authorization"] = f"Bearer {token}"
+                    res = await self._client.request(
+                        method, path, headers=headers
+                    )
+        except httpx.TransportError as e:
+            if _is_ssl_error(e):
+                raise RegistrySSLError(str(e))
+            raise RegistryConnectionError(str(e))
+        return res
+
+    async def ping(self) -> None:
+        """Check whether this is a registry we can talk to."""
+        if self._cached("ping") is not None:
+            return
+        res = await self._request("GET", "/v2/")
+        # a registry requiring authentication is still a registry.
+        if res.status_code not in (200, 401):
+            raise RegistryConnectionError(
+                f"Unexpected response: {res.status_code} {res.text}"
+            )
+        self._cache["ping"] = _Cached(True, CACHE_TTL)
+
+    async def tags(self, name: str) -> List[str]:
+        """Obtain the tags of image `name`."""
+        key = f"tags:{name}"
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        res = await self._request(
+            "GET", f"/v2/{name}/tags/list", f"repository:{name}:pull"
+        )
+        if res.status_code == 404:
+            raise RegistryNotFoundError(f"Image '{name}' not found.")
+        elif res.status_code != 200:
+            raise RegistryError(f"Unable to list tags: {res.status_code}")
+        tags: List[str] = res.json().get("tags") or []
+        self._cache[key] = _Cached(tags, CACHE_TTL)
+        return tags
+
+    async def digest(self, name: str, ref: str) -> Optional[str]:
+        """
+        Obtain the manifest digest of `name` at tag or digest `ref`, without
+        downloading the manifest. None if there's no such manifest.
+        """
+        key = f"digest:{name}:{ref}"
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        res = await self._request(
+            "HEAD",
+            f"/v2/{name}/manifests/{ref}",
+            f"repository:{name}:pull",
+            {"Accept": ", ".join(MANIFEST_TYPES)},
+        )
+        if res.status_code == 404:
+            return None
+        elif res.status_code != 200:
+            raise RegistryError(f"Unable to check manifest: {res.status_code}")
+        digest = res.headers.get("Docker-Content-Digest", "")
+        self._cache[key] = _Cached(digest, CACHE_TTL)
+        return digest
+
+    async def _manifest(self, name: str, ref: str) -> Tuple[str, Any]:
+        res = await self._request(
+            "GET",
+            f"/v2/{name}/manifests/{ref}",
+            f"repository:{name}:pull",
+            {"Accept": ", ".join(MANIFEST_TYPES)},
+        )
+        if res.status_code == 404:
+            raise RegistryNotFoundError(f"Image '{name}:{ref}' not found.")
+        elif res.status_code != 200:
+            raise RegistryError(f"Unable to get manifest: {res.status_code}")
+        digest = res.headers.get("Docker-Content-Digest")
+        if digest is None:
+            digest = f"sha256:{hashlib.sha256(res.content).hexdigest()}"
+        return digest, res.json()
+
+    async def resolve(self, name: str, ref: str) -> Tuple[str, Dict[str, int]]:
+        """
+        Resolve `name` at `ref` to its manifest digest, and obtain the sizes
+        of its layers, by digest, for this node's architecture.
+        """
+        digest, manifest = await self._manifest(name, ref)
+        if "manifests" in manifest:
+            arch = _go_arch()
+            entries = [
+                m
+                for m in manifest["manifests"]
+                if m.get("platform", {}).get("architecture") == arch
+            ]
+            if len(entries) == 0:
+                return digest, {}
+            _, manifest = await self._manifest(name, entries[0]["digest"])
+
+        layers = {
+            layer["digest"].split(":")[-1]: int(layer.get("size", 0))
+            for layer in manifest.get("layers", [])
+        }
+        return digest, layers
+
+
+async def resolve_image(
+    registry: str, image: str, secure: bool
+) -> Tuple[str, Dict[str, int]]:
+    """Resolve `image` to its manifest digest, and its layers' sizes."""
+    name, ref = split_image(image)
+    return await RegistryClient.get(registry, secure).resolve(name, ref)
@@ -140,6 +140,7 @@ class Devices(Ticker):
 
         self._osds_per_host = osds_per_host
         self._osd_entries = osd_entries
+        self._notify("devices", self.devices_per_host)
 
     @property
     def devices_per_host(self) -> Dict[str, DeviceHostModel]:
@@ -0,0 +1,229 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Watches network configuration files with inotify, and the kernel's network
+links with rtnetlink, so we learn about changes as they happen instead of
+re-reading everything periodically.
+"""
+
+import asyncio
+import ctypes
+import errno
+import os
+import socket
+import struct
+from logging import Logger
+from typing import Callable, List, Optional, Set, Tuple
+
+from fastapi.logger import logger as fastapi_logger
+
+logger: Logger = fastapi_logger
+
+
+# as per include/uapi/linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# as per include/uapi/linux/netlink.h and rtnetlink.h
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+IFLA_IFNAME = 3
+NLMSG_HEADER = struct.Struct("=LHHLL")
+IFINFOMSG = struct.Struct("=BxHiII")
+RTATTR = struct.Struct("=HH")
+
+READ_SIZE = 65536
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def parse_inotify_events(data: bytes) -> List[Tuple[int, str]]:
+    """Parse inotify events, as `(mask, name)` tuples."""
+    events: List[Tuple[int, str]] = []
+    offset = 0
+    while offset + INOTIFY_EVENT.size <= len(data):
+        _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        raw = data[offset : offset + length]
+        offset += length
+        events.append((mask, raw.split(b"\0", 1)[0].decode("utf-8")))
+    return events
+
+
+def parse_link_messages(data: bytes) -> List[str]:
+    """Obtain the names of the links in RTM_NEWLINK/RTM_DELLINK messages."""
+    names: List[str] = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msgtype, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+        end = offset + length
+        if msgtype in (RTM_NEWLINK, RTM_DELLINK):
+            attr = offset + NLMSG_HEADER.size + IFINFOMSG.size
+            while attr + RTATTR.size <= end:
+                attrlen, attrtype = RTATTR.unpack_from(data, attr)
+                if attrlen < RTATTR.size:
+                    break
+                if attrtype == IFLA_IFNAME:
+                    value = data[attr + RTATTR.size : attr + attrlen]
+                    names.append(value.split(b"\0", 1)[0].decode("utf-8"))
+                    break
+                attr += _align(attrlen)
+        offset += _align(length)
+    return names
+
+
+class ConfigWatcher:
+    """
+    Calls back with the names of files changed in a directory. If the kernel
+    drops events, we call back with `None`, meaning anything may have
+    changed.
+    """
+
+    _path: str
+    _fd: Optional[int]
+
+    def __init__(
+        self, path: str, cb: Callable[[Optional[Set[str]]], None]
+    ) -> None:
+        self._path = path
+        self._cb = cb
+        self._fd = None
+
+    def start(self) -> bool:
+        if self._fd is not None:
+            return True
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+            wd = libc.inotify_add_watch(
+                fd, os.fsencode(self._path), INOTIFY_MASK
+            )
+            if wd < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch")
+        except (OSError, AttributeError) as e:
+            logger.info(f"unable to watch {self._path}: {e}")
+            return False
+        asyncio.get_event_loop().add_reader(fd, self._on_readable)
+        self._fd = fd
+        return True
+
+    def stop(self) -> None:
+        if self._fd is None:
+            return
+        asyncio.get_event_loop().remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def _on_readable(self) -> None:
+        assert self._fd is not None
+        names: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self._fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                logger.error(f"error reading inotify events: {e}")
+                return
+            for mask, name in parse_inotify_events(data):
+                if mask & IN_Q_OVERFLOW:
+                    self._cb(None)
+                    return
+                if name:
+                    names.add(name)
+        if names:
+            self._cb(names)
+
+
+class LinkWatcher:
+    """
+    Calls back with the names of links added, removed, or changed. If the
+    kernel drops messages, we call back with `None`, meaning any link may
+    have changed.
+    """
+
+    _sock: Optional[socket.socket]
+
+    def __init__(self, cb: Callable[[Optional[Set[str]]], None]) -> None:
+        self._cb = cb
+        self._sock = None
+
+    def start(self) -> bool:
+        if self._sock is not None:
+            return True
+        try:
+            sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE
+            )
+        except OSError as e:
+            logger.info(f"unable to watch network links: {e}")
+            return False
+        try:
+            sock.bind((0, RTMGRP_LINK))
+            sock.setblocking(False)
+        except OSError as e:
+            logger.info(f"unable to watch network links: {e}")
+            sock.close()
+            return False
+        asyncio.get_event_loop().add_reader(sock.fileno(), self._on_readable)
+        self._sock = sock
+        return True
+
+    def stop(self) -> None:
+        if self._sock is None:
+            return
+        asyncio.get_event_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+
+    def _on_readable(self) -> None:
+        assert self._sock is not None
+        names: Set[str] = set()
+        lost = False
+        while True:
+            try:
+                data = self._sock.recv(READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    # the socket's buffer overran; keep reading what's left.
+                    lost = True
+                    continue
+                logger.error(f"error reading link events: {e}")
+                return
+            names.update(parse_link_messages(data))
+        if lost:
+            self._cb(None)
+        elif names:
+            self._cb(names)
@@ -11,21 +11,33 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
+import asyncio
 import logging
-import os
+import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from atomicwrites import atomic_write
 from fastapi.logger import logger as fastapi_logger
 from pydantic import BaseModel, Field
 
 from gravel.controllers.gstate import Ticker
-from gravel.controllers.utils import aqr_run_cmd
+from gravel.controllers.resources.netwatch import ConfigWatcher, LinkWatcher
+from gravel.controllers.utils import aqr_run_cmd, get_ipv4_address
 
 logger: logging.Logger = fastapi_logger
 
 
+SYSCONFIG_PATH = "/etc/sysconfig/network"
+SYS_CLASS_NET_PATH = "/sys/class/net"
+
+# how often we re-read everything anyway, if we're watching for changes.
+WATCH_INTERVAL = 300.0
+# how long we wait for reloaded interfaces to have their addresses.
+VERIFY_TIMEOUT = 5.0
+VERIFY_INTERVAL = 0.5
+
+
 class InterfaceConfigModel(BaseModel):
     # Simplified "UI friendly" version of the actual config, i.e. we're not
     # exposing everything in /etc/sysconfig/network/ifcfg-*, only the bits that
@@ -66,15 +78,56 @@ class NetworkConfigModel(BaseModel):
     routes: List[RouteModel]
 
 
-class Network(Ticker):
+class NetworkApplyResultModel(BaseModel):
+    interfaces: List[str] = Field([], title="Reloaded interfaces.")
+    nameservers: bool = Field(False, title="Whether nameservers changed.")
+    routes: bool = Field(False, title="Whether global routes changed.")
+    mismatched: List[str] = Field(
+        [], title="Interfaces without their configured address."
+    )
+
+    @property
+    def verified(self) -> bool:
+        return len(self.mismatched) == 0
 
-    _interfaces: Dict[str, InterfaceModel] = {}
-    _nameservers: List[str] = []
-    _routes: List[RouteModel] = []
-    _is_busy: bool = False
 
-    def __init__(self, interval: float) -> None:
+class Network(Ticker):
+    """
+    Keeps track of the node's network configuration. Configuration files are
+    watched with inotify, and network links with rtnetlink, and only what
+    changed is re-read. If we can't watch, or just in case we miss something,
+    we also re-read everything every tick; at `watch_interval` if watching.
+    """
+
+    _interfaces: Dict[str, InterfaceModel]
+    _nameservers: List[str]
+    _routes: List[RouteModel]
+    _is_busy: bool
+    _physical: Set[str]
+    _configs: Dict[str, InterfaceConfigModel]
+    _route_files: Dict[str, List[RouteModel]]
+    _watch_interval: float
+    _watching: bool
+    _config_watcher: ConfigWatcher
+    _link_watcher: LinkWatcher
+
+    def __init__(
+        self, interval: float, watch_interval: float = WATCH_INTERVAL
+    ) -> None:
         super().__init__(interval)
+        self._interfaces = {}
+        self._nameservers = []
+        self._routes = []
+        self._is_busy = False
+        self._physical = set()
+        self._configs = {}
+        self._route_files = {}
+        self._watch_interval = watch_interval
+        self._watching = False
+        self._config_watcher = ConfigWatcher(
+            SYSCONFIG_PATH, self._on_config_changed
+        )
+        self._link_watcher = LinkWatcher(self._on_links_changed)
 
     @property
     def interfaces(self) -> Dict[str, InterfaceModel]:
@@ -92,103 +145,193 @@ class Network(Ticker):
         self._refresh_interfaces()
         self._refresh_nameservers()
         self._refresh_routes()
-        logger.debug(self._interfaces)
-        logger.debug(self._nameservers)
-        logger.debug(self._routes)
+        if not self._watching:
+            self._start_watching()
 
     async def _should_tick(self) -> bool:
         return not self._is_busy
 
-    def _refresh_interfaces(self) -> None:
-        # interfaces is the union of the physical interfaces (/sys/class/net/...) and
-        # any interfaces for which we have config files (/etc/sysconfig/network/ifcfg-*)
-        interfaces: Dict[str, InterfaceModel] = {}
+    async def shutdown(self) -> None:
+        self._config_watcher.stop()
+        self._link_watcher.stop()
+
+    def _start_watching(self) -> None:
+        if not self._config_watcher.start():
+            return
+        if not self._link_watcher.start():
+            self._config_watcher.stop()
+            return
+        logger.debug("watching network configuration and links")
+        self._watching = True
+        self.set_tick_interval(max(self._tick_interval, self._watch_interval))
+
+    def _on_config_changed(self, names: Optional[Set[str]]) -> None:
+        if names is None:
+            # events were lost, re-read everything.
+            self._refresh_interfaces()
+            self._refresh_nameservers()
+            self._refresh_routes()
+            return
+
+        logger.debug(f"network config changed: {names}")
+        for name in names:
+            path = Path(SYSCONFIG_PATH).joinpath(name)
+            if name == "config":
+                self._refresh_nameservers()
+            elif name.startswith("ifcfg-"):
+                self._read_interface_config(path)
+            elif name == "routes" or name.startswith("ifroute-"):
+                self._read_route_file(path)
+        self._update_interfaces()
+        self._update_routes()
+
+    def _on_links_changed(self, names: Optional[Set[str]]) -> None:
+        if names is None:
+            # messages were lost, re-read every link.
+            self._refresh_interfaces()
+            self._update_routes()
+            return
+
+        logger.debug(f"network links changed: {names}")
+        for name in names:
+            if Path(SYS_CLASS_NET_PATH).joinpath(name, "device").exists():
+                self._physical.add(name)
+            else:
+                self._physical.discard(name)
+        self._update_interfaces()
+        self._update_routes()
+
+    def _read_interface_config(self, conf: Path) -> None:
+        """Read an ifcfg file, forgetting its config if it's gone."""
+        # Blacklist here is lifted from wicked source
+        if conf.name.endswith("~") or conf.suffix in [
+            ".old",
+            ".bak",
+            ".orig",
+            ".scpmbackup",
+            ".rpmnew",
+            ".rpmsave",
+            ".rpmorig",
+        ]:
+            logger.debug(f"Skipping blacklisted suffix on {conf}")
+            return
+        iface = conf.name[6:]
+        if iface == "lo":
+            # We don't care about the loopback interface
+            return
+        if not conf.exists():
+            self._configs.pop(iface, None)
+            return
+        logger.debug(f"Reading {iface} config from {conf}")
+
+        rawconf = self._parse_config(conf)
+
+        config = InterfaceConfigModel()
+        if "IPADDR" in rawconf:
+            rawaddr = rawconf["IPADDR"]
+            if rawaddr:
+                config.ipaddr = rawaddr
+                # TODO: do we want to separate netmask etc. out?
+                # (it can currently only be specified as "/" suffix
+                # on ipaddr)
+        if "BOOTPROTO" in rawconf and rawconf["BOOTPROTO"] is not None:
+            config.bootproto = rawconf["BOOTPROTO"]
+        if rawconf.get("BONDING_MASTER") == "yes":
+            slaves = {
+                int(field[13:]): value
+                for field, value in rawconf.items()
+                if field.startswith("BONDING_SLAVE") and field[13:].isdigit()
+            }
+            config.bonding_slaves = [
+                slaves[i] for i in sorted(slaves) if slaves[i]
+            ]
+        self._configs[iface] = config
+
+    def _update_interfaces(self) -> None:
+        # interfaces is the union of the physical interfaces and any
+        # interfaces for which we have config files
+        interfaces: Dict[str, InterfaceModel] = {
+            name: InterfaceModel(name=name) for name in self._physical
+        }
+        for iface, config in self._configs.items():
+            if iface not in interfaces:
+                interfaces[iface] = InterfaceModel(name=iface)
+            interfaces[iface].config = config
+        if interfaces != self._interfaces:
+            logger.debug(f"interfaces: {interfaces}")
+        self._interfaces = interfaces
 
+    def _refresh_interfaces(self) -> None:
         # This gets the physical interfaces
-        sys_class_net = Path("/sys/class/net")
+        sys_class_net = Path(SYS_CLASS_NET_PATH)
         assert sys_class_net.exists() and sys_class_net.is_dir()
+        self._physical = set()
         for dev in sys_class_net.glob("*"):
             device = dev.joinpath("device")
             if device.exists():
                 # /sys/class/net/$dev/device exist, so it's a physical interface
-                interfaces[dev.stem] = InterfaceModel(name=dev.stem)
+                self._physical.add(dev.name)
 
         # ...and this gets any configured interfaces
-        sysconfig = Path("/etc/sysconfig/network")
+        sysconfig = Path(SYSCONFIG_PATH)
         assert sysconfig.exists() and sysconfig.is_dir()
+        self._configs = {}
         for conf in sysconfig.glob("ifcfg-*"):
-            # Blacklist here is lifted from wicked source
-            if conf.name.endswith("~") or conf.suffix in [
-                ".old",
-                ".bak",
-                ".orig",
-                ".scpmbackup",
-                ".rpmnew",
-                ".rpmsave",
-                ".rpmorig",
-            ]:
-                logger.debug(f"Skipping blacklisted suffix on {conf}")
-                continue
-            iface = conf.stem[6:]
-            if iface == "lo":
-                # We don't care about the loopback interface
-                continue
-            logger.debug(f"Reading {iface} config from {conf}")
-
-            rawconf = self._parse_config(conf)
-
-            config = InterfaceConfigModel()
-            if "IPADDR" in rawconf:
-                rawaddr = rawconf["IPADDR"]
-                if rawaddr:
-                    config.ipaddr = rawaddr
-                    # TODO: do we want to separate netmask etc. out?
-                    # (it can currently only be specified as "/" suffix
-                    # on ipaddr)
-            if "BOOTPROTO" in rawconf and rawconf["BOOTPROTO"] is not None:
-                config.bootproto = rawconf["BOOTPROTO"]
+            self._read_interface_config(conf)
 
-            if iface not in interfaces:
-                interfaces[iface] = InterfaceModel(name=iface)
-            interfaces[iface].config = config
-
-        self._interfaces = interfaces
+        self._update_interfaces()
 
     def _refresh_nameservers(self) -> None:
-        config = Path("/etc/sysconfig/network/config")
+        config = Path(SYSCONFIG_PATH).joinpath("config")
         assert config.exists() and config.is_file()
         rawconf = self._parse_config(config)
+        nameservers: List[str] = []
         if (
             "NETCONFIG_DNS_STATIC_SERVERS" in rawconf
             and rawconf["NETCONFIG_DNS_STATIC_SERVERS"] is not None
         ):
-            self._nameservers = rawconf["NETCONFIG_DNS_STATIC_SERVERS"].split()
-        else:
-            self._nameservers = []
-
-    def _refresh_routes(self) -> None:
+            nameservers = rawconf["NETCONFIG_DNS_STATIC_SERVERS"].split()
+        if nameservers != self._nameservers:
+            logger.debug(f"nameservers: {nameservers}")
+        self._nameservers = nameservers
+
+    def _read_route_file(self, path: Path) -> None:
+        """Read a routes file, forgetting its routes if it's gone."""
+        if not path.exists():
+            self._route_files.pop(path.name, None)
+            return
         routes: List[RouteModel] = []
-        route_paths = [Path("/etc/sysconfig/network/routes")]
-        for iface in self._interfaces:
-            route_paths.append(Path(f"/etc/sysconfig/network/ifroute-{iface}"))
-        for path in route_paths:
-            if not path.exists():
-                continue
-            with path.open("r") as f:
-                for line in f.readlines():
-                    stripped = line.strip()
-                    if len(stripped) == 0 or stripped.startswith("#"):
-                        continue
-                    fields = stripped.split()
-                    routes.append(
-                        RouteModel(
-                            destination=fields[0],
-                            gateway=fields[1],
-                            interface=fields[3],
-                        )
+        with path.open("r") as f:
+            for line in f.readlines():
+                stripped = line.strip()
+                if len(stripped) == 0 or stripped.startswith("#"):
+                    continue
+                fields = stripped.split()
+                routes.append(
+                    RouteModel(
+                        destination=fields[0],
+                        gateway=fields[1],
+                        interface=fields[3],
                     )
+                )
+        self._route_files[path.name] = routes
+
+    def _update_routes(self) -> None:
+        # only routes for interfaces we know about apply.
+        routes: List[RouteModel] = list(self._route_files.get("routes", []))
+        for iface in self._interfaces:
+            routes.extend(self._route_files.get(f"ifroute-{iface}", []))
+        if routes != self._routes:
+            logger.debug(f"routes: {routes}")
         self._routes = routes
 
+    def _refresh_routes(self) -> None:
+        self._route_files = {}
+        self._read_route_file(Path(SYSCONFIG_PATH).joinpath("routes"))
+        for path in Path(SYSCONFIG_PATH).glob("ifroute-*"):
+            self._read_route_file(path)
+        self._update_routes()
+
     def _parse_config(self, path: Path) -> Dict[str, Optional[str]]:
         with path.open("r") as f:
             contents = f.readlines()
@@ -223,85 +366,129 @@ class Network(Ticker):
                 # (also doesn't handle embedded quotes, as above)
                 fout.write(f'{field}="{new_config[field]}"\n')
 
+    def _write_file(self, path: Path, contents: Optional[str]) -> bool:
+        """
+        Write `contents` to `path`, or remove it if `None`, unless that's
+        what it already has. Returns whether the file changed.
+        """
+        current: Optional[str] = None
+        if path.exists():
+            current = path.read_text("utf-8")
+        if current == contents:
+            return False
+        if contents is None:
+            logger.info(f"Removing {path}")
+            path.unlink()
+        else:
+            logger.info(f"Writing {path}")
+            with atomic_write(path, overwrite=True) as f:
+                f.write(contents)
+        return True
+
     def _update_route_file(
         self, path: Path, interface: str, routes: List[RouteModel]
-    ):
+    ) -> bool:
+        # No routes for this interface, delete config file if present
+        contents: Optional[str] = None
         if routes:
-            with atomic_write(path, overwrite=True) as f:
-                for route in routes:
-                    f.write(
-                        f"{route.destination} {route.gateway} - {route.interface}\n"
-                    )
-        else:
-            # No routes for this interface, delete config file if present
-            path.unlink(missing_ok=True)
-
-    # TODO: This should probably just take a NetworkConfigModel,
-    # rather that separate interfaces, nameservers, routes.
-    async def apply_config(
-        self,
-        interfaces: Dict[str, InterfaceModel],
-        nameservers: List[str],
-        routes: List[RouteModel],
-    ) -> None:
-        logger.debug("In Network.apply_config()")
-        self._is_busy = True
-        sysconfig = Path("/etc/sysconfig/network")
+            contents = "".join(
+                f"{route.destination} {route.gateway} - {route.interface}\n"
+                for route in routes
+            )
+        return self._write_file(path, contents)
 
+    def _render_interface_config(self, config: InterfaceConfigModel) -> str:
+        contents = (
+            f"STARTMODE='auto'\n"
+            f"BOOTPROTO='{config.bootproto}'\n"
+            f"IPADDR='{config.ipaddr}'\n"
+        )
+        if config.bonding_slaves:
+            contents += "BONDING_MASTER='yes'\n"
+            for i, s in enumerate(config.bonding_slaves):
+                contents += f"BONDING_SLAVE{i}='{s}'\n"
+            contents += "BONDING_MODULE_OPTS='mode=active-backup miimon=100'\n"
+        return contents
+
+    def _write_interfaces(
+        self, interfaces: Dict[str, InterfaceModel]
+    ) -> Set[str]:
+        """Write interface configs, returning which interfaces changed."""
+        sysconfig = Path(SYSCONFIG_PATH)
+        changed: Set[str] = set()
         bonding_slave_interfaces: List[str] = []
+        for model in interfaces.values():
+            if model.config is not None and model.config.bonding_slaves:
+                bonding_slave_interfaces.extend(model.config.bonding_slaves)
         for iface in interfaces:
+            if iface in bonding_slave_interfaces:
+                continue
             conf = sysconfig.joinpath(f"ifcfg-{iface}")
             new_config = interfaces[iface].config
-            if new_config is None:
-                # interface with no config, so get rid of it
-                conf.unlink(missing_ok=True)
-                continue
-            # This is destructive of any existing config
-            # (i.e. we're not mergeing here, we're clobbering)
-            logger.info(f"Writing {conf}")
-            with atomic_write(conf, overwrite=True) as f:
-                f.write(
-                    f"STARTMODE='auto'\n"
-                    f"BOOTPROTO='{new_config.bootproto}'\n"
-                    f"IPADDR='{new_config.ipaddr}'\n"
-                )
-                if new_config.bonding_slaves:
-                    f.write("BONDING_MASTER='yes'\n")
-                    for i, s in enumerate(new_config.bonding_slaves):
-                        f.write(f"BONDING_SLAVE{i}='{s}'\n")
-                        bonding_slave_interfaces.append(s)
-                    f.write(
-                        "BONDING_MODULE_OPTS='mode=active-backup miimon=100'\n"
-                    )
+            # interface with no config, so get rid of it. Otherwise, this is
+            # destructive of any existing config (i.e. we're not merging
+            # here, we're clobbering)
+            contents: Optional[str] = None
+            if new_config is not None:
+                contents = self._render_interface_config(new_config)
+            if self._write_file(conf, contents):
+                changed.add(iface)
         # special case for bonding slave interfaces, if any, which need to be
         # overwritten with STARTMODE=hotplug, BOOTPROTO=none
         for iface in bonding_slave_interfaces:
             conf = sysconfig.joinpath(f"ifcfg-{iface}")
-            logger.info(f"Writing {conf}")
-            with atomic_write(conf, overwrite=True) as f:
-                f.write("STARTMODE='hotplug'\nBOOTPROTO='none'\n")
-        self._refresh_interfaces()
-
-        # Write nameserver config
-        self._update_config(
-            Path("/etc/sysconfig/network/config"),
-            {"NETCONFIG_DNS_STATIC_SERVERS": " ".join(nameservers)},
-        )
-        self._refresh_nameservers()
-
-        # Write route config
+            if self._write_file(
+                conf, "STARTMODE='hotplug'\nBOOTPROTO='none'\n"
+            ):
+                changed.add(iface)
+        return changed
+
+    def _write_routes(self, routes: List[RouteModel]) -> Tuple[Set[str], bool]:
+        """
+        Write route configs, returning the interfaces whose routes changed,
+        and whether the global routes changed.
+        """
+        sysconfig = Path(SYSCONFIG_PATH)
+        changed: Set[str] = set()
         for iface in self._interfaces:
-            self._update_route_file(
-                Path(f"/etc/sysconfig/network/ifroute-{iface}"),
+            if self._update_route_file(
+                sysconfig.joinpath(f"ifroute-{iface}"),
                 iface,
                 [route for route in routes if route.interface == iface],
-            )
-        self._update_route_file(
-            Path("/etc/sysconfig/network/routes"),
+            ):
+                changed.add(iface)
+        global_changed = self._update_route_file(
+            sysconfig.joinpath("routes"),
             "-",
             [route for route in routes if route.interface == "-"],
         )
-        self._refresh_routes()
+        return changed, global_changed
+
+    async def _reload(
+        self, interfaces: List[str], all_routes: bool, nameservers: bool
+    ) -> None:
+        """Reload only what changed, restarting everything if we can't."""
+        cmds: List[List[str]] = []
+        if all_routes:
+            # global routes may apply to any interface; wicked only reloads
+            # the interfaces whose configuration did change.
+            cmds.append(["wicked", "ifreload", "all"])
+        elif interfaces:
+            cmds.append(["wicked", "ifreload"] + interfaces)
+        if nameservers:
+            cmds.append(["netconfig", "update", "-f"])
+        if not cmds:
+            logger.info("Network config unchanged, nothing to reload.")
+            return
+
+        for cmd in cmds:
+            logger.info(f"Reloading network: {' '.join(cmd)}")
+            ret, _, err = await aqr_run_cmd(cmd)
+            if ret != 0:
+                logger.error(f"Unable to reload network: {err}")
+                break
+        else:
+            return
 
         logger.info("Restarting network services...")
         ret, _, err = await aqr_run_cmd(
@@ -309,4 +496,87 @@ class Network(Ticker):
         )
         # TODO: can this fail?
         logger.info("Restarted network services")
-        self._is_busy = False
+
+    async def _verify(
+        self, interfaces: Dict[str, InterfaceModel], changed: Set[str]
+    ) -> List[str]:
+        """
+        Check changed, statically configured, interfaces have the address
+        they're supposed to. Returns those that don't.
+        """
+        expected: Dict[str, str] = {}
+        for iface in changed:
+            model = interfaces.get(iface)
+            if model is None or model.config is None:
+                continue
+            if model.config.bootproto != "static" or not model.config.ipaddr:
+                continue
+            expected[iface] = model.config.ipaddr.split("/")[0]
+
+        deadline = time.monotonic() + VERIFY_TIMEOUT
+        while True:
+            mismatched = sorted(
+                iface
+                for iface, addr in expected.items()
+                if get_ipv4_address(iface).split("/")[0] != addr
+            )
+            if not mismatched or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(VERIFY_INTERVAL)
+
+        for iface in mismatched:
+            logger.warning(
+                f"Interface {iface} does not have address {expected[iface]}"
+            )
+        return mismatched
+
+    # TODO: This should probably just take a NetworkConfigModel,
+    # rather that separate interfaces, nameservers, routes.
+    async def apply_config(
+        self,
+        interfaces: Dict[str, InterfaceModel],
+        nameservers: List[str],
+        routes: List[RouteModel],
+    ) -> NetworkApplyResultModel:
+        """
+        Write only the configuration that changed, and reload only the
+        affected interfaces, so everything else keeps running undisturbed.
+        """
+        logger.debug("In Network.apply_config()")
+        self._is_busy = True
+        try:
+            # make sure we're comparing against what's on disk right now.
+            self._refresh_interfaces()
+            self._refresh_nameservers()
+            self._refresh_routes()
+
+            changed = self._write_interfaces(interfaces)
+            self._refresh_interfaces()
+
+            nameservers_changed = nameservers != self._nameservers
+            if nameservers_changed:
+                # Write nameserver config
+                self._update_config(
+                    Path(SYSCONFIG_PATH).joinpath("config"),
+                    {"NETCONFIG_DNS_STATIC_SERVERS": " ".join(nameservers)},
+                )
+                self._refresh_nameservers()
+
+            # Write route config
+            route_ifaces, global_routes_changed = self._write_routes(routes)
+            self._refresh_routes()
+
+            reload = sorted(changed | route_ifaces)
+            await self._reload(
+                reload, global_routes_changed, nameservers_changed
+            )
+            mismatched = await self._verify(interfaces, changed)
+        finally:
+            self._is_busy = False
+
+        return NetworkApplyResultModel(
+            interfaces=reload,
+            nameservers=nameservers_changed,
+            routes=global_routes_changed,
+            mismatched=mismatched,
+        )
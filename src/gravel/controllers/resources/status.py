@@ -79,6 +79,12 @@ class Status(Ticker):
             latest_pool_stats[pool.pool_id] = pool
         self._latest_pools_stats = latest_pool_stats
 
+        self._notify("status", self._latest_cluster)
+        try:
+            self._notify("client-io-rates", self.client_io_rate)
+        except ClientIORateNotAvailableError:
+            pass
+
     @property
     def status(self) -> CephStatusModel:
         if not self._latest_cluster:
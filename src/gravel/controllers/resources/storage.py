@@ -113,3 +113,4 @@ class Storage(Ticker):
             by_name[p.name] = pool
         self._state.pools_by_name = by_name
         self._state.pools_by_id = by_id
+        self._notify("storage", self._state)
@@ -0,0 +1,159 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Versioned snapshots of a resource's state. Each time the state changes we
+bump its version and keep a JSON-patch (RFC 6902) delta from the previous
+version, so clients that already hold a recent version only need to be sent
+what changed since. Deltas are computed once, when the state is updated, and
+only a bounded number of them is kept; clients too far behind are sent the
+full state instead. Versions start over whenever we do, so each set of
+snapshots has a random epoch, which clients must hand back along with their
+version; clients holding a version from another epoch get the full state.
+"""
+
+from collections import deque
+from typing import Any, Deque, List, Optional, Tuple
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
+
+MAX_SNAPSHOT_HISTORY = 64
+
+
+class PatchOpModel(BaseModel):
+    op: str = Field(title="One of 'add', 'remove' or 'replace'.")
+    path: str = Field(title="JSON pointer to the changed value.")
+    value: Any = Field(None, title="New value, if any.")
+
+
+class SnapshotModel(BaseModel):
+    epoch: str = Field("", title="Epoch the version belongs to.")
+    version: int = Field(0, title="Version of the state.")
+    full: bool = Field(True, title="Whether this is the full state.")
+    data: Any = Field(None, title="The full state, if 'full'.")
+    patch: List[PatchOpModel] = Field(
+        [], title="Operations to apply to the requested version, if not 'full'."
+    )
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def json_diff(old: Any, new: Any, path: str = "") -> List[PatchOpModel]:
+    """
+    Obtain the operations turning `old` into `new`, both plain JSON values.
+    Lists changing in length are replaced as a whole.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: List[PatchOpModel] = []
+        for key in old:
+            if key not in new:
+                ops.append(
+                    PatchOpModel(op="remove", path=f"{path}/{_escape(key)}")
+                )
+        for key, value in new.items():
+            keypath = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append(PatchOpModel(op="add", path=keypath, value=value))
+            else:
+                ops.extend(json_diff(old[key], value, keypath))
+        return ops
+    elif (
+        isinstance(old, list) and isinstance(new, list) and len(old) == len(new)
+    ):
+        ops = []
+        for idx, (a, b) in enumerate(zip(old, new)):
+            ops.extend(json_diff(a, b, f"{path}/{idx}"))
+        return ops
+    elif old == new and type(old) == type(new):
+        return []
+    return [PatchOpModel(op="replace", path=path, value=new)]
+
+
+class Snapshots:
+    """Versioned state of a resource, with a bounded history of deltas."""
+
+    _epoch: str
+    _version: int
+    _state: Any
+    _history: Deque[Tuple[int, List[PatchOpModel]]]
+
+    def __init__(self, history: int = MAX_SNAPSHOT_HISTORY) -> None:
+        self._epoch = uuid4().hex
+        self._version = 0
+        self._state = None
+        # (version, patch from version - 1 to version)
+        self._history = deque(maxlen=history)
+
+    @property
+    def epoch(self) -> str:
+        return self._epoch
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def state(self) -> Any:
+        """Latest state, JSON encoded."""
+        return self._state
+
+    def update(self, data: Any) -> bool:
+        """Record a new state, returning whether it changed."""
+        state = jsonable_encoder(data)
+        if self._version > 0:
+            patch = json_diff(self._state, state)
+            if not patch:
+                return False
+            self._history.append((self._version + 1, patch))
+        self._state = state
+        self._version += 1
+        return True
+
+    def get(
+        self, since: Optional[int] = None, epoch: Optional[str] = None
+    ) -> SnapshotModel:
+        """
+        Obtain what changed since version `since` of epoch `epoch`, or the
+        full state if we can't tell.
+        """
+        if (
+            since is not None
+            and epoch == self._epoch
+            and 0 < since <= self._version
+        ):
+            if since == self._version:
+                return SnapshotModel(
+                    epoch=self._epoch, version=self._version, full=False
+                )
+            oldest = self._history[0][0] if self._history else None
+            if oldest is not None and oldest <= since + 1:
+                patch: List[PatchOpModel] = []
+                for version, ops in self._history:
+                    if version > since:
+                        patch.extend(ops)
+                return SnapshotModel(
+                    epoch=self._epoch,
+                    version=self._version,
+                    full=False,
+                    patch=patch,
+                )
+        return SnapshotModel(
+            epoch=self._epoch,
+            version=self._version,
+            full=True,
+            data=self._state,
+        )
@@ -11,47 +11,25 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-from __future__ import annotations
-
 import asyncio
+import fcntl
+import ipaddress
 import random
+import socket
 import string
+import struct
 from logging import Logger
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar, Union
+from typing import List, Optional, Tuple, Type, TypeVar
 
 from fastapi.logger import logger as fastapi_logger
-from pydantic import BaseModel, root_validator
+from pydantic import BaseModel
 from pydantic.tools import parse_file_as
 
 logger: Logger = fastapi_logger
 
-
-class HWEntryModel(BaseModel):
-    id: str
-    cls: str
-    claimed: Optional[bool]
-    product: Optional[str]
-    vendor: Optional[str]
-    logicalname: Optional[Union[str, List[str]]]
-    configuration: Optional[Dict[str, Any]]
-    capabilities: Optional[Dict[str, Any]]
-    size: Optional[int]
-    units: Optional[str]
-    capacity: Optional[int]
-    children: Optional[List[HWEntryModel]]
-
-    @root_validator(pre=True)
-    def class_to_cls(cls, values: Dict[str, Any]) -> Dict[str, Any]:
-        if "class" in values:
-            values["cls"] = values["class"]
-            del values["class"]
-        return values
-
-
-# ensure pydantic updates forward references, because we're using a
-# self-referencing model.
-HWEntryModel.update_forward_refs()
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891B
 
 
 def _get_file_path(dirpath: Path, name: str) -> Path:
@@ -111,16 +89,14 @@ def random_string(length: int) -> str:
     return "".join(random.choices(string.printable, k=length))
 
 
-async def lshw() -> HWEntryModel:
-    cmd = ["lshw", "-json"]
-    process = await asyncio.create_subprocess_exec(
-        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
-    assert process.stdout
-    assert process.stderr
-
-    retcode = await asyncio.wait_for(process.wait(), None)
-    assert retcode == 0
-    out = await process.stdout.read()
-    outstr = out.decode("utf-8")
-    return HWEntryModel.parse_raw(outstr)
+def get_ipv4_address(ifname: str) -> str:
+    """Obtain an interface's address, as `addr/prefix`, or "" if none."""
+    name = struct.pack("256s", ifname.encode("utf-8")[:15])
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            addr = fcntl.ioctl(s.fileno(), SIOCGIFADDR, name)[20:24]
+            mask = fcntl.ioctl(s.fileno(), SIOCGIFNETMASK, name)[20:24]
+        except OSError:
+            return ""
+    net = ipaddress.IPv4Network(f"0.0.0.0/{socket.inet_ntoa(mask)}")
+    return f"{socket.inet_ntoa(addr)}/{net.prefixlen}"
@@ -11,11 +11,22 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
+import bisect
 import logging
 import os
 import sys
 from types import SimpleNamespace
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, cast
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
 
 import httpx
 import pytest
@@ -101,7 +112,12 @@ class FakeKV(KV):
         self._is_closing = False
 
         self._storage: Dict[str, Any] = {}
-        self._watchers: Dict[str, Dict[int, Callable[[str, str], None]]] = {}
+        self._watchers: Dict[
+            str, Dict[int, Callable[[str, Optional[str]], None]]
+        ] = {}
+        self._prefix_watchers: Dict[
+            str, Dict[int, Callable[[str, Optional[str]], None]]
+        ] = {}
         self._watch_id_count = 0
 
     def init(self) -> None:
@@ -120,9 +136,15 @@ class FakeKV(KV):
         """Put key/value pair"""
         assert self._is_open
         self._storage[key] = value
-        if key in self._watchers:
-            for cb in self._watchers[key].values():
-                cb(key, value)
+        self._notify(key, value)
+
+    def _notify(self, key: str, value: Optional[str]) -> None:
+        callbacks = list(self._watchers.get(key, {}).values())
+        for prefix, watchers in self._prefix_watchers.items():
+            if key.startswith(prefix):
+                callbacks.extend(watchers.values())
+        for cb in callbacks:
+            cb(key, value)
 
     async def get(self, key: str) -> Optional[str]:
         """Get value for provided key"""
@@ -145,6 +167,7 @@ class FakeKV(KV):
         assert self._is_open
         if key in self._storage:
             del self._storage[key]
+            self._notify(key, None)
 
     async def lock(self, key: str):  # type: ignore
         """Lock a given key. Requires compliant consumers."""
@@ -152,22 +175,91 @@ class FakeKV(KV):
         raise Exception("TODO")
 
     async def watch(
-        self, key: str, callback: Callable[[str, str], None]
+        self, key: str, callback: Callable[[str, Optional[str]], None]
     ) -> int:
         """Watch updates on a given key"""
-        if "key" not in self._watchers:
+        if key not in self._watchers:
             self._watchers[key] = {}
         watch_id = self._watch_id_count
         self._watch_id_count += 1
         self._watchers[key][watch_id] = callback
         return watch_id
 
+    async def watch_prefix(
+        self, key_prefix: str, callback: Callable[[str, Optional[str]], None]
+    ) -> int:
+        """Watch updates on all keys with a given prefix"""
+        if key_prefix not in self._prefix_watchers:
+            self._prefix_watchers[key_prefix] = {}
+        watch_id = self._watch_id_count
+        self._watch_id_count += 1
+        self._prefix_watchers[key_prefix][watch_id] = callback
+        return watch_id
+
     async def cancel_watch(self, watch_id: int) -> None:
         """Cancel a watch"""
-        assert self._client
-        for key, values in self._watchers.items():
-            if watch_id in values:
-                del self._watchers[key][watch_id]
+        for watchers in (self._watchers, self._prefix_watchers):
+            for key, values in watchers.items():
+                if watch_id in values:
+                    del watchers[key][watch_id]
+
+
+class FakeDB(Dict[bytes, bytes]):
+    """Enough of a gdbm database for get_prefix()."""
+
+    _keys: List[bytes] = []
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        super().__setitem__(key, value)
+
+    def firstkey(self) -> Optional[bytes]:
+        self._keys = sorted(self.keys())
+        return self._keys[0] if self._keys else None
+
+    def nextkey(self, key: bytes) -> Optional[bytes]:
+        idx = bisect.bisect_right(self._keys, key)
+        return self._keys[idx] if idx < len(self._keys) else None
+
+
+class FakeIoctx:
+    """Serves omap entries in pages, like librados does."""
+
+    def __init__(self, omap: Dict[str, bytes]):
+        self.omap = omap
+        self.pages: List[Tuple[str, int]] = []
+        self._result: List[Tuple[str, bytes]] = []
+
+    def get_omap_vals(
+        self, op: Any, start_after: str, filter_prefix: str, max_return: int
+    ) -> Tuple[Iterator[Tuple[str, bytes]], int]:
+        self.pages.append((start_after, max_return))
+        self._result = [
+            (k, v)
+            for k, v in sorted(self.omap.items())
+            if k > start_after and k.startswith(filter_prefix)
+        ][:max_return]
+        return iter(self._result), 0
+
+    def operate_read_op(self, op: Any, obj: str) -> None:
+        assert obj == "kvstore"
+
+
+@pytest.fixture()
+def omap_kv(mocker: MockerFixture) -> KV:
+    """A real KV, on top of a fake omap and dbm."""
+    mock_ceph_modules(mocker)
+    mocker.patch("gravel.controllers.kv.rados", create=True)
+    kv = KV()
+    kv._ioctx = FakeIoctx({})  # type: ignore
+    kv._db = FakeDB()  # type: ignore
+    kv._watches = {}
+    kv._prefix_watches = {}
+    kv._next_watch_id = 1
+    return kv
 
 
 @pytest.fixture()
@@ -185,6 +277,7 @@ async def aquarium_startup(
         from fastapi.logger import logger as fastapi_logger
 
         from gravel.cephadm.cephadm import Cephadm
+        from gravel.controllers.auth import AuthContext
         from gravel.controllers.ceph.ceph import Ceph, Mgr, Mon
         from gravel.controllers.config import Config
         from gravel.controllers.inventory.inventory import Inventory
@@ -260,6 +353,8 @@ async def aquarium_startup(
         config.init()
         kvstore.init()
 
+        gstate.add_auth(AuthContext(gstate.store, gstate.config.options.auth))
+
         # init node mgr
         nodemgr: NodeMgr = FakeNodeMgr(gstate)
         nodemgr.init()
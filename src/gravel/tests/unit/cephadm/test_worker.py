@@ -0,0 +1,179 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import asyncio
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gravel.cephadm.cephadm import (
+    Cephadm,
+    CephadmWorker,
+    CephadmWorkerError,
+    CephadmWorkerUnavailableError,
+)
+
+FAKE_CEPHADM = """
+import os
+import sys
+import time
+
+def main():
+    cmd = sys.argv[1]
+    if cmd == "echo":
+        print(" ".join(sys.argv[2:]))
+        print("to stderr", file=sys.stderr)
+    elif cmd == "lines":
+        for i in range(3):
+            print(f"line {i}", flush=True)
+    elif cmd == "pid":
+        print(os.getppid())
+    elif cmd == "sleep":
+        time.sleep(float(sys.argv[2]))
+    elif cmd == "echo-die":
+        print("dying", flush=True)
+        time.sleep(0.2)
+        os.kill(os.getppid(), 9)
+        time.sleep(5)
+    elif cmd == "die":
+        os.kill(os.getppid(), 9)
+        time.sleep(5)
+    elif cmd == "orphan":
+        with open(sys.argv[2], "w") as f:
+            f.write(str(os.getpid()))
+        os.kill(os.getppid(), 9)
+        time.sleep(30)
+    sys.exit(3 if cmd == "fail" else 0)
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+@pytest.fixture
+def fake_cephadm(tmp_path: Path) -> Path:
+    path = tmp_path.joinpath("cephadm")
+    path.write_text(FAKE_CEPHADM)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_worker_call(fake_cephadm: Path) -> None:
+    worker = CephadmWorker([str(fake_cephadm)])
+    out, err, rc = await worker.call(["echo", "foo", "bar"])
+    assert out == "foo bar\n"
+    assert err == "to stderr\n"
+    assert rc == 0
+
+    _, _, rc = await worker.call(["fail"])
+    assert rc == 3
+
+    lines: List[str] = []
+    out, _, _ = await worker.call(["lines"], lines.append)
+    assert lines == ["line 0\n", "line 1\n", "line 2\n"]
+
+    # every call is served by the same worker.
+    pids = await asyncio.gather(*[worker.call(["pid"]) for _ in range(6)])
+    assert len({out for out, _, _ in pids}) == 1
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_worker_concurrency(fake_cephadm: Path) -> None:
+    worker = CephadmWorker([str(fake_cephadm)])
+    await worker.call(["echo"])
+    loop = asyncio.get_event_loop()
+    begin = loop.time()
+    await asyncio.gather(*[worker.call(["sleep", "0.3"]) for _ in range(4)])
+    assert loop.time() - begin < 1.0
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_worker_restart(fake_cephadm: Path) -> None:
+    worker = CephadmWorker([str(fake_cephadm)])
+    # the call was forked, so it can't be retried elsewhere.
+    with pytest.raises(CephadmWorkerError) as e:
+        await worker.call(["die"])
+    assert not isinstance(e.value, CephadmWorkerUnavailableError)
+    # started anew.
+    out, _, _ = await worker.call(["echo", "again"])
+    assert out == "again\n"
+
+    with pytest.raises(CephadmWorkerError) as e:
+        await worker.call(["echo-die"])
+    assert not isinstance(e.value, CephadmWorkerUnavailableError)
+    with pytest.raises(CephadmWorkerError):
+        await worker.call(["die"])
+    assert not worker.available
+    with pytest.raises(CephadmWorkerUnavailableError):
+        await worker.call(["echo"])
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return False
+    # reparented children may linger as zombies until reaped.
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+@pytest.mark.asyncio
+async def test_worker_children_die(fake_cephadm: Path, tmp_path: Path) -> None:
+    worker = CephadmWorker([str(fake_cephadm)])
+    pidfile = tmp_path.joinpath("pid")
+    with pytest.raises(CephadmWorkerError):
+        await worker.call(["orphan", str(pidfile)])
+    pid = int(pidfile.read_text())
+    for _ in range(50):
+        if not _is_running(pid):
+            break
+        await asyncio.sleep(0.1)
+    assert not _is_running(pid)
+
+
+@pytest.mark.asyncio
+async def test_cephadm_fallback(
+    fake_cephadm: Path, mocker: MockerFixture
+) -> None:
+    cephadm = Cephadm()
+    cephadm.cephadm = ["python3", str(fake_cephadm)]
+    worker = mocker.MagicMock()
+    worker.available = True
+    worker.call = mocker.AsyncMock(
+        side_effect=CephadmWorkerUnavailableError("nope")
+    )
+    cephadm._worker = worker
+    out, _, rc = await cephadm.call(["echo", "fallback"], noimage=True)
+    assert out == "fallback\n"
+    assert rc == 0
+    worker.call.assert_called_once_with(["echo", "fallback"], None)
+
+
+@pytest.mark.asyncio
+async def test_cephadm_worker_exits(fake_cephadm: Path) -> None:
+    cephadm = Cephadm()
+    cephadm.cephadm = ["python3", str(fake_cephadm)]
+    worker = CephadmWorker(cephadm.cephadm)
+    # a worker that exits straight away, e.g. because it can't load cephadm.
+    worker._cmd = [sys.executable, "-c", "pass"]
+    cephadm._worker = worker
+    for _ in range(4):
+        out, _, rc = await cephadm.call(["echo", "fallback"], noimage=True)
+        assert out == "fallback\n"
+        assert rc == 0
+    assert not worker.available
@@ -17,7 +17,6 @@ import json
 import os
 from typing import Callable, List
 
-from pydantic import parse_obj_as
 from pytest_mock import MockerFixture
 
 from gravel.controllers.ceph.models import OrchDevicesPerHostModel
@@ -41,29 +40,3 @@ def test_device_ls(
     )
     res: List[OrchDevicesPerHostModel] = orch.devices_ls()
     assert res[0].name == "asd"
-
-
-def test_devices_assimilated(
-    get_data_contents: Callable[[str, str], str],
-    mocker: MockerFixture,
-    gstate: GlobalState,
-) -> None:
-    def device_ls_gen():
-        raw = json.loads(
-            get_data_contents(DATA_DIR, "device_ls_not_available.json")
-        )
-        devicels = parse_obj_as(List[OrchDevicesPerHostModel], raw)
-        yield devicels
-        devicels[0].devices[1].available = True
-        yield devicels
-
-    from gravel.controllers.ceph.orchestrator import Orchestrator
-
-    orch = Orchestrator(gstate.ceph_mgr)
-
-    devicegen = device_ls_gen()
-    orch.devices_ls = mocker.MagicMock(return_value=next(devicegen))
-    assert orch.devices_assimilated("asd", ["/dev/vdb", "/dev/vdc"])
-
-    orch.devices_ls = mocker.MagicMock(return_value=next(devicegen))
-    assert not orch.devices_assimilated("asd", ["/dev/vdc"])
@@ -0,0 +1,155 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportUnknownMemberType=false
+
+import asyncio
+import json
+import os
+from typing import Callable
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gravel.controllers.ceph.ceph import CephCommandError
+from gravel.controllers.ceph.orchestrator import Orchestrator
+from gravel.controllers.ceph.waiter import MAX_POLL_FAILURES, OrchWaiter
+from gravel.controllers.gstate import GlobalState
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def fast_poll(mocker: MockerFixture) -> None:
+    mocker.patch("gravel.controllers.ceph.waiter.MIN_POLL_INTERVAL", 0.01)
+    mocker.patch("gravel.controllers.ceph.waiter.MAX_POLL_INTERVAL", 0.02)
+
+
+def test_devices_availability(
+    get_data_contents: Callable[[str, str], str],
+    mocker: MockerFixture,
+    gstate: GlobalState,
+) -> None:
+    orch = Orchestrator(gstate.ceph_mgr)
+    call = mocker.MagicMock(
+        return_value=json.loads(
+            get_data_contents(DATA_DIR, "device_ls_not_available.json")
+        )
+    )
+    orch.call = call  # type: ignore
+    avail = orch.devices_availability("asd", refresh=True)
+    assert avail["/dev/vdb"] is False
+    cmd = call.call_args[0][0]
+    assert cmd["hostname"] == ["asd"]
+    assert cmd["refresh"] is True
+    assert orch.devices_availability("foo") == {}
+
+
+@pytest.mark.asyncio
+async def test_wait_host_added(
+    fast_poll: None, mocker: MockerFixture, gstate: GlobalState
+) -> None:
+    waiter = OrchWaiter(gstate.ceph_mgr)
+    host_names = mocker.MagicMock(side_effect=[set(), {"foo"}, {"foo", "bar"}])
+    waiter._orch.host_names = host_names  # type: ignore
+
+    # both waiters are served by the same polls.
+    await asyncio.gather(
+        waiter.wait_host_added("foo", timeout=1.0),
+        waiter.wait_host_added("bar", timeout=1.0),
+    )
+    assert host_names.call_count == 3
+    assert waiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_host_added_timeout(
+    fast_poll: None, mocker: MockerFixture, gstate: GlobalState
+) -> None:
+    waiter = OrchWaiter(gstate.ceph_mgr)
+    waiter._orch.host_names = mocker.MagicMock(  # type: ignore
+        return_value=set()
+    )
+    with pytest.raises(asyncio.TimeoutError):
+        await waiter.wait_host_added("foo", timeout=0.05)
+    assert waiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_devices_assimilated(
+    fast_poll: None, mocker: MockerFixture, gstate: GlobalState
+) -> None:
+    waiter = OrchWaiter(gstate.ceph_mgr)
+    availability = mocker.MagicMock(
+        side_effect=[
+            {},
+            {"/dev/vdb": True, "/dev/vdc": True},
+            {"/dev/vdb": False, "/dev/vdc": True},
+            {"/dev/vdb": False, "/dev/vdc": False},
+        ]
+    )
+    waiter._orch.devices_availability = availability  # type: ignore
+
+    await waiter.wait_devices_assimilated(
+        "foo", ["/dev/vdb", "/dev/vdc"], timeout=1.0
+    )
+    assert availability.call_count == 4
+    # only the first poll asks the orchestrator to refresh.
+    refresh = [c[0][1] for c in availability.call_args_list]
+    assert refresh == [True, False, False, False]
+
+    # nothing to wait for.
+    await waiter.wait_devices_assimilated("foo", [], timeout=1.0)
+    assert availability.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_wait_devices_error(
+    fast_poll: None, mocker: MockerFixture, gstate: GlobalState
+) -> None:
+    waiter = OrchWaiter(gstate.ceph_mgr)
+    availability = mocker.MagicMock(
+        side_effect=[CephCommandError("oops"), {"/dev/vdb": False}]
+    )
+    waiter._orch.devices_availability = availability  # type: ignore
+
+    # failed polls are retried, refreshing if the failed one was to.
+    await waiter.wait_devices_assimilated("foo", ["/dev/vdb"], timeout=1.0)
+    refresh = [c[0][1] for c in availability.call_args_list]
+    assert refresh == [True, True]
+
+    # until they fail too many times in a row.
+    availability.side_effect = CephCommandError("oops")
+    availability.reset_mock()
+    with pytest.raises(CephCommandError):
+        await waiter.wait_devices_assimilated("foo", ["/dev/vdb"], timeout=1.0)
+    assert availability.call_count == MAX_POLL_FAILURES
+
+
+@pytest.mark.asyncio
+async def test_wait_host_error(
+    fast_poll: None, mocker: MockerFixture, gstate: GlobalState
+) -> None:
+    waiter = OrchWaiter(gstate.ceph_mgr)
+    host_names = mocker.MagicMock(
+        side_effect=[CephCommandError("oops")] * 2 + [{"foo"}]
+    )
+    waiter._orch.host_names = host_names  # type: ignore
+    await waiter.wait_host_added("foo", timeout=1.0)
+    assert host_names.call_count == 3
+
+    host_names.side_effect = CephCommandError("oops")
+    host_names.reset_mock()
+    with pytest.raises(CephCommandError):
+        await waiter.wait_host_added("bar", timeout=1.0)
+    assert host_names.call_count == MAX_POLL_FAILURES
@@ -0,0 +1,221 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import hashlib
+import json
+import ssl
+from pathlib import Path
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from gravel.controllers.deployment.client import (
+    DIGEST_HEADER,
+    JoinClient,
+    JoinClientError,
+)
+from gravel.controllers.deployment.join import (
+    JoinReadyParamsModel,
+    JoinReadyReplyModel,
+)
+
+
+@pytest.mark.asyncio
+async def test_join_client() -> None:
+
+    seen: List[httpx.Request] = []
+    statuses = [503, 502, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        status = statuses.pop(0)
+        if status != 200:
+            return httpx.Response(status)
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"success": True, "msg": body["uuid"]})
+
+    uuid = uuid4()
+    params = JoinReadyParamsModel(uuid=uuid)
+    async with JoinClient(
+        "foo:1337", backoff=0.01, transport=httpx.MockTransport(handler)
+    ) as client:
+        reply = await client.post(
+            "/api/deploy/join/ready", params, JoinReadyReplyModel
+        )
+    assert reply.success
+    assert reply.msg == str(uuid)
+    assert len(seen) == 3
+    assert str(seen[0].url) == "https://foo:1337/api/deploy/join/ready"
+    assert seen[0].headers["content-type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_join_client_errors() -> None:
+
+    calls = 0
+
+    def unavailable(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        raise httpx.ConnectError("nope", request=request)
+
+    params = JoinReadyParamsModel(uuid=uuid4())
+    async with JoinClient(
+        "http://foo",
+        retries=2,
+        backoff=0.01,
+        transport=httpx.MockTransport(unavailable),
+    ) as client:
+        with pytest.raises(JoinClientError) as e:
+            await client.post("/", params, JoinReadyReplyModel)
+    assert e.value.message == "Unable to connect."
+    assert calls == 3
+
+    def bad_cert(request: httpx.Request) -> httpx.Response:
+        try:
+            raise ssl.SSLError("bad cert")
+        except ssl.SSLError:
+            raise httpx.ConnectError("bad cert", request=request)
+
+    async with JoinClient(
+        "foo", transport=httpx.MockTransport(bad_cert)
+    ) as client:
+        with pytest.raises(JoinClientError) as e:
+            await client.post("/", params, JoinReadyReplyModel)
+    assert e.value.message == "SSL Error."
+
+    def bad_reply(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"foo": "bar"})
+
+    async with JoinClient(
+        "foo", transport=httpx.MockTransport(bad_reply)
+    ) as client:
+        with pytest.raises(JoinClientError) as e:
+            await client.post("/", params, JoinReadyReplyModel)
+    assert e.value.message == "Unable to parse response."
+
+    def not_found(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(404)
+
+    async with JoinClient(
+        "foo", transport=httpx.MockTransport(not_found)
+    ) as client:
+        with pytest.raises(JoinClientError) as e:
+            await client.post("/", params, JoinReadyReplyModel)
+    assert e.value.message == "Not Found"
+
+
+class TimeoutTransport(httpx.MockTransport):
+    """Keeps the timeouts each request was sent with."""
+
+    timeouts: List[Dict[str, Any]]
+
+    def __init__(self, handler: Any) -> None:
+        super().__init__(handler)
+        self.timeouts = []
+
+    async def handle_async_request(  # type: ignore
+        self, method, url, headers, stream, extensions
+    ):
+        self.timeouts.append(extensions["timeout"])
+        return await super().handle_async_request(
+            method, url, headers, stream, extensions
+        )
+
+
+@pytest.mark.asyncio
+async def test_join_client_not_idempotent() -> None:
+
+    seen: List[httpx.Request] = []
+    errors: List[Exception] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        if errors:
+            raise errors.pop(0)
+        return httpx.Response(503)
+
+    transport = TimeoutTransport(handler)
+    params = JoinReadyParamsModel(uuid=uuid4())
+    async with JoinClient("foo", backoff=0.01, transport=transport) as client:
+        with pytest.raises(JoinClientError):
+            await client.post("/", params, JoinReadyReplyModel)
+        assert all(t["read"] == 30.0 for t in transport.timeouts)
+        seen.clear()
+
+        # may have been handled, so not retried.
+        with pytest.raises(JoinClientError) as e:
+            await client.post(
+                "/", params, JoinReadyReplyModel, idempotent=False
+            )
+        assert e.value.message == "Service Unavailable"
+        assert len(seen) == 1
+
+        errors.append(httpx.ReadError("nope"))
+        with pytest.raises(JoinClientError) as e:
+            await client.post(
+                "/", params, JoinReadyReplyModel, idempotent=False
+            )
+        assert e.value.message == "Unable to connect."
+        assert len(seen) == 2
+
+        # but never got there, so retried.
+        errors.append(httpx.ConnectError("nope"))
+        with pytest.raises(JoinClientError) as e:
+            await client.post(
+                "/", params, JoinReadyReplyModel, idempotent=False
+            )
+        assert e.value.message == "Service Unavailable"
+        assert len(seen) == 4
+
+        # no read timeout, as we must wait for the remote to be done.
+        assert all(t["read"] is None for t in transport.timeouts[-4:])
+        assert all(t["connect"] == 5.0 for t in transport.timeouts[-4:])
+
+
+@pytest.mark.asyncio
+async def test_join_client_download(tmp_path: Path) -> None:
+
+    content = b"foobarbaz" * 1024
+    digest = f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["x-cluster-token"] == "asd"
+        headers = {DIGEST_HEADER: digest, "X-Image-Id": "1234"}
+        if request.url.path == "/bad":
+            headers[DIGEST_HEADER] = "sha256:0000"
+        elif request.url.path == "/nodigest":
+            del headers[DIGEST_HEADER]
+        return httpx.Response(200, headers=headers, content=content)
+
+    dest = tmp_path.joinpath("image.tar")
+    async with JoinClient(
+        "foo", transport=httpx.MockTransport(handler)
+    ) as client:
+        headers = await client.download(
+            "/good", dest, {"X-Cluster-Token": "asd"}
+        )
+        assert headers["x-image-id"] == "1234"
+        assert dest.read_bytes() == content
+
+        with pytest.raises(JoinClientError) as e:
+            await client.download("/bad", dest, {"X-Cluster-Token": "asd"})
+        assert e.value.message == "Digest mismatch."
+        assert not dest.exists()
+
+        with pytest.raises(JoinClientError) as e:
+            await client.download("/nodigest", dest, {"X-Cluster-Token": "asd"})
+        assert e.value.message == "Missing digest."
+        assert not dest.exists()
@@ -0,0 +1,139 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false, reportUnknownMemberType=false
+
+import asyncio
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+from typing import List
+from uuid import UUID, uuid4
+
+import httpx
+import pytest
+from pyfakefs import fake_filesystem
+from pytest_mock import MockerFixture
+
+from gravel.controllers.gstate import GlobalState
+
+
+@pytest.mark.asyncio
+async def test_join_handler_batches(
+    gstate: GlobalState, mocker: MockerFixture
+) -> None:
+    from gravel.controllers.deployment import join
+    from gravel.controllers.deployment.join import (
+        JoinError,
+        JoinHandlerMgr,
+        JoinRequestEntry,
+        JoinRequestState,
+        UnknownHostError,
+    )
+
+    added: List[str] = []
+
+    def host_add(hostname: str, address: str) -> bool:
+        time.sleep(0.2)
+        added.append(hostname)
+        return hostname != "bad"
+
+    orch = mocker.MagicMock()
+    orch.get_host_addr.side_effect = UnknownHostError("unknown")
+    orch.host_add.side_effect = host_add
+    mocker.patch.object(join, "Orchestrator", return_value=orch)
+    mocker.patch.object(join, "JOIN_BATCH_WINDOW", 0.1)
+    reconcile = mocker.patch.object(JoinHandlerMgr, "_reconcile")
+
+    handler = JoinHandlerMgr(gstate)
+    uuids: List[UUID] = []
+    for hostname in ["foo", "bar", "baz", "bad"]:
+        uuid = uuid4()
+        handler._requests[uuid] = JoinRequestEntry(
+            hostname=hostname,
+            address="127.0.0.1",
+            state=JoinRequestState.STARTED,
+            last_seen=dt.utcnow(),
+        )
+        uuids.append(uuid)
+
+    start = time.monotonic()
+    results = await asyncio.gather(
+        *[handler.handle_ready(uuid) for uuid in uuids],
+        handler.handle_ready(uuids[0]),  # retrying node
+        return_exceptions=True,
+    )
+    # hosts are added concurrently, once each, and the cluster reconciled once.
+    assert time.monotonic() - start < 0.6
+    assert sorted(added) == ["bad", "bar", "baz", "foo"]
+    assert reconcile.call_count == 1
+    assert results[:3] == [None, None, None]
+    assert isinstance(results[3], JoinError)
+    assert results[4] is None
+
+    states = {s.hostname: s for s in handler.get_status()}
+    assert states["foo"].state == JoinRequestState.ADDED
+    assert states["bad"].state == JoinRequestState.ERROR
+    assert states["bad"].msg
+
+    # already added nodes are a no-op.
+    await handler.handle_ready(uuids[0])
+    assert len(added) == 4
+
+    # stale requests are pruned.
+    handler._requests[uuids[1]].last_seen = dt.utcnow() - timedelta(hours=1)
+    handler._requests[uuids[2]].last_seen = dt.utcnow() - timedelta(hours=1)
+    clear = mocker.patch.object(handler._images, "clear")
+    await handler.prune()
+    assert len(handler.get_status()) == 2
+    # nobody's joining anymore, so the image archive can go.
+    clear.assert_called_once()
+
+    handler._requests[uuids[1]] = JoinRequestEntry(
+        hostname="bar",
+        address="127.0.0.1",
+        state=JoinRequestState.STARTED,
+        last_seen=dt.utcnow(),
+    )
+    await handler.prune()
+    clear.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_join_fetch_image(
+    gstate: GlobalState,
+    mocker: MockerFixture,
+    fs: fake_filesystem.FakeFilesystem,
+) -> None:
+    from gravel.controllers.deployment import join
+    from gravel.controllers.deployment.join import (
+        IMAGE_ID_HEADER,
+        JoinRequestMgr,
+    )
+
+    fs.create_dir(join.IMAGE_TMPDIR)
+    image_load = mocker.patch.object(join, "image_load")
+    mocker.patch.object(join, "image_id", return_value="1234")
+    client = mocker.MagicMock()
+    client.download = mocker.AsyncMock(return_value=httpx.Headers({}))
+    mgr = JoinRequestMgr(gstate, mocker.MagicMock())
+
+    # can't tell whether we got the right image.
+    assert not await mgr._fetch_image(client, "asd")
+    image_load.assert_not_called()
+
+    client.download.return_value = httpx.Headers({IMAGE_ID_HEADER: "4321"})
+    assert not await mgr._fetch_image(client, "asd")
+    client.download.return_value = httpx.Headers({IMAGE_ID_HEADER: "1234"})
+    assert await mgr._fetch_image(client, "asd")
+    assert image_load.call_count == 2
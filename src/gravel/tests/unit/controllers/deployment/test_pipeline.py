@@ -0,0 +1,101 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import asyncio
+from typing import List
+
+import pytest
+
+from gravel.controllers.deployment.pipeline import (
+    Pipeline,
+    PipelineError,
+    StageStateEnum,
+)
+from gravel.controllers.errors import GravelError
+
+
+@pytest.mark.asyncio
+async def test_pipeline_order() -> None:
+    order: List[str] = []
+    pull_started = asyncio.Event()
+
+    async def stage(name: str) -> None:
+        order.append(f"{name}:start")
+        if name == "pull":
+            pull_started.set()
+            await asyncio.sleep(0.05)
+        elif name == "ntp":
+            # runs alongside the pull.
+            await asyncio.wait_for(pull_started.wait(), 1.0)
+        order.append(f"{name}:end")
+
+    def mk(name: str):
+        return lambda: stage(name)
+
+    pipeline = Pipeline()
+    pipeline.add("network", mk("network"))
+    pipeline.add("ntp", mk("ntp"), ["network"])
+    pipeline.add("pull", mk("pull"), ["network"])
+    pipeline.add("bootstrap", mk("bootstrap"), ["ntp", "pull"])
+    await pipeline.run()
+
+    assert order[:2] == ["network:start", "network:end"]
+    assert order.index("ntp:end") < order.index("pull:end")
+    assert order[-2:] == ["bootstrap:start", "bootstrap:end"]
+    stages = {s.name: s for s in pipeline.stages}
+    assert all(s.state == StageStateEnum.DONE for s in stages.values())
+    assert stages["pull"].duration >= 0.05
+    assert stages["bootstrap"].deps == ["ntp", "pull"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_failure() -> None:
+    async def fail() -> None:
+        raise GravelError("oops")
+
+    async def slow() -> None:
+        await asyncio.sleep(10)
+
+    async def never() -> None:
+        assert False
+
+    pipeline = Pipeline()
+    pipeline.add("fail", fail)
+    pipeline.add("slow", slow)
+    pipeline.add("after", never, ["fail"])
+    with pytest.raises(GravelError) as e:
+        await asyncio.wait_for(pipeline.run(), 1.0)
+    assert e.value.message == "oops"
+
+    stages = {s.name: s.state for s in pipeline.stages}
+    assert stages["fail"] == StageStateEnum.ERROR
+    assert stages["slow"] == StageStateEnum.SKIPPED
+    assert stages["after"] == StageStateEnum.SKIPPED
+
+
+@pytest.mark.asyncio
+async def test_pipeline_validate() -> None:
+    async def nop() -> None:
+        pass
+
+    pipeline = Pipeline()
+    pipeline.add("a", nop, ["b"])
+    with pytest.raises(PipelineError):
+        pipeline.add("a", nop)
+    with pytest.raises(PipelineError) as e:
+        await pipeline.run()
+    assert "unknown" in e.value.message
+    pipeline.add("b", nop, ["a"])
+    with pytest.raises(PipelineError) as e:
+        await pipeline.run()
+    assert "cycle" in e.value.message
@@ -0,0 +1,95 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+from pathlib import Path
+
+from gravel.controllers.config import Config
+from gravel.controllers.deployment.trace import DurationHistory, Tracer
+
+
+def test_tracer() -> None:
+    tracer = Tracer("create")
+    tracer.stage("start")
+    tracer.add("pull", time.time(), 1.5)
+    tracer.stage("deploying")
+    tracer.step("creating mon")
+    tracer.step("creating mgr")
+    tracer.stage("configure")
+    assert not tracer.finished
+    tracer.finish()
+    assert tracer.finished
+    assert [s.name for s in tracer.stages()] == [
+        "start",
+        "deploying",
+        "configure",
+    ]
+
+    otlp = tracer.to_otlp()
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len(spans) == 7
+    byname = {s["name"]: s for s in spans}
+    root = byname["create"]
+    assert "parentSpanId" not in root
+    assert byname["deploying"]["parentSpanId"] == root["spanId"]
+    assert (
+        byname["creating mon"]["parentSpanId"] == byname["deploying"]["spanId"]
+    )
+    assert byname["pull"]["parentSpanId"] == byname["start"]["spanId"]
+    assert len({s["traceId"] for s in spans}) == 1
+    assert all(int(s["endTimeUnixNano"]) > 0 for s in spans)
+    pull = byname["pull"]
+    pull_ns = int(pull["endTimeUnixNano"]) - int(pull["startTimeUnixNano"])
+    assert abs(pull_ns - 1500000000) < 1000
+
+    # no more spans once finished.
+    tracer.stage("foo")
+    assert len(tracer.stages()) == 3
+
+
+def test_tracer_error() -> None:
+    tracer = Tracer("join")
+    tracer.stage("start")
+    tracer.finish(error=True)
+    spans = tracer.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert all(s["status"]["code"] == 2 for s in spans)
+
+
+def test_duration_history(tmp_path: Path) -> None:
+    config = Config(str(tmp_path))
+    history = DurationHistory(config)
+    stages = ["start", "deploying", "done"]
+
+    tracer = Tracer("create")
+    tracer.stage("start")
+    assert history.eta(tracer, stages) is None
+    tracer.stage("deploying")
+    tracer.finish()
+    history.record(tracer)
+    assert history.eta(tracer, stages) == 0.0
+
+    # persisted, and survives a restart.
+    history = DurationHistory(config)
+    known = history.get("create")
+    assert set(known.keys()) == {"start", "deploying"}
+    known["deploying"] = 10.0
+    history._durations.flows["create"] = known  # type: ignore
+
+    tracer = Tracer("create")
+    tracer.stage("start")
+    eta = history.eta(tracer, stages)
+    assert eta is not None and 10.0 <= eta < 10.1
+    tracer.stage("deploying")
+    eta = history.eta(tracer, stages)
+    assert eta is not None and 9.9 < eta <= 10.0
+    assert history.get("join") == {}
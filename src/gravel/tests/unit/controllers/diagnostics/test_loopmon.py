@@ -0,0 +1,65 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false
+
+import asyncio
+import time
+
+import pytest
+
+from gravel.controllers.config import LoopMonitorOptionsModel
+from gravel.controllers.diagnostics.loopmon import LoopMonitor
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_stalls() -> None:
+
+    loopmon = LoopMonitor()
+    loopmon.set_config(LoopMonitorOptionsModel(interval=0.05, threshold=0.05))
+    loopmon.start()
+    await asyncio.sleep(0.2)
+    assert loopmon.stats().stalls == 0
+
+    _block_the_loop(0.5)
+    await asyncio.sleep(0.2)
+    await loopmon.stop()
+
+    stats = loopmon.stats()
+    assert stats.stalls == 1
+    assert stats.max_lag >= 0.4
+    assert len(stats.top_stalls) > 0
+    assert "_block_the_loop" in stats.top_stalls[0].stack[-1]
+    assert loopmon._task is None
+    assert loopmon._watchdog is None
+
+
+def test_loop_monitor_stall_sources() -> None:
+
+    loopmon = LoopMonitor()
+    loopmon._record_stall_source(["a", "b"])
+    loopmon._record_stall_source(["a", "c"])
+    loopmon._record_stall_source(["a", "c"])
+    loopmon._record_slow_callback("<Handle foo>", 0.2)
+    loopmon._record_slow_callback("<Handle foo>", 0.5)
+
+    stats = loopmon.stats(top=1)
+    assert len(stats.top_stalls) == 1
+    assert stats.top_stalls[0].stack == ["a", "c"]
+    assert stats.top_stalls[0].samples == 2
+    assert stats.slow_callbacks[0].count == 2
+    assert stats.slow_callbacks[0].max_duration == 0.5
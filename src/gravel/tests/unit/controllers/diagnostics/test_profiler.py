@@ -0,0 +1,88 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+
+import time
+from typing import List
+
+import pytest
+
+from gravel.controllers.diagnostics.profiler import (
+    AlreadyProfilingError,
+    CPUProfiler,
+    MemoryProfiler,
+    NotProfilingError,
+)
+
+
+def _spin(seconds: float) -> None:
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_cpu_profiler() -> None:
+
+    profiler = CPUProfiler()
+    with pytest.raises(NotProfilingError):
+        profiler.stop()
+
+    profiler.start(duration=10.0, interval=0.005)
+    with pytest.raises(AlreadyProfilingError):
+        profiler.start(duration=10.0, interval=0.005)
+    _spin(0.3)
+    status = profiler.stop()
+    assert not status.running
+    assert status.samples > 0
+    assert status.stacks > 0
+
+    collapsed = profiler.collapsed()
+    assert "_spin" in collapsed
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("thread ")
+        assert int(count) > 0
+
+
+def test_cpu_profiler_duration() -> None:
+
+    profiler = CPUProfiler()
+    profiler.start(duration=0.1, interval=0.01)
+    time.sleep(0.3)
+    assert not profiler.status.running
+    profiler.stop()
+
+
+def test_memory_profiler() -> None:
+
+    profiler = MemoryProfiler()
+    with pytest.raises(NotProfilingError):
+        profiler.diff()
+
+    status = profiler.snapshot()
+    assert status.tracing
+    assert status.has_snapshot
+    leak: List[bytearray] = [bytearray(1024) for _ in range(1024)]
+    try:
+        stats = profiler.diff(top=10)
+        assert len(stats) > 0
+        assert any(__file__ in s.location for s in stats)
+        assert any(s.size_diff >= 1024 * 1024 for s in stats)
+        assert __file__ in profiler.collapsed()
+    finally:
+        profiler.stop()
+    del leak
+
+    assert not profiler.status.tracing
+    with pytest.raises(NotProfilingError):
+        profiler.stop()
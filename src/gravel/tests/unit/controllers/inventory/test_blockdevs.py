@@ -0,0 +1,110 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from typing import Optional
+
+import pytest
+from pyfakefs import fake_filesystem  # pyright: reportMissingTypeStubs=false
+
+from gravel.controllers.inventory.disks import (
+    DiskDevice,
+    RejectionReasonEnum,
+    get_block_device,
+    get_storage_devices,
+)
+
+GB = 1024 * 1024 * 1024
+
+
+def _add_block(
+    fs: fake_filesystem.FakeFilesystem,
+    name: str,
+    size: int,
+    devnum: str,
+    rotational: bool = False,
+    removable: bool = False,
+    physical: bool = True,
+    udev: Optional[str] = None,
+) -> str:
+    path = f"/sys/block/{name}"
+    fs.create_file(f"{path}/size", contents=f"{size // 512}\n")
+    fs.create_file(f"{path}/dev", contents=f"{devnum}\n")
+    fs.create_file(f"{path}/removable", contents=f"{int(removable)}\n")
+    fs.create_file(f"{path}/queue/rotational", contents=f"{int(rotational)}\n")
+    fs.create_dir(f"{path}/holders")
+    if physical:
+        fs.create_dir(f"{path}/device")
+    if udev is not None:
+        fs.create_file(f"/run/udev/data/b{devnum}", contents=udev)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_get_storage_devices(fs: fake_filesystem.FakeFilesystem):
+    _add_block(
+        fs,
+        "sda",
+        20 * GB,
+        "8:0",
+        rotational=True,
+        udev="S:disk/by-id/foo\nE:ID_SERIAL=foo_123\nE:ID_MODEL=bar\n",
+    )
+    fs.create_file("/sys/block/sda/device/vendor", contents="ATA     \n")
+    _add_block(fs, "vdb", 20 * GB, "253:16")
+    _add_block(fs, "loop0", 20 * GB, "7:0", physical=False)
+    _add_block(fs, "sr0", 1 * GB, "11:0")
+    fs.create_file("/sys/block/sr0/device/type", contents="5\n")
+
+    devs = await get_storage_devices()
+    assert [d.name for d in devs] == ["sda", "vdb"]
+
+    sda = devs[0]
+    assert sda.id == "foo_123"
+    assert sda.path == "/dev/sda"
+    assert sda.product == "bar"
+    assert sda.vendor == "ATA"
+    assert sda.size == 20 * GB
+    assert sda.rotational
+    assert sda.available
+    assert len(sda.rejected_reasons) == 0
+
+    vdb = devs[1]
+    assert vdb.id == "vdb"
+    assert vdb.product == "Unknown"
+    assert vdb.vendor == "Unknown"
+    assert not vdb.rotational
+    assert vdb.available
+
+
+def test_get_block_device_rejected(fs: fake_filesystem.FakeFilesystem):
+    path = _add_block(fs, "sda", 20 * GB, "8:0")
+    fs.create_file(f"{path}/sda1/partition", contents="1\n")
+    path = _add_block(fs, "sdb", 20 * GB, "8:16")
+    fs.create_dir(f"{path}/holders/dm-0")
+    _add_block(fs, "sdc", 20 * GB, "8:32", udev="E:ID_FS_TYPE=LVM2_member\n")
+    _add_block(fs, "sdd", 1 * GB, "8:48", removable=True)
+
+    for name in ["sda", "sdb", "sdc"]:
+        dev: Optional[DiskDevice] = get_block_device(name)
+        assert dev is not None
+        assert not dev.available
+        assert dev.rejected_reasons == [RejectionReasonEnum.IN_USE]
+
+    dev = get_block_device("sdd")
+    assert dev is not None
+    assert not dev.available
+    assert dev.rejected_reasons == [
+        RejectionReasonEnum.TOO_SMALL,
+        RejectionReasonEnum.REMOVABLE_DEVICE,
+    ]
+    assert get_block_device("sde") is None
@@ -0,0 +1,113 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false
+
+import os
+from typing import Callable, List
+
+import pytest
+
+from gravel.controllers.gstate import GlobalState
+from gravel.controllers.inventory.diff import ChangeEnum, diff_nodeinfo
+from gravel.controllers.inventory.inventory import Inventory
+from gravel.controllers.inventory.nodeinfo import NodeInfoModel
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def nodeinfo(get_data_contents: Callable[[str, str], str]) -> NodeInfoModel:
+    return NodeInfoModel.parse_raw(
+        get_data_contents(DATA_DIR, "nodeinfo_real.json")
+    )
+
+
+def test_diff_nodeinfo(nodeinfo: NodeInfoModel) -> None:
+    diff = diff_nodeinfo(None, nodeinfo)
+    assert diff.changes == set(ChangeEnum)
+    assert diff.nics_added == sorted(nodeinfo.nics)
+
+    assert not diff_nodeinfo(nodeinfo, nodeinfo.copy(deep=True)).changed
+
+    # time moving on isn't a change.
+    new = nodeinfo.copy(deep=True)
+    new.current_time += 60
+    new.system_uptime += 60
+    assert not diff_nodeinfo(nodeinfo, new).changed
+
+    new.cpu.load.one_min += 1.0
+    diff = diff_nodeinfo(nodeinfo, new)
+    assert diff.changes == {ChangeEnum.LOAD}
+
+    new = nodeinfo.copy(deep=True)
+    removed = new.disks.pop()
+    new.nics["eth0"].ipv4_address = "10.0.0.2/24"
+    diff = diff_nodeinfo(nodeinfo, new)
+    assert diff.changes == {ChangeEnum.DISKS, ChangeEnum.ADDRESSES}
+    assert diff.disks_removed == [removed.name]
+    assert diff.addresses_changed == ["eth0"]
+    assert diff.nics_changed == []
+
+    new = nodeinfo.copy(deep=True)
+    new.hostname = "foobar"
+    new.nics["eth0"].operstate = "down"
+    diff = diff_nodeinfo(nodeinfo, new)
+    assert diff.changes == {ChangeEnum.HOST, ChangeEnum.NICS}
+    assert diff.nics_changed == ["eth0"]
+
+
+@pytest.mark.asyncio
+async def test_publish_by_change(
+    gstate: GlobalState, nodeinfo: NodeInfoModel
+) -> None:
+    inventory: Inventory = gstate.inventory
+    inventory._latest = None
+    inventory._subscribers = []
+
+    everything: List[NodeInfoModel] = []
+    addresses: List[NodeInfoModel] = []
+
+    async def cb_everything(info: NodeInfoModel) -> None:
+        everything.append(info)
+
+    async def cb_addresses(info: NodeInfoModel) -> None:
+        addresses.append(info)
+
+    await inventory.subscribe(cb_everything, once=False)
+    await inventory.subscribe(
+        cb_addresses, once=False, changes={ChangeEnum.ADDRESSES}
+    )
+
+    await inventory._update(nodeinfo)
+    await inventory.drain()
+    assert len(everything) == 1 and len(addresses) == 1
+
+    # unchanged, nobody hears about it.
+    await inventory._update(nodeinfo.copy(deep=True))
+    await inventory.drain()
+    assert len(everything) == 1 and len(addresses) == 1
+
+    new = nodeinfo.copy(deep=True)
+    new.cpu.load.five_min += 1.0
+    await inventory._update(new)
+    await inventory.drain()
+    assert len(everything) == 2 and len(addresses) == 1
+    assert inventory.last_diff is not None
+    assert inventory.last_diff.changes == {ChangeEnum.LOAD}
+
+    new = new.copy(deep=True)
+    new.nics["eth0"].ipv4_address = "10.0.0.2/24"
+    await inventory._update(new)
+    await inventory.drain()
+    assert len(everything) == 3 and len(addresses) == 2
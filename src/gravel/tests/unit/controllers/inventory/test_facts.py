@@ -0,0 +1,136 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false
+
+import pytest
+from pyfakefs import fake_filesystem  # pyright: reportMissingTypeStubs=false
+from pytest_mock import MockerFixture
+
+from gravel.controllers.inventory.facts import FactsCollector, FactsError
+
+CPUINFO = """processor	: 0
+model name	: AMD EPYC Processor (with IBPB)
+physical id	: 0
+siblings	: 2
+cpu cores	: 1
+
+processor	: 1
+model name	: AMD EPYC Processor (with IBPB)
+physical id	: 0
+siblings	: 2
+cpu cores	: 1
+"""
+
+MEMINFO = """MemTotal:        4014412 kB
+MemFree:         3676188 kB
+MemAvailable:    3665636 kB
+Buffers:            2092 kB
+"""
+
+IF_INET6 = (
+    "00000000000000000000000000000001 01 80 10 80       lo\n"
+    "fe80000000000000505400fffe7c6929 02 40 20 80     eth0\n"
+)
+
+
+def _fake_host(fs: fake_filesystem.FakeFilesystem) -> None:
+    fs.create_file("/proc/cpuinfo", contents=CPUINFO)
+    fs.create_file("/proc/meminfo", contents=MEMINFO)
+    fs.create_file("/proc/loadavg", contents="0.03 0.03 0.00 1/170 2048\n")
+    fs.create_file("/proc/uptime", contents="157.45 300.12\n")
+    fs.create_file("/proc/net/if_inet6", contents=IF_INET6)
+    fs.create_file("/etc/os-release", contents='PRETTY_NAME="openSUSE"\n')
+    fs.create_file("/sys/class/dmi/id/sys_vendor", contents="QEMU\n")
+    fs.create_file("/sys/class/dmi/id/product_name", contents="Standard PC\n")
+
+    fs.create_dir("/sys/bus/virtio/drivers/virtio_net")
+    fs.create_symlink(
+        "/sys/class/net/eth0/device/driver",
+        "/sys/bus/virtio/drivers/virtio_net",
+    )
+    fs.create_file("/sys/class/net/eth0/type", contents="1\n")
+    fs.create_file("/sys/class/net/eth0/mtu", contents="1500\n")
+    fs.create_file("/sys/class/net/eth0/operstate", contents="up\n")
+    fs.create_file("/sys/class/net/eth0/speed", contents="1000\n")
+    fs.create_dir("/sys/class/net/eth0/upper_br0")
+    fs.create_file("/sys/class/net/lo/type", contents="772\n")
+    fs.create_file("/sys/class/net/lo/mtu", contents="65536\n")
+    fs.create_file("/sys/class/net/lo/operstate", contents="unknown\n")
+
+
+def test_collect(mocker: MockerFixture, fs: fake_filesystem.FakeFilesystem):
+    _fake_host(fs)
+    mocker.patch(
+        "gravel.controllers.inventory.facts._ipv4_address",
+        side_effect=lambda name: "127.0.0.1/8" if name == "lo" else "",
+    )
+
+    facts = FactsCollector().collect()
+    assert facts.vendor == "QEMU"
+    assert facts.model == "Standard PC"
+    assert facts.operating_system == "openSUSE"
+    assert facts.system_uptime == 157.45
+    assert facts.cpu.model == "AMD EPYC Processor (with IBPB)"
+    assert facts.cpu.count == 1
+    assert facts.cpu.cores == 1
+    assert facts.cpu.threads == 2
+    assert facts.cpu.load.one_min == 0.03
+    assert facts.cpu.load.fifteen_min == 0.0
+    assert facts.memory.total_kb == 4014412
+    assert facts.memory.available_kb == 3665636
+
+    assert list(facts.nics.keys()) == ["eth0", "lo"]
+    eth0 = facts.nics["eth0"]
+    assert eth0.driver == "virtio_net"
+    assert eth0.iftype == "physical"
+    assert eth0.nic_type == "ethernet"
+    assert eth0.ipv4_address == ""
+    assert eth0.ipv6_address == "fe80::5054:ff:fe7c:6929/64"
+    assert eth0.mtu == 1500
+    assert eth0.speed == 1000
+    assert eth0.upper_devs_list == ["br0"]
+    lo = facts.nics["lo"]
+    assert lo.driver == ""
+    assert lo.iftype == "logical"
+    assert lo.nic_type == "loopback"
+    assert lo.ipv4_address == "127.0.0.1/8"
+    assert lo.ipv6_address == "::1/128"
+    assert lo.speed == -1
+
+
+def test_collect_caches_static(
+    mocker: MockerFixture, fs: fake_filesystem.FakeFilesystem
+):
+    _fake_host(fs)
+    mocker.patch(
+        "gravel.controllers.inventory.facts._ipv4_address", return_value=""
+    )
+
+    collector = FactsCollector()
+    first = collector.collect()
+    assert first.cpu.model == "AMD EPYC Processor (with IBPB)"
+
+    # static facts are read once, changing ones on every call.
+    fs.remove_object("/proc/cpuinfo")
+    fs.remove_object("/proc/loadavg")
+    fs.create_file("/proc/loadavg", contents="1.50 1.00 0.50 1/170 2048\n")
+    second = collector.collect()
+    assert second.cpu.model == first.cpu.model
+    assert second.cpu.load.one_min == 1.5
+
+
+def test_collect_fail(fs: fake_filesystem.FakeFilesystem):
+    fs.create_dir("/proc")
+    with pytest.raises(FactsError):
+        FactsCollector().collect()
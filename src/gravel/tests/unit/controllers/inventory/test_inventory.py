@@ -61,10 +61,22 @@ async def test_inventory_subs(
     assert num_called == 2
 
     await inventory._publish()
+    await inventory.drain()
     assert num_called == 3
 
     inventory.unsubscribe(sub)
     assert sub not in inventory._subscribers
 
+    # once subscribers are let go of once they've been delivered to.
+    inventory._latest = None
+    once = await inventory.subscribe(cb=cb, once=True)
+    assert once is not None
+    inventory._latest = nodeinfo
+    await inventory._publish()
+    assert inventory._retired == [once]
+    await once.drain()
+    assert inventory._retired == []
+    assert num_called == 4
+
     # cleanup
     inventory._subscribers = prev_subs
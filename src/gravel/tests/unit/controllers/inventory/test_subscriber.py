@@ -0,0 +1,88 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false
+
+import asyncio
+import os
+from typing import Callable, List
+
+import pytest
+
+from gravel.controllers.inventory.nodeinfo import NodeInfoModel
+from gravel.controllers.inventory.subscriber import Subscriber
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def nodeinfo(get_data_contents: Callable[[str, str], str]) -> NodeInfoModel:
+    return NodeInfoModel.parse_raw(
+        get_data_contents(DATA_DIR, "nodeinfo_real.json")
+    )
+
+
+@pytest.mark.asyncio
+async def test_latest_value_wins(nodeinfo: NodeInfoModel) -> None:
+    seen: List[str] = []
+    release = asyncio.Event()
+
+    async def cb(info: NodeInfoModel) -> None:
+        seen.append(info.hostname)
+        await release.wait()
+
+    sub = Subscriber(cb=cb, once=False)
+    for name in ["foo", "bar", "baz"]:
+        sub.push(nodeinfo.copy(update={"hostname": name}))
+        await asyncio.sleep(0)
+
+    # 'foo' is being delivered, 'bar' was superseded by 'baz'.
+    assert seen == ["foo"]
+    release.set()
+    await sub.drain()
+    assert seen == ["foo", "baz"]
+    assert sub.stats.delivered == 2
+    assert sub.stats.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_isolation(nodeinfo: NodeInfoModel) -> None:
+    async def slow(info: NodeInfoModel) -> None:
+        await asyncio.sleep(10)
+
+    async def failing(info: NodeInfoModel) -> None:
+        raise Exception("oops")
+
+    called = 0
+
+    async def fine(info: NodeInfoModel) -> None:
+        nonlocal called
+        called += 1
+
+    subs = [
+        Subscriber(cb=slow, once=False, timeout=0.1),
+        Subscriber(cb=failing, once=False),
+        Subscriber(cb=fine, once=False),
+    ]
+    for sub in subs:
+        sub.push(nodeinfo)
+    await subs[2].drain()
+    assert called == 1
+    assert subs[0].stats.delivered == 0
+
+    await asyncio.gather(*[s.drain() for s in subs])
+    assert subs[0].stats.timeouts == 1
+    assert subs[0].stats.max_latency >= 0.1
+    assert subs[1].stats.failed == 1
+    assert subs[2].stats.failed == 0 and subs[2].stats.timeouts == 0
+    assert subs[2].stats.name.endswith("fine")
@@ -0,0 +1,176 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false
+
+import os
+import socket
+from typing import Callable, List, Optional
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gravel.cephadm.models import NICModel
+from gravel.controllers.gstate import GlobalState
+from gravel.controllers.inventory.disks import DiskDevice
+from gravel.controllers.inventory.inventory import Inventory
+from gravel.controllers.inventory.nodeinfo import NodeInfoModel
+from gravel.controllers.inventory.uevents import (
+    UEventListener,
+    UEventModel,
+    parse_uevent,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def _uevent(action: str, devpath: str, **props: str) -> bytes:
+    fields = [f"{action}@{devpath}", f"ACTION={action}", f"DEVPATH={devpath}"]
+    fields.extend(f"{k}={v}" for k, v in props.items())
+    return "\0".join(fields).encode("utf-8") + b"\0"
+
+
+def test_parse_uevent() -> None:
+    event = parse_uevent(
+        _uevent(
+            "add",
+            "/devices/pci0000:00/virtio3/block/vdf",
+            SUBSYSTEM="block",
+            DEVNAME="vdf",
+            DEVTYPE="disk",
+            SEQNUM="1234",
+        )
+    )
+    assert event is not None
+    assert event.action == "add"
+    assert event.subsystem == "block"
+    assert event.name == "vdf"
+    assert event.devtype == "disk"
+    assert event.props["SEQNUM"] == "1234"
+
+    event = parse_uevent(
+        _uevent("remove", "/devices/virtual/net/br0", INTERFACE="br0")
+    )
+    assert event is not None
+    assert event.name == "br0"
+    assert event.subsystem == ""
+
+    assert parse_uevent(b"libudev\0\xfe\xed\xca\xfe") is None
+    assert parse_uevent(b"add@/devices/foo\0SUBSYSTEM=block\0") is None
+
+
+def test_listener_filters_subsystems() -> None:
+    events: List[UEventModel] = []
+    listener = UEventListener(["block"], events.append, lambda: None)
+    ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    ours.setblocking(False)
+    listener._sock = ours
+
+    theirs.send(_uevent("add", "/devices/x/net/eth1", SUBSYSTEM="net"))
+    theirs.send(_uevent("add", "/devices/x/block/sdb", SUBSYSTEM="block"))
+    listener._on_readable()
+    assert [e.devpath for e in events] == ["/devices/x/block/sdb"]
+
+    ours.close()
+    theirs.close()
+
+
+def _disk(name: str) -> DiskDevice:
+    return DiskDevice(
+        id=name,
+        name=name,
+        path=f"/dev/{name}",
+        product="foo",
+        vendor="bar",
+        size=20 * 1024**3,
+        rotational=False,
+        available=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_inventory_hotplug_refresh(
+    mocker: MockerFixture,
+    gstate: GlobalState,
+    get_data_contents: Callable[[str, str], str],
+) -> None:
+    nodeinfo: NodeInfoModel = NodeInfoModel.parse_raw(
+        get_data_contents(DATA_DIR, "nodeinfo_real.json")
+    )
+    nodeinfo.disks = [_disk("vda"), _disk("vdc")]
+    nodeinfo.nics = {"lo": nodeinfo.nics["lo"]}
+
+    inventory: Inventory = gstate.inventory
+    inventory._latest = nodeinfo
+    inventory._subscribers = []
+
+    published: List[NodeInfoModel] = []
+
+    async def cb(info: NodeInfoModel) -> None:
+        published.append(info)
+
+    await inventory.subscribe(cb=cb, once=False)
+    published.clear()
+
+    def get_block_device(name: str) -> Optional[DiskDevice]:
+        return _disk(name) if name == "vdb" else None
+
+    eth1 = nodeinfo.nics["lo"].copy(update={"driver": "virtio_net"})
+
+    def read_nic(name: str) -> Optional[NICModel]:
+        return eth1 if name == "eth1" else None
+
+    mocker.patch(
+        "gravel.controllers.inventory.inventory.get_block_device",
+        side_effect=get_block_device,
+    )
+    mocker.patch.object(inventory._facts, "read_nic", side_effect=read_nic)
+    mocker.patch(
+        "gravel.controllers.inventory.inventory.HOTPLUG_SETTLE_TIME", 0.0
+    )
+
+    events = [
+        _uevent(
+            "add", "/devices/x/block/vdb", SUBSYSTEM="block", DEVNAME="vdb"
+        ),
+        _uevent(
+            "add",
+            "/devices/x/block/vdb/vdb1",
+            SUBSYSTEM="block",
+            DEVNAME="vdb1",
+            DEVTYPE="partition",
+        ),
+        _uevent("remove", "/devices/x/block/vdc", SUBSYSTEM="block"),
+        _uevent(
+            "add", "/devices/x/net/eth1", SUBSYSTEM="net", INTERFACE="eth1"
+        ),
+    ]
+    for data in events:
+        event = parse_uevent(data)
+        assert event is not None
+        inventory._on_uevent(event)
+
+    # a burst of events results in a single refresh.
+    task = inventory._refresh_task
+    assert task is not None
+    assert inventory._pending_disks == {"vdb", "vdc"}
+    await task
+    await inventory.drain()
+
+    assert len(published) == 1
+    latest = inventory.latest
+    assert latest is not None
+    assert [d.name for d in latest.disks] == ["vda", "vdb"]
+    assert list(latest.nics.keys()) == ["eth1", "lo"]
+    assert latest.nics["eth1"].driver == "virtio_net"
+    assert latest.hostname == nodeinfo.hostname
@@ -0,0 +1,182 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportPrivateUsage=false
+
+import asyncio
+import errno
+import os
+import struct
+from pathlib import Path
+from typing import Any, List, Optional, Set
+
+import pytest
+from pyfakefs import fake_filesystem
+
+from gravel.controllers.resources.netwatch import (
+    IN_CLOSE_WRITE,
+    IN_DELETE,
+    RTM_DELLINK,
+    RTM_NEWLINK,
+    ConfigWatcher,
+    LinkWatcher,
+    parse_inotify_events,
+    parse_link_messages,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def _inotify_event(mask: int, name: str) -> bytes:
+    raw = name.encode("utf-8") + b"\0"
+    raw += b"\0" * (-len(raw) % 16)
+    return struct.pack("iIII", 1, mask, 0, len(raw)) + raw
+
+
+def _link_message(msgtype: int, name: str) -> bytes:
+    ifname = name.encode("utf-8") + b"\0"
+    attr = struct.pack("=HH", 4 + len(ifname), 3) + ifname
+    attr += b"\0" * (-len(attr) % 4)
+    # an attribute we don't care about comes first.
+    mtu = struct.pack("=HHI", 8, 4, 1500)
+    body = struct.pack("=BxHiII", 0, 1, 2, 0, 0) + mtu + attr
+    return struct.pack("=LHHLL", 16 + len(body), msgtype, 0, 0, 0) + body
+
+
+def test_parse_inotify_events() -> None:
+    data = _inotify_event(IN_CLOSE_WRITE, "ifcfg-eth0") + _inotify_event(
+        IN_DELETE, "routes"
+    )
+    assert parse_inotify_events(data) == [
+        (IN_CLOSE_WRITE, "ifcfg-eth0"),
+        (IN_DELETE, "routes"),
+    ]
+
+
+def test_parse_link_messages() -> None:
+    data = (
+        _link_message(RTM_NEWLINK, "eth0")
+        + _link_message(20, "foo")  # RTM_NEWADDR
+        + _link_message(RTM_DELLINK, "bond0")
+    )
+    assert parse_link_messages(data) == ["eth0", "bond0"]
+
+
+@pytest.mark.asyncio
+async def test_config_watcher(tmp_path: Path) -> None:
+    changes: List[Optional[Set[str]]] = []
+    watcher = ConfigWatcher(str(tmp_path), changes.append)
+    if not watcher.start():
+        pytest.skip("inotify not available")
+
+    tmp_path.joinpath("ifcfg-eth0").write_text("BOOTPROTO='dhcp'\n")
+    for _ in range(100):
+        if changes:
+            break
+        await asyncio.sleep(0.01)
+    watcher.stop()
+    assert changes == [{"ifcfg-eth0"}]
+
+
+def test_link_watcher_lost() -> None:
+    class FakeSocket:
+        def __init__(self, replies: List[Any]) -> None:
+            self.replies = replies
+
+        def recv(self, size: int) -> bytes:
+            reply = self.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+    changes: List[Optional[Set[str]]] = []
+    watcher = LinkWatcher(changes.append)
+    watcher._sock = FakeSocket(  # type: ignore
+        [_link_message(RTM_NEWLINK, "eth0"), BlockingIOError()]
+    )
+    watcher._on_readable()
+    assert changes == [{"eth0"}]
+
+    # messages were dropped, so we can't tell which links changed.
+    watcher._sock = FakeSocket(  # type: ignore
+        [
+            OSError(errno.ENOBUFS, "No buffer space available"),
+            _link_message(RTM_NEWLINK, "eth1"),
+            BlockingIOError(),
+        ]
+    )
+    watcher._on_readable()
+    assert changes == [{"eth0"}, None]
+
+
+@pytest.mark.asyncio
+async def test_network_incremental(fs: fake_filesystem.FakeFilesystem) -> None:
+    from gravel.controllers.resources.network import Network
+
+    fs.create_dir("/sys/devices/virtio0/net/eth0")
+    fs.create_symlink(
+        "/sys/class/net/eth0/device", "/sys/devices/virtio0/net/eth0"
+    )
+    fs.add_real_file(
+        source_path=os.path.join(DATA_DIR, "ifcfg-eth0"),
+        target_path="/etc/sysconfig/network/ifcfg-eth0",
+        read_only=False,
+    )
+    fs.add_real_file(
+        source_path=os.path.join(DATA_DIR, "config"),
+        target_path="/etc/sysconfig/network/config",
+        read_only=False,
+    )
+
+    network = Network(5.0)
+    await network._do_tick()
+    assert list(network.interfaces.keys()) == ["eth0"]
+
+    # a new link shows up, with config and routes.
+    fs.create_dir("/sys/devices/virtio1/net/eth1")
+    fs.create_symlink(
+        "/sys/class/net/eth1/device", "/sys/devices/virtio1/net/eth1"
+    )
+    network._on_links_changed({"eth1"})
+    assert sorted(network.interfaces.keys()) == ["eth0", "eth1"]
+    assert network.interfaces["eth1"].config is None
+
+    fs.create_file(
+        "/etc/sysconfig/network/ifcfg-eth1",
+        contents="BOOTPROTO='static'\nIPADDR='10.0.0.2/24'\n",
+    )
+    fs.create_file(
+        "/etc/sysconfig/network/ifroute-eth1",
+        contents="10.1.0.0/16 10.0.0.1 - eth1\n",
+    )
+    network._on_config_changed({"ifcfg-eth1", "ifroute-eth1", "ifcfg-eth1~"})
+    eth1 = network.interfaces["eth1"]
+    assert eth1.config is not None
+    assert eth1.config.ipaddr == "10.0.0.2/24"
+    assert [r.destination for r in network.routes] == ["10.1.0.0/16"]
+
+    # and goes away again.
+    fs.remove_object("/sys/class/net/eth1")
+    fs.remove_object("/etc/sysconfig/network/ifcfg-eth1")
+    network._on_links_changed({"eth1"})
+    network._on_config_changed({"ifcfg-eth1"})
+    assert list(network.interfaces.keys()) == ["eth0"]
+    assert network.routes == []
+
+    # link messages were lost, so every link is looked at again.
+    fs.create_dir("/sys/devices/virtio2/net/eth2")
+    fs.create_symlink(
+        "/sys/class/net/eth2/device", "/sys/devices/virtio2/net/eth2"
+    )
+    network._on_links_changed(None)
+    assert sorted(network.interfaces.keys()) == ["eth0", "eth2"]
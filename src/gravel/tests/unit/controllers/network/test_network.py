@@ -27,16 +27,23 @@ async def test_network(
     mocker: MockerFixture,
     fs: fake_filesystem.FakeFilesystem,
 ) -> None:
-    async def mock_restart_network(
+    cmds: List[List[str]] = []
+
+    async def mock_run_cmd(
         cmd: List[str],
     ) -> Tuple[int, Optional[str], Optional[str]]:
-        assert cmd == ["systemctl", "restart", "network.service"]
+        cmds.append(cmd)
         return 0, None, None
 
     mocker.patch(
         "gravel.controllers.resources.network.aqr_run_cmd",
-        new=mock_restart_network,
+        new=mock_run_cmd,
+    )
+    mocker.patch(
+        "gravel.controllers.resources.network.get_ipv4_address",
+        return_value="192.168.121.10/24",
     )
+    mocker.patch("gravel.controllers.resources.network.VERIFY_TIMEOUT", 0.0)
 
     from gravel.controllers.resources.network import (
         InterfaceConfigModel,
@@ -102,14 +109,21 @@ async def test_network(
             bonding_slaves=["enp1s0", "enp2s0"],
         ),
     )
-    await network.apply_config(
-        ifaces,
-        ["8.8.8.8", "1.1.1.1"],
-        routes=[
-            RouteModel(destination="default", gateway="192.168.121.1"),
-            RouteModel(destination="192.168.0.0/16", interface="bond0"),
-        ],
+    routes = [
+        RouteModel(destination="default", gateway="192.168.121.1"),
+        RouteModel(destination="192.168.0.0/16", interface="bond0"),
+    ]
+    result = await network.apply_config(
+        ifaces, ["8.8.8.8", "1.1.1.1"], routes=routes
     )
+    assert result.verified
+    assert result.interfaces == ["bond0", "enp1s0", "enp2s0", "eth0"]
+    assert result.nameservers
+    assert result.routes
+    assert cmds == [
+        ["wicked", "ifreload", "all"],
+        ["netconfig", "update", "-f"],
+    ]
 
     ifaces = network.interfaces
     assert "bond0" in ifaces
@@ -120,6 +134,66 @@ async def test_network(
     assert os.path.exists("/etc/sysconfig/network/ifroute-bond0")
     assert len(network.routes) == 2
 
+    # applying the same config again changes nothing.
+    cmds.clear()
+    result = await network.apply_config(
+        network.interfaces, ["8.8.8.8", "1.1.1.1"], routes=routes
+    )
+    assert result.interfaces == []
+    assert not result.nameservers and not result.routes
+    assert cmds == []
+
+    # only what changed is reloaded.
+    ifaces = network.interfaces
+    ifaces["eth0"].config = InterfaceConfigModel(
+        bootproto="static", ipaddr="10.0.0.2/24"
+    )
+    result = await network.apply_config(
+        ifaces, ["8.8.8.8", "1.1.1.1"], routes=routes
+    )
+    assert result.interfaces == ["eth0"]
+    assert cmds == [["wicked", "ifreload", "eth0"]]
+    assert result.mismatched == ["eth0"]
+
+
+@pytest.mark.asyncio
+async def test_apply_reload_fallback(
+    mocker: MockerFixture, fs: fake_filesystem.FakeFilesystem
+) -> None:
+    from gravel.controllers.resources.network import (
+        InterfaceConfigModel,
+        InterfaceModel,
+        Network,
+    )
+
+    cmds: List[List[str]] = []
+
+    async def mock_run_cmd(
+        cmd: List[str],
+    ) -> Tuple[int, Optional[str], Optional[str]]:
+        cmds.append(cmd)
+        return (1 if cmd[0] == "wicked" else 0), None, "oops"
+
+    mocker.patch(
+        "gravel.controllers.resources.network.aqr_run_cmd", new=mock_run_cmd
+    )
+    fs.create_dir("/sys/class/net")
+    fs.create_file(
+        "/etc/sysconfig/network/config",
+        contents='NETCONFIG_DNS_STATIC_SERVERS=""\n',
+    )
+
+    network = Network(5.0)
+    await network.apply_config(
+        {"eth0": InterfaceModel(name="eth0", config=InterfaceConfigModel())},
+        [],
+        [],
+    )
+    assert cmds == [
+        ["wicked", "ifreload", "eth0"],
+        ["systemctl", "restart", "network.service"],
+    ]
+
 
 def test_update_config(
     fs: fake_filesystem.FakeFilesystem,
@@ -13,6 +13,7 @@
 
 # pyright: reportPrivateUsage=false
 
+import asyncio
 import os
 from typing import Callable
 
@@ -26,6 +27,7 @@ from gravel.controllers.nodes.requirements import (
     DisksQualifiedErrorEnum,
     MemoryQualifiedEnum,
     MemoryQualifiedModel,
+    RequirementsCache,
     RequirementsModel,
     localhost_qualified,
     validate_cpu,
@@ -154,3 +156,70 @@ async def _disable_test_localhost_qualified(
     assert results.mem.actual_mem == 33498816512
     assert results.mem.error == ""
     assert results.mem.status == MemoryQualifiedEnum.QUALIFIED
+
+
+@pytest.mark.asyncio
+async def test_requirements_cache(mocker: MockerFixture):
+    calls = 0
+    release = asyncio.Event()
+
+    async def fake_qualified() -> RequirementsModel:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return RequirementsModel.construct(qualified=calls > 1)
+
+    mocker.patch(
+        "gravel.controllers.nodes.requirements.localhost_qualified",
+        side_effect=fake_qualified,
+    )
+    cache = RequirementsCache(ttl=60.0)
+
+    # concurrent requests share a single probe.
+    waiters = [asyncio.create_task(cache.get()) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+    assert calls == 1
+    assert all(not r.qualified for r in results)
+
+    # cached until invalidated.
+    assert not (await cache.get()).qualified
+    assert calls == 1
+    cache.invalidate()
+    assert (await cache.get()).qualified
+    assert calls == 2
+
+    # results from a probe that was invalidated midway are not kept.
+    cache.invalidate()
+    release.clear()
+    waiter = asyncio.create_task(cache.get())
+    await asyncio.sleep(0)
+    cache.invalidate()
+    release.set()
+    await waiter
+    assert calls == 3
+    await cache.get()
+    assert calls == 4
+
+    # nor handed to those asking after it was invalidated, who get a probe
+    # of their own that the stale one doesn't get in the way of.
+    cache.invalidate()
+    release.clear()
+    stale = asyncio.create_task(cache.get())
+    await asyncio.sleep(0)
+    cache.invalidate()
+    fresh = asyncio.create_task(cache.get())
+    await asyncio.sleep(0)
+    assert cache._task is not None
+    release.set()
+    await asyncio.gather(stale, fresh)
+    assert calls == 6
+    assert cache._task is None
+    await cache.get()
+    assert calls == 6
+
+    # and expire.
+    cache._expires = 0.0
+    await cache.get()
+    assert calls == 7
@@ -13,11 +13,32 @@
 
 # pyright: reportUnknownMemberType=false, reportPrivateUsage=false
 
+import asyncio
+import json
+import threading
+import time
+
 import pytest
 
-from gravel.controllers.auth import JWT, JWTDenyList, JWTMgr, UserMgr, UserModel
+from gravel.controllers.auth import (
+    JWT,
+    AuthContext,
+    BusyError,
+    DisabledUserError,
+    InvalidTokenError,
+    JWTDenyList,
+    JWTMgr,
+    PasswordHasher,
+    RevokedTokenError,
+    UnknownUserError,
+    UserDirectory,
+    UserMgr,
+    UserModel,
+)
 from gravel.controllers.config import AuthOptionsModel
 from gravel.controllers.gstate import GlobalState
+from gravel.controllers.kv import KV
+from gravel.tests.conftest import FakeIoctx
 
 
 def test_user_model_hash_password():
@@ -96,3 +117,270 @@ async def test_jwt_deny_list(gstate: GlobalState):
     # Cleanup expired tokens.
     jwt_deny_list._cleanup(1625188489)
     assert not jwt_deny_list.includes(jwt)
+
+
+@pytest.mark.asyncio
+async def test_jwt_deny_list_store(gstate: GlobalState):
+    await gstate.store.ensure_connection()
+    now = int(time.time())
+    expired = JWT("Aquarium", "foo", now - 20, now - 20, now - 10, "expired")
+    valid = JWT("Aquarium", "foo", now, now, now + 3600, "valid")
+    other = JWT("Aquarium", "foo", now, now, now + 3600, "other")
+
+    # tokens from the old, single key, deny list are migrated.
+    await gstate.store.put(
+        "/auth/jwt_deny_list",
+        json.dumps({expired.jti: expired.exp, valid.jti: valid.exp}),
+    )
+    deny_list = JWTDenyList(gstate.store)
+    await deny_list.load()
+    assert deny_list.includes(valid)
+    assert not deny_list.includes(expired)
+    assert await gstate.store.get("/auth/jwt_deny_list") is None
+    assert await gstate.store.get("/auth/jwt_deny/valid") is not None
+
+    # each token is kept under its own key.
+    deny_list.add(other)
+    await deny_list.save()
+    assert len(await gstate.store.get_prefix("/auth/jwt_deny/")) == 2
+    deny_list = JWTDenyList(gstate.store)
+    await deny_list.load()
+    assert deny_list.includes(valid)
+    assert deny_list.includes(other)
+
+    # and removed from the store once expired.
+    deny_list.add(expired)
+    await deny_list.save()
+    assert await gstate.store.get("/auth/jwt_deny/expired") is not None
+    await deny_list.expire()
+    assert not deny_list.includes(expired)
+    assert await gstate.store.get("/auth/jwt_deny/expired") is None
+    assert len(await gstate.store.get_prefix("/auth/jwt_deny/")) == 2
+
+
+@pytest.mark.asyncio
+async def test_auth_context_expire(gstate: GlobalState):
+    await gstate.store.ensure_connection()
+    now = int(time.time())
+    expired = JWT("Aquarium", "foo", now - 20, now - 20, now - 10, "expired")
+    config = AuthOptionsModel()
+    # two nodes sharing the store.
+    first = AuthContext(gstate.store, config)
+    second = AuthContext(gstate.store, config)
+    await first.get_users()
+    await second.get_users()
+
+    deny_list = JWTDenyList(gstate.store)
+    deny_list.add(expired)
+    await deny_list.save()
+    # watch callbacks run in the event loop, on its next iteration.
+    assert not second._deny_list.includes(expired)
+    await asyncio.sleep(0)
+    assert second._deny_list.includes(expired)
+
+    # only the node holding the lease removes expired tokens.
+    await second._do_tick()
+    await first._do_tick()
+    await asyncio.sleep(0)
+    assert await gstate.store.get("/auth/jwt_deny/expired") is None
+    assert not first._deny_list.includes(expired)
+    assert not second._deny_list.includes(expired)
+    assert await second._hold_expire_lease()
+    assert not await first._hold_expire_lease()
+
+    # once the lease runs out, another node takes over.
+    await gstate.store.put(
+        "/auth/jwt_deny_expire_lease",
+        json.dumps({"owner": second._lease_id, "until": now - 1}),
+    )
+    assert await first._hold_expire_lease()
+    assert not await second._hold_expire_lease()
+
+
+@pytest.mark.asyncio
+async def test_auth_context(gstate: GlobalState):
+    await gstate.store.ensure_connection()
+    config = AuthOptionsModel()
+    user_mgr = UserMgr(gstate.store)
+    await user_mgr.put(UserModel(username="foo", password="bar"))
+
+    auth = AuthContext(gstate.store, config)
+    jwt_mgr = JWTMgr(config)
+    token = jwt_mgr.create_access_token("foo")
+    raw_token = await auth.authenticate(token)
+    assert raw_token.sub == "foo"
+    # decoded tokens are kept around.
+    assert token in auth._tokens
+    assert await auth.authenticate(token) is raw_token
+
+    with pytest.raises(InvalidTokenError):
+        await auth.authenticate("foobar")
+    with pytest.raises(InvalidTokenError):
+        await auth.authenticate(
+            JWTMgr(AuthOptionsModel()).create_access_token("foo")
+        )
+
+    # users are kept up to date through the store.
+    await user_mgr.put(UserModel(username="foo", password="bar", disabled=True))
+    await asyncio.sleep(0)
+    with pytest.raises(DisabledUserError):
+        await auth.authenticate(token)
+    await user_mgr.remove("foo")
+    await asyncio.sleep(0)
+    with pytest.raises(UnknownUserError):
+        await auth.authenticate(token)
+    await user_mgr.put(UserModel(username="foo", password="bar"))
+    await asyncio.sleep(0)
+    assert await auth.authenticate(token) is raw_token
+
+    # and so are revoked tokens, regardless of who revoked them.
+    other_token = jwt_mgr.create_access_token("foo")
+    await auth.revoke(raw_token)
+    with pytest.raises(RevokedTokenError):
+        await auth.authenticate(token)
+    other_raw_token = await auth.authenticate(other_token)
+    deny_list = JWTDenyList(gstate.store)
+    await deny_list.load()
+    deny_list.add(other_raw_token)
+    await deny_list.save()
+    await asyncio.sleep(0)
+    with pytest.raises(RevokedTokenError):
+        await auth.authenticate(other_token)
+
+    # the store may notify us from a thread of its own.
+    third_token = jwt_mgr.create_access_token("foo")
+    await auth.authenticate(third_token)
+
+    def _notify() -> None:
+        gstate.store._notify("/auth/user/foo", None)  # type: ignore
+
+    thread = threading.Thread(target=_notify)
+    thread.start()
+    thread.join()
+    await asyncio.sleep(0)
+    with pytest.raises(UnknownUserError):
+        await auth.authenticate(third_token)
+
+
+@pytest.mark.asyncio
+async def test_password_hasher():
+    config = AuthOptionsModel(
+        bcrypt_rounds=4, hash_workers=1, hash_queue_depth=1
+    )
+    hasher = PasswordHasher(config)
+    hashed = await hasher.hash("foo")
+    assert hashed != "foo"
+    assert hashed.startswith("$2b$04$")
+    assert await hasher.verify("foo", hashed)
+    assert not await hasher.verify("bar", hashed)
+    user = UserModel(password=hashed)
+    assert user.verify_password("foo")
+
+    # one running, one waiting, and the third is refused.
+    results = await asyncio.gather(
+        *[hasher.hash("foo") for _ in range(3)], return_exceptions=True
+    )
+    assert isinstance(results[2], BusyError)
+    assert all(isinstance(r, str) for r in results[:2])
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_auth_context_login(gstate: GlobalState):
+    await gstate.store.ensure_connection()
+    config = AuthOptionsModel(bcrypt_rounds=4, login_concurrency=2)
+    auth = AuthContext(gstate.store, config)
+    user_mgr = UserMgr(gstate.store)
+    password = await auth.hasher.hash("bar")
+    await user_mgr.put(UserModel(username="foo", password=password))
+    await user_mgr.put(
+        UserModel(username="baz", password=password, disabled=True)
+    )
+
+    assert await auth.login("foo", "bar")
+    assert not await auth.login("foo", "baz")
+    assert not await auth.login("baz", "bar")
+    assert not await auth.login("nope", "bar")
+
+    results = await asyncio.gather(
+        *[auth.login("foo", "bar") for _ in range(3)], return_exceptions=True
+    )
+    assert results[:2] == [True, True]
+    assert isinstance(results[2], BusyError)
+    await auth.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_user_directory(gstate: GlobalState):
+    await gstate.store.ensure_connection()
+    user_mgr = UserMgr(gstate.store)
+    for i in range(10):
+        await user_mgr.put(
+            UserModel(
+                username=f"user{i:02}",
+                full_name=f"Service Account {i}" if i % 2 else "Human",
+                disabled=i % 3 == 0,
+            )
+        )
+
+    users = UserDirectory(gstate.store)
+    await users.load()
+    assert len(users) == 10
+    assert users.exists("user05")
+    assert not users.exists("foo")
+    user = users.get("user03")
+    assert user is not None and user.disabled
+
+    total, page = users.list(offset=2, limit=3)
+    assert total == 10
+    assert [u.username for u in page] == ["user02", "user03", "user04"]
+    total, page = users.list(disabled=True)
+    assert total == 4
+    assert [u.username for u in page] == [
+        "user00",
+        "user03",
+        "user06",
+        "user09",
+    ]
+    total, page = users.list(disabled=False, query="service", limit=2)
+    assert total == 3
+    assert [u.username for u in page] == ["user01", "user05"]
+
+    # changes through the store are picked up.
+    await user_mgr.put(UserModel(username="aaa"))
+    await user_mgr.put(UserModel(username="user00"))
+    await user_mgr.remove("user01")
+    await asyncio.sleep(0)
+    total, page = users.list(limit=2)
+    assert total == 10
+    assert [u.username for u in page] == ["aaa", "user00"]
+    assert users.list(disabled=True)[0] == 3
+
+    # and so are changes through the directory.
+    await users.remove("aaa")
+    await users.put(UserModel(username="zzz", disabled=True))
+    assert await user_mgr.get("aaa") is None
+    assert await user_mgr.exists("zzz")
+    assert users.list(offset=9)[1][0].username == "zzz"
+    assert users.list(disabled=True)[0] == 4
+
+
+@pytest.mark.asyncio
+async def test_user_directory_many(omap_kv: KV):
+    # more users than the store returns in a single omap read.
+    ioctx: FakeIoctx = omap_kv._ioctx  # type: ignore
+    ioctx.omap = {
+        f"/auth/user/user{i:04}": UserModel(username=f"user{i:04}")
+        .json()
+        .encode("utf-8")
+        for i in range(2500)
+    }
+    assert len(await UserMgr(omap_kv).enumerate()) == 2500
+
+    users = UserDirectory(omap_kv)
+    await users.load()
+    assert len(users) == 2500
+    assert users.exists("user2499")
+    total, page = users.list(offset=2498)
+    assert total == 2500
+    assert [u.username for u in page] == ["user2498", "user2499"]
@@ -11,100 +11,223 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
+import asyncio
+import json
+import ssl
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import httpx
 import pytest
-import requests
-import requests_mock
+from pytest_mock import MockerFixture
 
 from gravel.controllers.containers import (
+    ImageExporter,
     ImageNameError,
+    PullProgressModel,
     RegistrySecurityError,
     UnknownImageError,
     UnknownImageTagError,
     UnknownRegistryError,
+    container_pull,
+    file_digest,
     registry_check,
 )
+from gravel.controllers.registry import RegistryClient
 
 
-@pytest.mark.asyncio
-async def test_registry_check_existing(
-    requests_mock: requests_mock.Mocker,
-) -> None:
-    requests_mock.get("http://secure.bar/v2/", exc=requests.exceptions.SSLError)
-    requests_mock.get("https://secure.bar/v2/")
-    requests_mock.get("http://insecure.bar/v2/")
-    requests_mock.get(
-        "https://insecure.bar/v2/", exc=requests.exceptions.SSLError
-    )
-    requests_mock.get(
-        "https://dne.tld/v2/", exc=requests.exceptions.ConnectionError
-    )
+@pytest.fixture
+async def registry(
+    mocker: MockerFixture,
+) -> AsyncIterator[List[httpx.Request]]:
+    """Fake registries; yields the requests they served."""
+
+    seen: List[httpx.Request] = []
+    manifests = {"/v2/image/name/manifests/tag"}
+    tags = {"/v2/image/name/tags/list": ["tag"]}
 
-    imgres = {
-        "name": "image/name",
-        "tags": ["tag"],
-    }
-    requests_mock.get("https://secure.bar/v2/image/name/tags/list", json=imgres)
-    requests_mock.get(
-        "http://insecure.bar/v2/image/name/tags/list", json=imgres
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        host, scheme = request.url.host, request.url.scheme
+        if (
+            host == "dne.tld"
+            or (host == "secure.bar" and scheme == "http")
+            or (host == "insecure.bar" and scheme == "https")
+        ):
+            try:
+                if host != "dne.tld":
+                    raise ssl.SSLError("wrong protocol")
+                raise OSError("no route to host")
+            except (ssl.SSLError, OSError):
+                raise httpx.ConnectError("nope", request=request)
+
+        path = request.url.path
+        if path == "/token":
+            return httpx.Response(200, json={"token": "foo"})
+        if host == "auth.tld" and (
+            request.headers.get("authorization") != "Bearer foo"
+        ):
+            challenge = 'Bearer realm="https://auth.tld/token",service="reg"'
+            return httpx.Response(401, headers={"WWW-Authenticate": challenge})
+        if path == "/v2/":
+            return httpx.Response(200)
+        if path in manifests and request.method == "HEAD":
+            return httpx.Response(
+                200, headers={"Docker-Content-Digest": "sha256:1234"}
+            )
+        if path in tags:
+            return httpx.Response(200, json={"name": "n", "tags": tags[path]})
+        return httpx.Response(404)
+
+    mocker.patch.object(
+        RegistryClient, "_transport", httpx.MockTransport(handler)
     )
+    yield seen
+    await RegistryClient.close_all()
+
+
+@pytest.mark.asyncio
+async def test_registry_check_existing(registry: List[httpx.Request]) -> None:
 
-    raised = False
     await registry_check("secure.bar", "image/name:tag", True)
-    try:
+    with pytest.raises(RegistrySecurityError):
         await registry_check("secure.bar", "image/name:tag", False)
-    except RegistrySecurityError:
-        raised = True
-    assert raised
 
-    raised = False
     await registry_check("insecure.bar", "image/name:tag", False)
-    try:
+    with pytest.raises(RegistrySecurityError):
         await registry_check("insecure.bar", "image/name:tag", True)
-    except RegistrySecurityError:
-        raised = True
-    assert raised
 
-    raised = False
-    try:
+    with pytest.raises(UnknownRegistryError):
         await registry_check("dne.tld", "image/name:tag", True)
-    except UnknownRegistryError:
-        raised = True
-    assert raised
 
 
 @pytest.mark.asyncio
-async def test_registry_check_image(
-    requests_mock: requests_mock.Mocker,
-) -> None:
-    res = {
-        "name": "image/name",
-        "tags": ["tag"],
-    }
-    requests_mock.get("https://secure.tld/v2/")
-    requests_mock.get("https://secure.tld/v2/image/name/tags/list", json=res)
-    requests_mock.get(
-        "https://secure.tld/v2/image/dne/tags/list", status_code=404
-    )
+async def test_registry_check_image(registry: List[httpx.Request]) -> None:
 
     await registry_check("secure.tld", "image/name:tag", True)
 
-    raised = False
-    try:
+    with pytest.raises(ImageNameError):
         await registry_check("secure.tld", "image/name", True)
-    except ImageNameError:
-        raised = True
-    assert raised
 
-    raised = False
-    try:
+    with pytest.raises(UnknownImageError):
         await registry_check("secure.tld", "image/dne:tag", True)
-    except UnknownImageError:
-        raised = True
-    assert raised
 
-    raised = False
-    try:
+    with pytest.raises(UnknownImageTagError):
         await registry_check("secure.tld", "image/name:dne", True)
-    except UnknownImageTagError:
-        raised = True
-    assert raised
+
+
+@pytest.mark.asyncio
+async def test_registry_check_cached(registry: List[httpx.Request]) -> None:
+
+    await registry_check("auth.tld", "image/name:tag", True)
+    # ping, then manifest: challenged, token, and with the token.
+    paths = [r.url.path for r in registry]
+    assert paths == [
+        "/v2/",
+        "/v2/image/name/manifests/tag",
+        "/token",
+        "/v2/image/name/manifests/tag",
+    ]
+    assert registry[-1].method == "HEAD"
+
+    # all cached.
+    await registry_check("auth.tld", "image/name:tag", True)
+    assert len(registry) == 4
+
+
+@pytest.mark.asyncio
+async def test_image_exporter(tmp_path: Path, mocker: MockerFixture) -> None:
+
+    image_ids = ["abc", "abc", "def"]
+    saves: List[str] = []
+
+    async def run_cmd(args: List[str]) -> Tuple[int, str, str]:
+        if args[:3] == ["podman", "image", "inspect"]:
+            return 0, image_ids.pop(0) + "\n", ""
+        assert args[:2] == ["podman", "save"]
+        path = Path(args[args.index("-o") + 1])
+        path.write_text(args[-1])
+        saves.append(args[-1])
+        return 0, "", ""
+
+    mocker.patch("gravel.controllers.containers.aqr_run_cmd", new=run_cmd)
+
+    exporter = ImageExporter(tmp_path.joinpath("images"))
+    first = await exporter.get("reg.tld/ceph/ceph:latest")
+    assert first.image_id == "abc"
+    assert Path(first.path).read_text() == "reg.tld/ceph/ceph:latest"
+    assert first.digest == file_digest(Path(first.path))
+
+    # same image, no need to export it again.
+    assert await exporter.get("reg.tld/ceph/ceph:latest") == first
+    assert len(saves) == 1
+
+    # the image changed, replace the archive.
+    second = await exporter.get("reg.tld/ceph/ceph:latest")
+    assert second.image_id == "def"
+    assert len(saves) == 2
+    assert not Path(first.path).exists()
+
+    # gone once cleared, along with any leftovers.
+    tmp_path.joinpath("images", "ghi.tmp").write_text("foo")
+    await exporter.clear()
+    assert not tmp_path.joinpath("images").exists()
+    await exporter.clear()
+
+
+@pytest.mark.asyncio
+async def test_container_pull(mocker: MockerFixture) -> None:
+
+    first, second = "a" * 64, "b" * 64
+    layers = {first: 100, second: 50}
+
+    async def resolve(*args: Any) -> Tuple[str, Dict[str, int]]:
+        return "sha256:1234", layers
+
+    mocker.patch("gravel.controllers.containers.resolve_image", new=resolve)
+    repo_digests: List[str] = []
+
+    async def run_cmd(args: List[str]) -> Tuple[int, str, str]:
+        if "{{.Id}}" in args:
+            return 0, "abc\n", ""
+        return 0, json.dumps(repo_digests), ""
+
+    mocker.patch("gravel.controllers.containers.aqr_run_cmd", new=run_cmd)
+
+    # what podman writes when not on a terminal.
+    real_exec = asyncio.create_subprocess_exec
+    script = (
+        "echo 'Trying to pull reg.tld/ceph:latest...' >&2; "
+        "echo 'Getting image source signatures' >&2; "
+        f"echo 'Copying blob sha256:{first}' >&2; "
+        f"echo 'Copying blob sha256:{second}' >&2; "
+        f"echo 'Copying config sha256:{'c' * 64}' >&2; "
+        "echo 'Writing manifest to image destination' >&2; "
+        "echo 'Storing signatures' >&2; "
+        "echo abc"
+    )
+
+    async def fake_exec(*args: str, **kwargs: Any) -> Any:
+        assert args[:2] == ("podman", "pull")
+        return await real_exec("sh", "-c", script, **kwargs)
+
+    mocker.patch("asyncio.create_subprocess_exec", new=fake_exec)
+
+    seen: List[PullProgressModel] = []
+    res = await container_pull("reg.tld", "ceph:latest", True, seen.append)
+    assert res == "abc"
+    assert not seen[-1].skipped and seen[-1].done
+    assert seen[0].bytes_total == 150 and seen[0].bytes_done == 0
+    # a layer is done once podman moves on to the next one.
+    assert seen[1].layers_started == 1 and seen[1].layers_done == 0
+    assert seen[2].layers_started == 2 and seen[2].layers_done == 1
+    assert seen[2].bytes_done == 100
+    assert seen[3].layers_done == 2 and seen[3].bytes_done == 150
+
+    # already present, skip the pull.
+    repo_digests.append("reg.tld/ceph@sha256:1234")
+    seen.clear()
+    res = await container_pull("reg.tld", "ceph:latest", True, seen.append)
+    assert res == "abc"
+    assert len(seen) == 1
+    assert seen[0].skipped and seen[0].bytes_done == 150
@@ -0,0 +1,110 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from gravel.controllers.events import EventBus
+from gravel.controllers.gstate import GlobalState, Ticker
+from gravel.controllers.snapshots import SnapshotModel
+
+
+class FooModel(BaseModel):
+    foo: int = 0
+
+
+@pytest.mark.asyncio
+async def test_event_bus() -> None:
+
+    bus = EventBus()
+    bus.publish("foo", FooModel(foo=1))
+    assert bus.latest("foo") == '{"foo": 1}'
+
+    # current state is available upon subscribing.
+    sub = bus.subscribe(["foo", "bar"])
+    assert await sub.get(timeout=0.1) == [("foo", '{"foo": 1}')]
+    assert await sub.get(timeout=0.1) == []
+
+    # unchanged state is not published.
+    bus.publish("foo", FooModel(foo=1))
+    assert await sub.get(timeout=0.1) == []
+
+    # latest wins.
+    bus.publish("foo", FooModel(foo=2))
+    bus.publish("foo", FooModel(foo=3))
+    bus.publish("bar", {"bar": [1, 2]})
+    bus.publish("baz", {"baz": True})
+    updates = dict(await sub.get(timeout=0.1))
+    assert len(updates) == 2
+    assert json.loads(updates["foo"]) == {"foo": 3}
+    assert json.loads(updates["bar"]) == {"bar": [1, 2]}
+
+    # those holding the previous state get the delta.
+    bus.publish("foo", FooModel(foo=4), {"delta": 4})
+    assert await sub.get(timeout=0.1) == [("foo", '{"delta": 4}')]
+    # those who haven't got it yet get the full state.
+    late = bus.subscribe(["foo"])
+    bus.publish("foo", FooModel(foo=5), {"delta": 5})
+    bus.publish("foo", FooModel(foo=6), {"delta": 6})
+    assert await sub.get(timeout=0.1) == [("foo", '{"foo": 6}')]
+    assert await late.get(timeout=0.1) == [("foo", '{"foo": 6}')]
+    late.close()
+
+    sub.close()
+    sub.close()
+    bus.publish("foo", FooModel(foo=4))
+    assert await sub.get(timeout=0.1) == []
+    assert sorted(bus.topics) == ["bar", "baz", "foo"]
+
+
+@pytest.mark.asyncio
+async def test_ticker_notify(gstate: GlobalState) -> None:
+    class TestTicker(Ticker):
+        def __init__(self):
+            super().__init__(0.0)
+            self.value = 0
+
+        async def _do_tick(self) -> None:
+            self.value += 1
+            self._notify("test", FooModel(foo=self.value))
+
+        async def _should_tick(self) -> bool:
+            return True
+
+    sub = gstate.events.subscribe(["test"])
+    ticker = TestTicker()
+    await ticker.tick()
+    assert await sub.get(timeout=0.1) == []
+
+    gstate.add_ticker("test", ticker)
+    await ticker.tick()
+    [(topic, payload)] = await sub.get(timeout=0.1)
+    snap = SnapshotModel.parse_raw(payload)
+    assert topic == "test"
+    assert snap.version == 2 and snap.full and snap.data == {"foo": 2}
+
+    # from then on, only what changed.
+    await ticker.tick()
+    [(_, payload)] = await sub.get(timeout=0.1)
+    delta = SnapshotModel.parse_raw(payload)
+    assert delta.epoch == snap.epoch
+    assert delta.version == 3 and not delta.full
+    assert delta.patch[0].path == "/foo" and delta.patch[0].value == 3
+
+    snap = ticker.snapshot("test", since=1, epoch=snap.epoch)
+    assert snap.version == 3 and not snap.full
+    assert snap.patch[-1].path == "/foo" and snap.patch[-1].value == 3
+    gstate.rm_ticker("test")
+    sub.close()
@@ -0,0 +1,48 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# pyright: reportUnknownMemberType=false, reportPrivateUsage=false
+
+from typing import Dict
+
+import pytest
+
+from gravel.controllers.kv import KV, OMAP_PAGE_SIZE
+from gravel.tests.conftest import FakeDB, FakeIoctx
+
+
+@pytest.mark.asyncio
+async def test_get_prefix_pages(omap_kv: KV):
+    omap: Dict[str, bytes] = {
+        f"/foo/{i:05}": f"value{i}".encode("utf-8") for i in range(2500)
+    }
+    omap["/bar/baz"] = b"nope"
+    ioctx: FakeIoctx = omap_kv._ioctx  # type: ignore
+    ioctx.omap = omap
+
+    values = await omap_kv.get_prefix("/foo/")
+    assert len(values) == 2500
+    assert values[0] == "value0"
+    assert values[-1] == "value2499"
+    assert ioctx.pages == [
+        ("", OMAP_PAGE_SIZE),
+        ("/foo/00999", OMAP_PAGE_SIZE),
+        ("/foo/01999", OMAP_PAGE_SIZE),
+    ]
+
+    # an exact multiple of the page size needs one more, empty, page.
+    ioctx.omap = {k: v for k, v in omap.items() if k < "/foo/02000"}
+    ioctx.pages = []
+    omap_kv._db = FakeDB()  # type: ignore
+    assert len(await omap_kv.get_prefix("/foo/")) == 2000
+    assert len(ioctx.pages) == 3
@@ -0,0 +1,108 @@
+# project aquarium's backend
+# Copyright (C) 2021 SUSE, LLC.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import copy
+from typing import Any, Dict, List
+
+from pydantic import BaseModel
+
+from gravel.controllers.snapshots import PatchOpModel, Snapshots, json_diff
+
+
+def _apply(doc: Any, patch: List[PatchOpModel]) -> Any:
+    doc = copy.deepcopy(doc)
+    for op in patch:
+        if op.path == "":
+            doc = op.value
+            continue
+        keys = [
+            k.replace("~1", "/").replace("~0", "~")
+            for k in op.path.split("/")[1:]
+        ]
+        parent = doc
+        for key in keys[:-1]:
+            parent = parent[int(key) if isinstance(parent, list) else key]
+        last = int(keys[-1]) if isinstance(parent, list) else keys[-1]
+        if op.op == "remove":
+            del parent[last]
+        else:
+            parent[last] = op.value
+    return doc
+
+
+def test_json_diff() -> None:
+
+    old: Dict[str, Any] = {
+        "a": 1,
+        "b": {"c": [1, 2, 3], "d": "foo"},
+        "e/f": True,
+        "g": [{"h": 1}, {"h": 2}],
+    }
+    new: Dict[str, Any] = {
+        "a": 1,
+        "b": {"c": [1, 2], "d": "bar", "x": None},
+        "g": [{"h": 1}, {"h": 3}],
+    }
+    assert json_diff(old, old) == []
+    patch = json_diff(old, new)
+    assert [(op.op, op.path) for op in patch] == [
+        ("remove", "/e~1f"),
+        ("replace", "/b/c"),
+        ("replace", "/b/d"),
+        ("add", "/b/x"),
+        ("replace", "/g/1/h"),
+    ]
+    assert _apply(old, patch) == new
+    assert json_diff(1, 1.0) == [PatchOpModel(op="replace", path="", value=1.0)]
+
+
+class FooModel(BaseModel):
+    foo: Dict[str, int] = {}
+
+
+def test_snapshots() -> None:
+
+    snaps = Snapshots(history=2)
+    epoch = snaps.epoch
+    snap = snaps.get()
+    assert snap.version == 0 and snap.full and snap.data is None
+    assert snap.epoch == epoch
+
+    assert snaps.update(FooModel(foo={"a": 1}))
+    assert not snaps.update(FooModel(foo={"a": 1}))
+    assert snaps.version == 1
+    snap = snaps.get()
+    assert snap.full and snap.data == {"foo": {"a": 1}}
+    assert not snaps.get(1, epoch).full and snaps.get(1, epoch).patch == []
+
+    v1 = snaps.get().data
+    assert snaps.update(FooModel(foo={"a": 2}))
+    assert snaps.update(FooModel(foo={"a": 2, "b": 3}))
+    assert snaps.version == 3
+    snap = snaps.get(1, epoch)
+    assert not snap.full
+    assert _apply(v1, snap.patch) == {"foo": {"a": 2, "b": 3}}
+
+    # too far behind, or unknown versions, get the full state.
+    assert snaps.update(FooModel(foo={}))
+    assert snaps.get(1, epoch).full
+    assert not snaps.get(2, epoch).full
+    assert snaps.get(5, epoch).full
+    assert snaps.get(0, epoch).full
+    assert snaps.get(4, epoch).patch == []
+
+    # versions from another epoch, e.g. from before a restart, or none at all,
+    # get the full state.
+    assert Snapshots().epoch != epoch
+    assert snaps.get(4, "foo").full
+    assert snaps.get(4).full